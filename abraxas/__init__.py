@@ -1,3 +1,9 @@
 from abraxas.logger import Logging
-from abraxas.writer import TTY_Writer, ClipboardWriter, AutotypeWriter, StdoutWriter
+from abraxas.writer import (
+    TTY_Writer, ClipboardWriter, AutotypeWriter, StdoutWriter, JsonWriter)
 from abraxas.generate import PasswordGenerator, PasswordError
+try:
+    from abraxas.asyncgen import AsyncPasswordGenerator
+except SyntaxError:
+    # python2
+    pass
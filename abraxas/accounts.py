@@ -22,17 +22,29 @@
 from __future__ import print_function, division
 from abraxas.prefs import (
     DEFAULT_SETTINGS_DIR, DEFAULT_ARCHIVE_FILENAME, DEFAULT_LOG_FILENAME,
+    ACCOUNTS_MANIFEST_FILENAME, TITLE_CACHE_FILENAME, TITLE_CACHE_SIZE,
     STRING_FIELDS, INTEGER_FIELDS, LIST_FIELDS, LIST_OR_STRING_FIELDS,
     ENUM_FIELDS, SEARCH_FIELDS, PREFER_HTTPS, ACCOUNTS_FILE_INITIAL_CONTENTS,
-    XDOTOOL, DEFAULT_AUTOTYPE, TITLE_PATTERNS, URL_PATTERN
+    DEFAULT_AUTOTYPE, TITLE_PATTERNS, URL_PATTERN
 )
 from fileutils import (
     exists, getExt as get_extension, makePath as make_path,
-    getHead as get_head, Execute, ExecuteError
+    getHead as get_head
 )
+from abraxas.manifest import _Manifest
+from abraxas.titles import _TitleCache, get_title_provider
+from abraxas.timing import PhaseTimer
+try:
+    from collections import ChainMap
+except ImportError:
+    # python2
+    from ConfigParser import _Chainmap
+    class ChainMap(_Chainmap):
+        maps = property(lambda self: self._maps)
 import re
 import sys
 import fnmatch
+import threading
 import traceback
 
 class _Accounts:
@@ -41,42 +53,121 @@ class _Accounts:
 
     Responsible for reading and managing the data from the user's accounts 
     file.
+
+    If given index_key, the accounts manifest is used to avoid reading the 
+    additional accounts files until they are needed.  Looking up an account 
+    then only reads the files that hold the account and its templates, and 
+    account discovery only reads those that hold accounts that might match 
+    the window title.  Anything that needs all of the accounts, such as 
+    all_accounts(), reads the rest.  The manifest is rebuilt whenever the 
+    accounts files change.
+
+    If given compiled, the accounts are taken from the vault rather than 
+    being read from the accounts files.
+
+    The account that account discovery selects for a window title, either 
+    because it was the only match or because the user chose it, is 
+    remembered in the title cache and is used directly when the title is 
+    seen again, until the accounts files change.
     """
 
-    def __init__(self, path, logger, gpg, template=None, stateless=False):
+    COMPILED_SETTINGS = ['log_file', 'archive_file', 'gpg_id']
+
+    def __init__(
+        self, path, logger, gpg, template=None, stateless=False, timings=None,
+        index_key=None, compiled=None, title_provider=None
+    ):
         self.path = path
         self.logger = logger
         self.gpg = gpg
         self.stateless = stateless
+        self.timings = timings if timings else PhaseTimer()
         self.data = None
-
+        self.sources = []
+            # paths to the accounts files in the order they are applied
+        self.loaded = {}
+            # maps the path to each accounts file read to its accounts
+        self.checked = set()
+            # the accounts files whose dependencies have been read
+        self.manifest = None
+            # only set while some of the accounts files have not been read
+        self.aliases = None
+        self.compiled = {}
+            # maps the ID of each account that has been validated and
+            # interned to its data
+        self.reported = set()
+            # the alias warnings that have been displayed
+        self.pool = {}
+            # the distinct strings used by the accounts
+        self.discovery = None
+            # index of the accounts that might match a window title
+        self.lock = threading.RLock()
+            # held while reading accounts files after initialization
+        self.titles = None
+            # remembers the account selected for each window title
+        self.title_provider = title_provider
+            # finds the title of the active window, created when needed
+
+        manifest = None
         if stateless:
             # Use initial accounts so that user has access to basic templates
             imported_data = {}
             exec(ACCOUNTS_FILE_INITIAL_CONTENTS, imported_data)
             self.accounts = imported_data['accounts']
+        elif compiled:
+            # The accounts have already been read, validated and compiled
+            self.path = compiled['path']
+            self.sources = compiled['sources']
+            self.data = compiled['settings']
+            self.accounts = compiled['accounts']
+            self.aliases = compiled['aliases']
+            self.discovery = compiled['discovery']
         else:
             # Load the user's accounts file
-            self.accounts = self._read_accounts_file()
+            manifest = self._read_accounts_file(index_key)
 
         if template:
+            self._require_account(template)
             self.template = self.accounts.get(template, {})
             if not self.template:
                 logger.error("%s: template not found." % template)
         else:
             self.template = {}
 
-        self._validate_accounts()
-        self._create_aliases()
-
-    def _validate_accounts(self):
+        if not compiled:
+            self._compile()
+        if manifest:
+            self._build_manifest(manifest)
+        if self.path and not stateless and TITLE_CACHE_SIZE:
+            self.titles = _TitleCache(
+                make_path(get_head(self.path), TITLE_CACHE_FILENAME),
+                index_key, self.sources, logger, TITLE_CACHE_SIZE)
+
+    def _compile(self):
+        # Only the accounts that are new since the last time, those from the
+        # accounts files that have just been read, are validated and interned.
+        # The aliases are recreated as the order of the accounts decides who
+        # gets a disputed alias.
+        accounts = dict(
+            (ID, data) for ID, data in self.accounts.items()
+            if self.compiled.get(ID) is not data
+        )
+        with self.timings.phase('validate'):
+            self._validate_accounts(accounts)
+        with self.timings.phase('aliases'):
+            self._create_aliases()
+        with self.timings.phase('intern'):
+            self._intern_values(accounts)
+        self.compiled.update(accounts)
+
+    def _validate_accounts(self, accounts):
         """Validate and repair each account"""
         logger = self.logger
 
-        for ID in self.all_accounts(skip_templates=False):
+        for ID in accounts:
             if type(ID) != str:
                 logger.error('%s: account ID must be a string.' % ID)
-            data = self.accounts[ID]
+            data = accounts[ID]
 
             # check the types of the data in the various fields
             for each in STRING_FIELDS:
@@ -130,43 +221,73 @@ class _Accounts:
 
         def addToAliases(ID, name):
             if name in self.aliases:
-                self.logger.display(
-                    ' '.join([
-                        "Alias %s" % (name),
-                        "from account %s" % (
-                            ID if name != ID else self.aliases[name]),
-                        "duplicates an account name or previous entry,",
-                        "ignoring."]))
+                msg = ' '.join([
+                    "Alias %s" % (name),
+                    "from account %s" % (
+                        ID if name != ID else self.aliases[name]),
+                    "duplicates an account name or previous entry,",
+                    "ignoring."])
+                # the aliases are recreated each time more accounts are read,
+                # so report each problem only once
+                if msg not in self.reported:
+                    self.reported.add(msg)
+                    self.logger.display(msg)
             else:
                 self.aliases[name] = ID
 
         self.aliases = {}
-        for ID in self.all_accounts(skip_templates=False):
+        for ID in self.accounts:
             # add ID to the aliases and then add the actual aliases
             data = self.accounts[ID]
             addToAliases(ID, ID)
             for alias in data.get('aliases', []):
                 addToAliases(ID, alias)
 
+    def _intern_values(self, accounts):
+        """Share a single copy of each distinct string amongst the accounts"""
+        # Expressions such as ALPHANUMERIC + PUNCTUATION create a new string
+        # each time they are evaluated, so without this every account that
+        # uses them would hold its own copy.
+        pool = self.pool
+        for data in accounts.values():
+            for key, value in data.items():
+                if type(value) == str:
+                    data[key] = pool.setdefault(value, value)
+                elif type(value) == list:
+                    for i, each in enumerate(value):
+                        if type(each) == str:
+                            value[i] = pool.setdefault(each, each)
+
     def all_accounts(self, skip_templates=True):
         # Get a dictionary of all the fields for each account
+        self._load_all()
         for ID in self.accounts:
             if skip_templates and ID[0] == '=':
                 pass
             else:
                 yield ID
 
+    def has_account(self, account_id):
+        # Is there an account with this ID or alias
+        self._require_account(account_id)
+        return account_id in self.aliases
+
     def get_fields(self, field):
         # Get a particular field from each account
+        self._load_all()
         for ID, data in self.accounts.items():
             if field in data and data[field]:
                 yield (ID, data[field])
 
-    def _read_accounts_file(self):
+    def _read_accounts_file(self, index_key):
+        # Reads the main accounts file, and then either opens the manifest or, 
+        # if it is not available or out of date, reads the additional accounts 
+        # files.  Returns the manifest if it must be rebuilt.
         if not self.path:
             # There is no accounts file
             self.data = {}
-            return self.data
+            self.accounts = {}
+            return None
         if not exists(self.path):
             # If file does not exist, look for encrypted versions
             for ext in ['gpg', 'asc']:
@@ -181,18 +302,21 @@ class _Accounts:
             if get_extension(self.path) in ['gpg', 'asc']:
                 # Accounts file is GPG encrypted, decrypt it before loading
                 with open(self.path, 'rb') as f:
-                    decrypted = self.gpg.decrypt_file(f)
+                    with self.timings.phase('decrypt'):
+                        decrypted = self.gpg.decrypt_file(f)
                     if not decrypted.ok:
                         logger.error("%s\n%s" % (
                             "%s: unable to decrypt." % (self.path),
                             decrypted.stderr))
-                    code = compile(decrypted.data, self.path, 'exec')
-                    exec(code, accounts_data)
+                    contents = decrypted.data
             else:
                 # Accounts file is not encrypted
                 with open(self.path) as f:
-                    code = compile(f.read(), self.path, 'exec')
-                    exec(code, accounts_data)
+                    contents = f.read()
+            with self.timings.phase('compile'):
+                code = compile(contents, self.path, 'exec')
+            with self.timings.phase('exec'):
+                exec(code, accounts_data)
             if 'accounts' not in accounts_data:
                 logger.error(
                     "%s: defective accounts file, 'accounts' not found." %
@@ -200,58 +324,256 @@ class _Accounts:
                 )
             for account in accounts_data['accounts'].values():
                 account['_source_file_'] = self.path
-
-            # Load additional accounts files
-            additional_accounts = accounts_data.get('additional_accounts', [])
-            if type(additional_accounts) == str:
-                additional_accounts = [additional_accounts]
-            for each in additional_accounts:
-                more_accounts = {}
-                path = make_path(get_head(self.path), each)
-                try:
-                    if get_extension(path) in ['gpg', 'asc']:
-                        # Accounts file is GPG encrypted, decrypt it
-                            with open(path, 'rb') as f:
-                                decrypted = self.gpg.decrypt_file(f)
-                                if not decrypted.ok:
-                                    logger.error("%s\n%s" % (
-                                        "%s: unable to decrypt." % (path),
-                                        decrypted.stderr))
-                                    continue
-                                code = compile(decrypted.data, path, 'exec')
-                                exec(code, more_accounts)
-                    else:
-                        # Accounts file is not encrypted
-                        with open(path) as f:
-                            code = compile(f.read(), path, 'exec')
-                            exec(code, more_accounts)
-                except IOError as err:
-                    logger.display('%s: %s.  Ignored' % (
-                        err.filename, err.strerror
-                    ))
-                    continue
-                existing_names = set(accounts_data['accounts'].keys())
-                new_accounts = more_accounts.get('accounts', {})
-                new_names = set(new_accounts.keys())
-                names_in_common = sorted(
-                    existing_names.intersection(new_names))
-                if len(names_in_common) > 2:
-                    logger.display(
-                        "%s: overrides existing accounts:\n    %s" % (
-                            path, ',\n    '.join(sorted(names_in_common))))
-                elif names_in_common:
-                    logger.display("%s: overrides existing account: %s" % (
-                        path, names_in_common[0]))
-                for account in new_accounts.values():
-                    account['_source_file_'] = path
-                accounts_data['accounts'].update(new_accounts)
         except IOError as err:
             logger.error('%s: %s.' % (err.filename, err.strerror))
         except SyntaxError as err:
             traceback.print_exc(0)
             sys.exit()
         self.data = accounts_data
-        return accounts_data['accounts']
+        self.loaded[self.path] = self.accounts = accounts_data['accounts']
+
+        # Find the additional accounts files
+        additional_accounts = accounts_data.get('additional_accounts', [])
+        if type(additional_accounts) == str:
+            additional_accounts = [additional_accounts]
+        self.sources = [self.path] + [
+            make_path(get_head(self.path), each)
+            for each in additional_accounts
+        ]
+
+        # Open the manifest and read only those files that are needed
+        manifest = None
+        if index_key:
+            manifest = _Manifest(
+                make_path(get_head(self.path), ACCOUNTS_MANIFEST_FILENAME),
+                index_key, self.sources, logger)
+            with self.timings.phase('manifest'):
+                current = manifest.load()
+            if current:
+                self.manifest = manifest
+                self._require([self.path])
+                return None
+
+        # Load additional accounts files
+        self._load(self.sources[1:])
+        return manifest
+
+    def _read_additional_accounts_file(self, path):
+        # Returns the accounts from an additional accounts file.
+        logger = self.logger
+        more_accounts = {}
+        try:
+            if get_extension(path) in ['gpg', 'asc']:
+                # Accounts file is GPG encrypted, decrypt it
+                with open(path, 'rb') as f:
+                    with self.timings.phase('decrypt'):
+                        decrypted = self.gpg.decrypt_file(f)
+                    if not decrypted.ok:
+                        logger.error("%s\n%s" % (
+                            "%s: unable to decrypt." % (path),
+                            decrypted.stderr))
+                        return {}
+                    contents = decrypted.data
+            else:
+                # Accounts file is not encrypted
+                with open(path) as f:
+                    contents = f.read()
+            with self.timings.phase('compile'):
+                code = compile(contents, path, 'exec')
+            with self.timings.phase('exec'):
+                exec(code, more_accounts)
+        except IOError as err:
+            logger.display('%s: %s.  Ignored' % (
+                err.filename, err.strerror
+            ))
+            return {}
+        except SyntaxError as err:
+            traceback.print_exc(0)
+            sys.exit()
+        new_accounts = more_accounts.get('accounts', {})
+        for account in new_accounts.values():
+            account['_source_file_'] = path
+        return new_accounts
+
+    def _load(self, paths):
+        # Reads the given additional accounts files and merges the accounts 
+        # from all the files read so far, in order, so that later files 
+        # override earlier ones.
+        paths = [path for path in self.sources[1:] if path in paths]
+        if hasattr(self.gpg, 'prefetch'):
+            # allow the encrypted files to be decrypted concurrently
+            self.gpg.prefetch([
+                path for path in paths
+                if get_extension(path) in ['gpg', 'asc']
+            ])
+        for path in paths:
+            self.loaded[path] = self._read_additional_accounts_file(path)
+
+        accounts = dict(self.loaded[self.path])
+        for path in self.sources[1:]:
+            if path not in self.loaded:
+                continue
+            new_accounts = self.loaded[path]
+            if not self.manifest:
+                # all the files are read in order, so report overrides
+                names_in_common = sorted(
+                    set(accounts.keys()).intersection(new_accounts.keys()))
+                if len(names_in_common) > 2:
+                    self.logger.display(
+                        "%s: overrides existing accounts:\n    %s" % (
+                            path, ',\n    '.join(sorted(names_in_common))))
+                elif names_in_common:
+                    self.logger.display(
+                        "%s: overrides existing account: %s" % (
+                            path, names_in_common[0]))
+            accounts.update(new_accounts)
+        self.accounts = accounts
+
+    def _require(self, paths):
+        # Reads the given accounts files if they have not yet been read, along 
+        # with any others needed so that every account read is the version 
+        # that takes precedence and its templates are available.  Returns true 
+        # if any files were read.
+        if not self.manifest:
+            return False
+        pending = set(paths)
+        found = False
+        while True:
+            pending -= set(self.loaded)
+            if pending:
+                self._load(pending)
+                found = True
+            unchecked = [
+                path for path in self.loaded if path not in self.checked
+            ]
+            if not unchecked:
+                return found
+            pending = set()
+            for path in unchecked:
+                self.checked.add(path)
+                for ID in self.loaded[path]:
+                    pending.update(self.manifest.lookup('id', ID) or [])
+
+    def _require_account(self, name):
+        # Reads the accounts files needed to use an account.
+        with self.lock:
+            if self.manifest and name:
+                found = self._require(
+                    self.manifest.lookup('account', name) or [])
+                if found and self.aliases is not None:
+                    self._compile()
+
+    def _require_discovery(self, title):
+        # Reads the accounts files that hold accounts that might match title.
+        with self.lock:
+            if not self.manifest:
+                return
+            paths = self.manifest.get_group('discovery')
+            for pattern_name, pattern in TITLE_PATTERNS:
+                match = pattern.match(title)
+                if match and match.groupdict().get('host'):
+                    paths += self.manifest.lookup(
+                        'host', match.groupdict()['host']) or []
+            if self._require(paths):
+                self._compile()
+
+    def _load_all(self):
+        # Reads any accounts files that have not yet been read.
+        with self.lock:
+            if self.manifest:
+                self._require(self.sources)
+                self.manifest = None
+                self._compile()
+
+    def _build_manifest(self, manifest):
+        # Records the files needed for each account ID, each account name 
+        # (IDs and aliases), and for discovery.  An account needs every file 
+        # that defines it, so that it takes the same place amongst the 
+        # accounts (which decides who gets a disputed alias) as when all the 
+        # files are read, along with the files that hold its templates.  The 
+        # templates in turn need their own files, which _require() reads as 
+        # it reads the templates.
+        definers = {}
+        for path in self.sources:
+            for ID in self.loaded.get(path, {}):
+                definers.setdefault(ID, set()).add(path)
+
+        def get_sources(ID):
+            # the files that hold the account and its nearest template
+            sources = set(definers[ID])
+            template = self.accounts[ID].get('template')
+            if template in self.aliases:
+                sources.update(definers[self.aliases[template]])
+            return sources
+
+        with self.timings.phase('manifest'):
+            manifest.clear()
+            for ID in self.accounts:
+                manifest.add('id', ID, get_sources(ID))
+            for name, ID in self.aliases.items():
+                manifest.add('account', name, get_sources(ID))
+            for ID, data in self.accounts.items():
+                hosts = self._get_discovery_hosts(data)
+                if hosts is None:
+                    manifest.add_to_group('discovery', get_sources(ID))
+                else:
+                    for host in hosts:
+                        manifest.add('host', host, get_sources(ID))
+            manifest.save()
+
+    @staticmethod
+    def _get_discovery_hosts(data):
+        # Returns the hosts that a window title must contain for account 
+        # discovery to select the account, or None if it must be tried 
+        # against every title (it has window patterns or host globs).
+        urls = data.get('url', [])
+        if type(urls) == str:
+            urls = [urls]
+        hosts = []
+        for url in urls:
+            match = URL_PATTERN.match(url)
+            if match and match.groupdict()['host']:
+                hosts.append(match.groupdict()['host'])
+        if data.get('window') or any(
+            set(host) & set('*?[') for host in hosts
+        ):
+            return None
+        return hosts
+
+    def _get_discovery_candidates(self, title):
+        # Returns the accounts that account discovery must try against title.
+        if self.discovery is None:
+            return self.accounts.items()
+        IDs = set(self.discovery['always'])
+        for pattern_name, pattern in TITLE_PATTERNS:
+            match = pattern.match(title)
+            if match and match.groupdict().get('host'):
+                IDs.update(
+                    self.discovery['hosts'].get(match.groupdict()['host'], []))
+        return [(ID, data) for ID, data in self.accounts.items() if ID in IDs]
+
+    def get_compiled(self):
+        """Return the merged and compiled accounts, for the vault."""
+        self._load_all()
+        discovery = {'always': [], 'hosts': {}}
+        for ID, data in self.accounts.items():
+            hosts = self._get_discovery_hosts(data)
+            if hosts is None:
+                discovery['always'].append(ID)
+            else:
+                for host in hosts:
+                    discovery['hosts'].setdefault(host, []).append(ID)
+        return {
+            'path': self.path,
+            'sources': self.sources,
+            'settings': dict(
+                (key, self.data[key])
+                for key in self.COMPILED_SETTINGS if key in self.data
+            ),
+            'accounts': self.accounts,
+            'aliases': self.aliases,
+            'discovery': discovery,
+        }
 
     def get_log_file(self):
         return self.data.get(
@@ -276,28 +598,43 @@ class _Accounts:
     def all_templates(self):
         # Iterate through  templates
         # Templates are accounts whose ID starts with =.
+        self._load_all()
         for key in self.accounts:
             if key[0] == '=':
                 yield key
 
-    class Account:
+    class Account(object):
         """
         Abraxas Account
 
         Responsible for holding all of the information for a particular 
         account.
+
+        Accounts are immutable, so a single account may be shared freely 
+        between threads.
         """
 
+        __slots__ = ('ID', 'data')
+
         def __init__(self, ID, data):
-            self.ID = ID
-            self.data = data
+            initialize = super(_Accounts.Account, self).__setattr__
+            initialize('ID', ID)
+            initialize('data', data)
+
+        def __setattr__(self, name, value):
+            raise AttributeError('account is immutable.')
 
         def get_id(self):
             """Return account's ID."""
             return self.ID
 
         def get_data(self):
-            """Return account's data."""
+            """
+            Return account's data.
+
+            This is a read-only view that layers the account over its 
+            templates, so do not modify it.
+            """
             return self.data
 
         def get_field(self, field, default=None):
@@ -348,23 +685,20 @@ class _Accounts:
         def get_suffix(self):
             return self.data.get('suffix', '')
 
-    def get_account(self, account_id, level=0):
+    def get_account(self, account_id, level=0, title=None):
+        # If account_id is not given the account is found from the title of
+        # the active window, which is requested from the title provider unless
+        # given.
         if level > 20:
             self.logger.error(
                 "%s: too many levels of templates, loop suspected." % (
                     account_id))
 
-        def find_account_id():
+        def find_account_id(title):
             # Uses window title to perform account discovery
             logger = self.logger
             # Account ID was not given by the user.
             # Try to determine it from title of active window.
-            # First get the title from the active window.
-            try:
-                xdotool = Execute([XDOTOOL, 'getactivewindow', 'getwindowname'])
-            except ExecuteError as err:
-                logger.error(str(err))
-            title = xdotool.stdout.strip()
             logger.log('Account Discovery ...')
             logger.log('Focused window title: %s' % title)
 
@@ -392,7 +726,7 @@ class _Accounts:
                         ])
                     )
                     required_protocol = None
-                    for ID, account in self.accounts.items():
+                    for ID, account in self._get_discovery_candidates(title):
                         logger.debug('Trying account: %s' % ID)
                         windows = account.get('window', [])
                         if type(windows) == str:
@@ -534,7 +868,19 @@ class _Accounts:
         # Validate account_id
         if not account_id and not self.stateless:
             # User did not specify account ID on the command line.
-            account_id = find_account_id()
+            with self.timings.phase('find_account_id'):
+                if title is None:
+                    if not self.title_provider:
+                        self.title_provider = get_title_provider(self.logger)
+                    title = self.title_provider.get_title()
+                self._require_discovery(title)
+                account_id = self._find_cached_account_id(title)
+                if not account_id:
+                    account_id = find_account_id(title)
+                    if self.titles:
+                        with self.lock:
+                            self.titles.add(title, account_id)
+        self._require_account(account_id)
         try:
             account_id = self.aliases[account_id]
             account = self.accounts[account_id]
@@ -544,18 +890,32 @@ class _Accounts:
                 self.logger.display(
                     "Warning: account '%s' not found." % account_id)
 
-        # Get information from template
+        # Layer the account over its template so that information from the 
+        # account overrides that from the template
         template = account.get('template', None)
         if template:
-            data = self.get_account(template, level=level+1).get_data()
+            layers = self.get_account(template, level=level+1).get_data().maps
+            data = ChainMap(account, *layers)
         else:
-            data = {}
-
-        # Override template information with that from the account
-        data.update(account)
+            data = ChainMap(account)
 
         return _Accounts.Account(account_id, data)
 
+    def _find_cached_account_id(self, title):
+        # Returns the account remembered for title, or None.
+        if not self.titles:
+            return None
+        with self.lock:
+            candidates = [
+                ID for ID, data in self._get_discovery_candidates(title)]
+            account_id = self.titles.lookup(title, candidates)
+        if account_id:
+            self.logger.log('Focused window title: %s' % title)
+            self.logger.log(
+                "'%s' account selected because it was selected before "
+                "for this window title." % account_id)
+        return account_id
+
     @staticmethod
     def _inID(pattern, ID):
         return bool(pattern.search(ID))
@@ -611,4 +971,5 @@ class _Accounts:
                     self._inSearchField(pattern, ID, acct)):
                 yield ID, self.accounts[ID].get('aliases', [])
 
+
 # vim: set sw=4 sts=4 et:
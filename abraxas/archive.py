@@ -0,0 +1,331 @@
+# Abraxas Archive
+#
+# Responsible for the archive of the secrets, which is kept as a set of
+# encrypted shards, and for the keyed digests of the archived secrets, which
+# allow the current secrets to be checked against the archive without
+# decrypting it.
+#
+# Copyright (C) 2013-14 Kenneth S. Kundert and Kale Kundert
+
+# License (fold)
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+
+# Imports (fold)
+from __future__ import print_function, division
+from fileutils import makePath as make_path
+import hashlib
+import hmac
+import json
+import os
+
+
+def get_digests_path(archive_path):
+    """Return the path to the digests that accompany an archive."""
+    return os.path.splitext(archive_path)[0] + '.digests'
+
+
+def get_shards_path(archive_path):
+    """Return the path to the directory that holds the archive shards."""
+    return os.path.splitext(archive_path)[0] + '.shards'
+
+
+class _ArchiveDigests:
+    """
+    Abraxas Archive Digests
+
+    Holds a keyed HMAC of the password and of each question and answer of
+    every archived account, along with a keyed HMAC of each account ID.  The
+    key is derived from the master passwords, so the digests reveal nothing
+    to anyone who does not hold them, and a check value computed with the key
+    tells whether the digests were made with the current master passwords.
+
+    The digests also assign each account to one of the shards of the archive,
+    by the keyed HMAC of its ID, and hold a digest of the contents of each
+    shard, so only the shards whose accounts have changed need be rewritten.
+
+    The digests are written along with the encrypted archive, which remains
+    the complete record of the secrets.
+    """
+
+    VERSION = 2
+    NUM_SHARDS = 16
+
+    def __init__(self, path, key, logger):
+        """
+        Arguments:
+        path (string)
+            Path to the digests file.
+        key (bytes)
+            Key used for the HMACs, None if there is no key (the digests are
+            then neither read nor written).
+        logger (logger object)
+            Used to log whether the digests are used.
+        """
+        self.path = path
+        self.key = key
+        self.logger = logger
+        self.accounts = {}
+        self.shards = {}
+            # maps the name of each shard to the digest of its contents
+
+    def _digest(self, *fields):
+        # Without a key the digests are never saved, but are still used to 
+        # assign the accounts to shards.
+        message = '\0'.join(fields)
+        return hmac.new(
+            self.key or b'', message.encode('utf-8'), hashlib.sha256
+        ).hexdigest()
+
+    def _entry(self, account_id, secrets):
+        return {
+            'password': self._digest(
+                'password', account_id, secrets['password']),
+            'questions': [
+                self._digest('question', account_id, question, answer)
+                for question, answer in secrets['questions']
+            ],
+        }
+
+    def load(self):
+        """
+        Read the digests.
+
+        Returns true if the digests exist and were made with the current key.
+        """
+        if not self.key:
+            return False
+        try:
+            with open(self.path) as f:
+                digests = json.load(f)
+            if digests['version'] != self.VERSION:
+                return False
+            if not hmac.compare_digest(
+                str(digests['check']), self._digest('check')
+            ):
+                self.logger.log(
+                    '%s: made with other master passwords, ignored.' % (
+                        self.path))
+                return False
+            self.accounts = digests['accounts']
+            self.shards = digests['shards']
+        except (IOError, ValueError, KeyError, TypeError):
+            return False
+        self.logger.log('Using %s.' % self.path)
+        return True
+
+    def save(self):
+        """
+        Write the digests.
+
+        The digests are only an optimization, so failures are logged and
+        otherwise ignored.
+        """
+        if not self.key:
+            self.logger.log(
+                'No master passwords, %s not written.' % self.path)
+            return
+        digests = {
+            'version': self.VERSION,
+            'check': self._digest('check'),
+            'accounts': self.accounts,
+            'shards': self.shards,
+        }
+        temp = self.path + '.new'
+        try:
+            with open(temp, 'w') as f:
+                json.dump(digests, f, sort_keys=True)
+            os.chmod(temp, 0o600)
+            os.rename(temp, self.path)
+            self.logger.log('Wrote %s.' % self.path)
+        except (IOError, OSError) as err:
+            self.logger.log('%s: %s.' % (err.filename, err.strerror))
+
+    def add(self, account_id, secrets):
+        """
+        Record the secrets of an account.
+
+        secrets is a dictionary that holds the password and a list of
+        question and answer pairs, the form used for the archive.
+        """
+        self.accounts[self._digest('id', account_id)] = self._entry(
+            account_id, secrets)
+
+    def get_shard(self, account_id):
+        """Return the name of the shard that holds an account."""
+        digest = self._digest('id', account_id)
+        return '%02x' % (int(digest, 16) % self.NUM_SHARDS)
+
+    def update(self, all_secrets):
+        """
+        Record the secrets of all the accounts, replacing those recorded 
+        before.
+
+        Returns a dictionary that maps the name of each shard whose contents 
+        have changed to the IDs of the accounts it now holds (an empty list if 
+        it no longer holds any).
+        """
+        self.accounts = {}
+        members = {}
+        for account_id, secrets in all_secrets.items():
+            self.add(account_id, secrets)
+            members.setdefault(
+                self.get_shard(account_id), []).append(account_id)
+        shards = {}
+        for name, account_ids in members.items():
+            contents = sorted(
+                [self._digest('id', account_id), self.accounts[
+                    self._digest('id', account_id)]]
+                for account_id in account_ids
+            )
+            shards[name] = self._digest(
+                'shard', name, json.dumps(contents, sort_keys=True))
+        changed = dict(
+            (name, sorted(members[name])) for name in shards
+            if self.shards.get(name) != shards[name]
+        )
+        changed.update(
+            (name, []) for name in self.shards if name not in shards)
+        self.shards = shards
+        return changed
+
+    def matches(self, all_secrets):
+        """
+        Return true if all_secrets, a dictionary that maps each account ID to
+        its secrets, holds exactly the accounts and secrets that were recorded.
+        """
+        if len(all_secrets) != len(self.accounts):
+            return False
+        for account_id, secrets in all_secrets.items():
+            entry = self.accounts.get(self._digest('id', account_id))
+            if entry != self._entry(account_id, secrets):
+                return False
+        return True
+
+class _ShardedArchive:
+    """
+    Abraxas Sharded Archive
+
+    The archive is kept as a directory of shards, each an encrypted YAML file
+    that holds the secrets of some of the accounts, so that archiving only
+    needs to encrypt and replace the shards whose accounts have changed.  An
+    archive written by earlier versions of Abraxas as a single file is still
+    read if there are no shards, and is set aside once the shards are written.
+    """
+
+    NAMES = ['%02x' % i for i in range(_ArchiveDigests.NUM_SHARDS)]
+
+    def __init__(self, path, gpg, logger):
+        """
+        Arguments:
+        path (string)
+            Path to the archive file given in the accounts file.
+        gpg (gnupg object)
+            Used to encrypt and decrypt the shards.
+        logger (logger object)
+            Used to report errors.
+        """
+        self.path = path
+        self.shards_path = get_shards_path(path)
+        self.gpg = gpg
+        self.logger = logger
+
+    def _shard_path(self, name):
+        return make_path(self.shards_path, name + '.gpg')
+
+    def create(self):
+        """Create the directory that holds the shards if needed."""
+        try:
+            if not os.path.isdir(self.shards_path):
+                os.mkdir(self.shards_path, 0o700)
+        except OSError as err:
+            self.logger.error('%s: %s.' % (err.filename, err.strerror))
+
+    def has_shard(self, name):
+        """Return true if the shard exists."""
+        return os.path.exists(self._shard_path(name))
+
+    def get_shards(self):
+        """
+        Return the names of the shards that exist.  Files in the shards 
+        directory that are not shards are ignored.
+        """
+        try:
+            names = os.listdir(self.shards_path)
+        except OSError:
+            return []
+        return sorted(
+            os.path.splitext(each)[0] for each in names
+            if each.endswith('.gpg') and os.path.splitext(each)[0] in self.NAMES
+        )
+
+    def write_shard(self, name, contents, gpg_id):
+        """
+        Encrypt contents and atomically replace the shard with it.  The shard 
+        is removed if contents is None.  Requires that create() was called.
+        """
+        path = self._shard_path(name)
+        try:
+            if contents is None:
+                if os.path.exists(path):
+                    os.remove(path)
+                return
+            encrypted = self.gpg.encrypt(contents, gpg_id)
+            if not encrypted.ok:
+                self.logger.error("%s: unable to encrypt.\n%s" % (
+                    path, encrypted.stderr))
+            temp = path + '.new'
+            with open(temp, 'w') as f:
+                f.write(str(encrypted))
+            os.chmod(temp, 0o600)
+            os.rename(temp, path)
+        except (IOError, OSError) as err:
+            self.logger.error('%s: %s.' % (err.filename, err.strerror))
+
+    def read(self):
+        """
+        Decrypt the archive and return the contents of each of its shards (a 
+        list of strings).
+        """
+        if os.path.isdir(self.shards_path):
+            paths = [self._shard_path(name) for name in self.get_shards()]
+        else:
+            paths = [self.path]
+        contents = []
+        for path in paths:
+            try:
+                with open(path, 'rb') as f:
+                    encrypted = f.read()
+            except IOError as err:
+                self.logger.error('%s: %s.' % (err.filename, err.strerror))
+            contents.append(str(self.gpg.decrypt(encrypted)))
+        return contents
+
+    def retire(self):
+        """
+        Set aside the single file archive written by earlier versions of 
+        Abraxas, which is stale once the shards are written, by renaming it 
+        with an .old suffix.  Requires that the shards were written.
+        """
+        if not os.path.isfile(self.path):
+            return
+        old = self.path + '.old'
+        try:
+            os.rename(self.path, old)
+        except OSError as err:
+            self.logger.error('%s: %s.' % (err.filename, err.strerror))
+        self.logger.display(
+            "%s: superseded by %s, renamed to %s." % (
+                self.path, self.shards_path, old))
+
+# vim: set sw=4 sts=4 et:
@@ -0,0 +1,369 @@
+# Abraxas Asynchronous Password Generator
+#
+# Provides the password generator to programs that use asyncio.
+#
+# Copyright (C) 2013-14 Kenneth S. Kundert and Kale Kundert
+
+# License (fold)
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+
+# Imports (fold)
+from abraxas.generate import PasswordGenerator
+from abraxas.prefs import GPG_BINARY, XSEL, DEFAULT_TEMPLATE
+from abraxas.titles import get_title_provider
+from fileutils import ExecuteError
+from functools import partial
+from asyncio.subprocess import PIPE, DEVNULL
+import asyncio
+import concurrent.futures
+import gnupg
+import threading
+
+
+async def _run_command(cmd, logger, stdin=None):
+    # Run a command as an asyncio subprocess and return its output.
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *cmd, stdin=PIPE if stdin is not None else DEVNULL,
+            stdout=PIPE, stderr=PIPE
+        )
+    except OSError as err:
+        logger.error(str(
+            ExecuteError(cmd, err.strerror, err.filename, showCmd=True)))
+        raise
+    try:
+        stdout, stderr = await process.communicate(
+            stdin.encode('utf-8') if stdin is not None else None)
+    except asyncio.CancelledError:
+        _kill(process)
+        raise
+    if process.returncode:
+        stderr = stderr.decode('utf-8', 'replace').strip()
+        logger.error(str(ExecuteError(
+            cmd,
+            stderr if stderr else
+                "unexpected exit status (%d)." % process.returncode,
+            showCmd=True
+        )))
+    return stdout.decode('utf-8', 'replace')
+
+def _kill(process):
+    try:
+        process.kill()
+    except ProcessLookupError:
+        pass
+
+
+async def get_window_title(logger, title_provider=None):
+    """
+    Return the title of the active window.
+
+    The title is found by title_provider, or by the provider given by
+    TITLE_PROVIDER if not given (see abraxas.titles).  It is run in the
+    default executor, so an X server or xdotool that is slow to answer does
+    not hold up the loop.
+    """
+    if not title_provider:
+        title_provider = get_title_provider(logger)
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, title_provider.get_title)
+
+
+async def copy_to_clipboard(secret, wait, logger):
+    """
+    Place secret on the clipboard.
+
+    The clipboard is cleared once wait seconds have passed (a wait of 0
+    clears the clipboard immediately), or immediately if the copy is
+    cancelled while waiting.  Run it as a task if you do not wish to wait.
+    """
+    await _run_command([XSEL, '-b', '-i'], logger, stdin=secret)
+    try:
+        await asyncio.sleep(wait)
+    finally:
+        await _run_command([XSEL, '-b', '-c'], logger)
+
+
+class _Decrypted:
+    """The result of decrypting a file, as returned by gnupg."""
+
+    def __init__(self, ok, data, stderr):
+        self.ok = ok
+        self.data = data
+        self.stderr = stderr
+
+    def __str__(self):
+        return self.data.decode('utf-8', 'replace')
+
+
+class _AsyncGPG:
+    """
+    GPG for the synchronous loaders run by AsyncPasswordGenerator.
+
+    The loaders run in a worker thread and call decrypt_file(), which has gpg
+    run as an asyncio subprocess by the event loop and waits for the result.
+    The loaders also call prefetch() with the names of the additional files
+    once they are known, which starts decrypting all of them at once.
+    Anything else, such as encrypting the log file, is passed on to gnupg.
+    """
+
+    def __init__(self, gpg_home=None):
+        self.loop = None
+        self.loop_thread = None
+        self.gpg_home = gpg_home
+        self.decryptions = {}
+            # maps path to the future that gives the result of decrypting it
+        self.cancelled = False
+        self._gpg = None
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        if self._gpg is None:
+            gpg_args = {'gpgbinary': GPG_BINARY}
+            if self.gpg_home:
+                gpg_args.update({'gnupghome': self.gpg_home})
+            self._gpg = gnupg.GPG(**gpg_args)
+        return getattr(self._gpg, name)
+
+    async def decrypt(self, path):
+        """Decrypt a file using gpg run as a subprocess."""
+        cmd = [GPG_BINARY, '--batch', '--no-tty', '--quiet']
+        if self.gpg_home:
+            cmd += ['--homedir', self.gpg_home]
+        cmd += ['--decrypt', path]
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *cmd, stdin=DEVNULL, stdout=PIPE, stderr=PIPE
+            )
+        except OSError as err:
+            return _Decrypted(False, b'', str(
+                ExecuteError(cmd, err.strerror, err.filename, showCmd=True)))
+        try:
+            stdout, stderr = await process.communicate()
+        except asyncio.CancelledError:
+            _kill(process)
+            raise
+        return _Decrypted(
+            process.returncode == 0, stdout, stderr.decode('utf-8', 'replace'))
+
+    def _start(self, path):
+        # Returns the future for the decryption of path, starting it if needed.
+        if self.cancelled:
+            raise concurrent.futures.CancelledError()
+        if path not in self.decryptions:
+            self.decryptions[path] = asyncio.run_coroutine_threadsafe(
+                self.decrypt(path), self.loop)
+        return self.decryptions[path]
+
+    def prefetch(self, paths):
+        """Start decrypting files that will be needed shortly."""
+        for path in paths:
+            self._start(path)
+
+    def decrypt_file(self, f):
+        """Decrypt an open file, waiting for the result."""
+        if threading.current_thread() is self.loop_thread:
+            # waiting here would stop the loop from running gpg
+            return self.__getattr__('decrypt_file')(f)
+        return self._start(f.name).result()
+
+    def attach(self, loop):
+        """Use loop, which must be running in the current thread, for gpg."""
+        self.loop = loop
+        self.loop_thread = threading.current_thread()
+
+    def cancel(self):
+        """Kill any gpg processes and refuse to start new ones."""
+        self.cancelled = True
+        for future in list(self.decryptions.values()):
+            future.cancel()
+
+    def clear(self):
+        """Forget the decrypted files and allow new decryptions."""
+        self.cancelled = False
+        self.decryptions = {}
+
+
+class AsyncPasswordGenerator:
+    """
+    Asynchronous Abraxas Password Generator
+
+    A version of PasswordGenerator for programs that use asyncio.  Loading the
+    files and deriving secrets are coroutines, so they do not block the event
+    loop: gpg and xsel are run as asyncio subprocesses and everything else,
+    including finding the title of the active window, runs in the loop's
+    default executor.  Use as follows:
+
+        pw = AsyncPasswordGenerator()
+        await pw.open()
+        await pw.read_accounts()
+        account = await pw.get_account('login')
+        password = await pw.generate_password(account)
+
+    The additional master password and accounts files are decrypted
+    concurrently.  If a coroutine is cancelled, any gpg processes it started
+    are killed and the coroutine does not return until the work it started
+    in the executor has stopped.
+
+    The secrets are derived by the same code that is used by
+    PasswordGenerator, and so are always the same.  The synchronous methods
+    of PasswordGenerator that neither read files nor change its state, such
+    as lookup_account() and all_accounts(), are also available.
+    """
+
+    def __init__(
+        self, settings_dir=None, logger=None, gpg_home=None, stateless=False,
+        timings=None, title_provider=None
+    ):
+        """
+        The arguments are the same as those of PasswordGenerator, except that
+        init is not supported (use PasswordGenerator to create the initial
+        settings files).  Nothing is read until open() is called.
+        """
+        self.args = dict(
+            settings_dir=settings_dir, logger=logger, gpg_home=gpg_home,
+            stateless=stateless, timings=timings,
+            title_provider=title_provider
+        )
+        self.gpg = None
+        self.generator = None
+
+    def __getattr__(self, name):
+        if name.startswith('__') or self.__dict__.get('generator') is None:
+            raise AttributeError(name)
+        return getattr(self.generator, name)
+
+    async def _run(self, function, *args, **kwargs):
+        # Run function in the default executor.
+        loop = asyncio.get_event_loop()
+        if self.gpg:
+            self.gpg.attach(loop)
+        future = loop.run_in_executor(None, partial(function, *args, **kwargs))
+        try:
+            # shield the future so that it can still be waited upon once
+            # this coroutine is cancelled
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if self.gpg:
+                # Stop any decryptions, which causes the function to give up,
+                # then wait for it to do so.
+                self.gpg.cancel()
+                await asyncio.wait([future])
+                self.gpg.clear()
+                if not future.cancelled():
+                    # the function most likely gave up with CancelledError,
+                    # mark it as seen as it is superseded by our own
+                    future.exception()
+            raise
+
+    async def open(self):
+        """Read the dictionary and the master password files."""
+        self.gpg = _AsyncGPG(self.args['gpg_home'])
+        self.generator = await self._run(
+            PasswordGenerator, gpg=self.gpg, **self.args)
+        self.gpg.clear()
+
+    async def read_accounts(self, template=DEFAULT_TEMPLATE):
+        """
+        Read accounts files.
+
+        Required before secrets can be generated or accounts can be queried.
+
+        Arguments:
+        template (string)
+            The template to be used if one is not found in the account.
+        """
+        await self._run(self.generator.read_accounts, template)
+        self.gpg.clear()
+
+    async def get_account(self, account_id=None, quiet=False):
+        """
+        Return an account.
+
+        The account is not activated, pass it explicitly to
+        generate_password() and generate_answer().
+
+        Arguments:
+        account_id (string)
+            The account id or alias. If not given, the account is found from
+            the title of the active window.
+        quiet (bool)
+            If true, the use of the account is only noted in the log file if
+            DEBUG is true.
+
+        Returns:
+            Account object.
+        """
+        title = None
+        if not account_id and not self.generator.stateless:
+            title = await get_window_title(
+                self.generator.logger, self.generator.title_provider)
+        return await self._run(
+            self.generator.lookup_account, account_id, quiet, title)
+
+    async def generate_password(self, account, master_password=None):
+        """
+        Generate and return a password or passphrase.
+
+        Arguments are as for PasswordGenerator.generate_password() except
+        that the account is required.
+        """
+        return await self._run(
+            self.generator.generate_password, account, master_password)
+
+    async def generate_answer(self, question, account):
+        """
+        Generate and return an answer to a particular question.
+
+        Arguments are as for PasswordGenerator.generate_answer() except that
+        the account is required.
+        """
+        return await self._run(
+            self.generator.generate_answer, question, account)
+
+    async def generate_secrets(self, account_ids=None, chunk_size=100):
+        """
+        Generate the secrets for many accounts.
+
+        The accounts are processed in chunks, so cancellation takes effect
+        after the current chunk.
+
+        Arguments:
+        account_ids (list of strings)
+            The accounts, all accounts other than templates if not given.
+        chunk_size (int)
+            The number of accounts processed in one go by the executor.
+
+        Returns:
+            A dictionary that maps each account ID to a dictionary that holds
+            the password and a list of question and answer pairs, the same
+            form as is used for the archive.
+        """
+        if account_ids is None:
+            account_ids = list(self.generator.all_accounts())
+        secrets = {}
+        for start in range(0, len(account_ids), chunk_size):
+            secrets.update(await self._run(
+                self._generate_secrets, account_ids[start:start+chunk_size]))
+        return secrets
+
+    def _generate_secrets(self, account_ids):
+        # Runs in the executor.
+        return dict(
+            (account_id, self.generator._get_secrets(account_id))
+            for account_id in account_ids
+        )
+
+# vim: set sw=4 sts=4 et:
@@ -0,0 +1,197 @@
+# Abraxas Clipboard
+#
+# Places secrets on the system clipboard and removes them again after a while.
+#
+# Copyright (C) 2013-14 Kenneth S. Kundert and Kale Kundert
+
+# License (fold)
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+
+# Imports (fold)
+from __future__ import print_function, division
+from abraxas.prefs import XSEL, XCLIP
+from fileutils import Execute, ExecuteError
+from time import time, sleep
+import fcntl
+import os
+
+
+class Clipboard:
+    """
+    Abraxas Clipboard Base Class
+
+    A clipboard is given a queue of items.  The first item is made available
+    immediately, each of the following items replaces its predecessor once the
+    predecessor has been pasted, and the last item remains available until the
+    clipboard is cleared.  Everything is cleared once wait seconds have passed
+    (a wait of 0 clears the clipboard immediately).
+    """
+
+    def __init__(self):
+        # Do not use this class directly.
+        # Use one of the subclasses instead
+        raise NotImplementedError
+
+    def copy(self, items, wait):
+        """
+        Place items on the clipboard.
+
+        Arguments:
+        items (list of strings)
+            The items, in the order they are to be pasted.
+        wait (real)
+            The number of seconds before the clipboard is cleared.
+        """
+        raise NotImplementedError
+
+
+class SelectionOwner(Clipboard):
+    """
+    Hands the items to a detached process that owns the clipboard.
+
+    The owner is a grandchild of abraxas that has been re-parented to init, so
+    copy() returns as soon as the first item is in place.  The owner serves the
+    queued items and clears the clipboard when its own timer expires, long
+    after abraxas has terminated.
+    """
+
+    # Use 'xsel' and 'xclip' to own the clipboard.
+    # This represents a vulnerability, if someone were to replace these
+    # programs they could steal my passwords. This is why I use absolute paths.
+    # xclip is only needed for queues as it can be told to exit after the item
+    # has been pasted once, which is how the owner knows to move on to the next
+    # item.
+
+    def __init__(self, logger):
+        self.logger = logger
+
+    def copy(self, items, wait):
+        if len(items) > 1 and not os.access(XCLIP, os.X_OK):
+            self.logger.error('%s: queued pastes require xclip.' % XCLIP)
+        ready, notify = os.pipe()
+        # xsel and xclip must not inherit the pipe, otherwise the parent would
+        # not see it close until they exit (python2 does not close the file
+        # descriptors of the processes it runs).
+        for fd in [ready, notify]:
+            fcntl.fcntl(
+                fd, fcntl.F_SETFD, fcntl.fcntl(fd, fcntl.F_GETFD) |
+                fcntl.FD_CLOEXEC)
+        try:
+            pid = os.fork()
+        except OSError as err:
+            os.close(ready)
+            os.close(notify)
+            self.logger.error('clipboard: %s.' % err.strerror)
+            return
+        if pid:
+            # Parent: wait for the owner to report that the first item is in
+            # place.  The report is empty unless something went wrong.
+            os.close(notify)
+            os.waitpid(pid, 0)
+            report = []
+            while True:
+                chunk = os.read(ready, 1024)
+                if not chunk:
+                    break
+                report.append(chunk)
+            os.close(ready)
+            report = b''.join(report).decode('utf-8', 'replace').strip()
+            if report:
+                self.logger.error(report)
+            return
+
+        # Child: start a new session and fork again so the owner is detached
+        # from the terminal and is not killed along with abraxas.
+        try:
+            os.close(ready)
+            os.setsid()
+            if os.fork():
+                os._exit(0)
+            devnull = os.open(os.devnull, os.O_RDWR)
+            for fd in range(3):
+                os.dup2(devnull, fd)
+            self._serve(items, wait, notify)
+        finally:
+            os._exit(0)
+
+    def _serve(self, items, wait, notify):
+        # Runs in the owner.
+        deadline = time() + wait
+
+        def expired():
+            return time() >= deadline
+
+        try:
+            for item in items[:-1]:
+                # xclip exits once the item has been pasted.
+                xclip = Execute(
+                    [XCLIP, '-selection', 'clipboard', '-loops', '1', '-quiet'],
+                    stdin=item, stdout=False, stderr=False, wait=False
+                )
+                notify = self._report(notify)
+                while xclip.process.poll() is None and not expired():
+                    sleep(0.1)
+                if expired():
+                    xclip.process.kill()
+                    xclip.process.wait()
+                    break
+            else:
+                # xsel detaches and holds the last item until another client
+                # claims the clipboard or until the clipboard is cleared.
+                Execute([XSEL, '-b', '-i'], stdin=items[-1])
+                notify = self._report(notify)
+        except ExecuteError as err:
+            self._report(notify, str(err))
+            return
+        sleep(max(deadline - time(), 0))
+        try:
+            Execute([XSEL, '-b', '-c'])
+        except ExecuteError:
+            pass
+
+    @staticmethod
+    def _report(notify, msg=''):
+        # Tell the parent how placing the first item went (only once).
+        if notify is not None:
+            os.write(notify, msg.encode('utf-8'))
+            os.close(notify)
+
+
+class LocalClipboard(Clipboard):
+    """
+    Holds the items in the abraxas process.
+
+    Nothing is sent to the system clipboard, which makes this clipboard useful
+    for testing.  Use paste() to retrieve the items.
+    """
+
+    def __init__(self):
+        self.items = []
+        self.deadline = None
+
+    def copy(self, items, wait):
+        self.items = list(items)
+        self.deadline = time() + wait
+
+    def paste(self):
+        """Return the current item and advance the queue."""
+        if self.deadline is not None and time() >= self.deadline:
+            self.items = []
+        if not self.items:
+            return ''
+        if len(self.items) > 1:
+            return self.items.pop(0)
+        return self.items[0]
+
+# vim: set sw=4 sts=4 et:
@@ -0,0 +1,260 @@
+# Abraxas Encryption Backends
+#
+# Provides alternatives to gpg for encrypting and decrypting the files that
+# are private to Abraxas, and a stand-in for gpg for testing.
+#
+# Copyright (C) 2013-14 Kenneth S. Kundert and Kale Kundert
+
+# License (fold)
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+
+# Imports (fold)
+from __future__ import print_function, division
+from binascii import b2a_base64, a2b_base64, Error as BinasciiError
+import os
+
+# An encryption backend is any object that provides the following methods of
+# gnupg.GPG, which is the default backend:
+#
+#     encrypt(data, recipients, always_trust=False, armor=True)
+#     decrypt(data)
+#     decrypt_file(file)
+#
+# Each returns a result with the attributes ok, data (bytes) and stderr, and
+# str() of the result gives the data as text (ASCII armored if encrypted with
+# armor).  Pass the backend to PasswordGenerator as gpg.  FakeGpg is such a
+# backend that stands in for gpg when testing.
+
+
+class _Result:
+    """The result of encrypting or decrypting, as returned by gnupg."""
+
+    def __init__(self, ok, data=b'', stderr=''):
+        self.ok = ok
+        self.data = data
+        self.stderr = stderr
+
+    def __str__(self):
+        return self.data.decode('utf-8', 'replace')
+
+
+class _ArmoredBackend:
+    """
+    Base for the backends that write their own messages, which start with
+    MAGIC or, if armored, are base64 encoded between ARMOR_BEGIN and
+    ARMOR_END.
+    """
+
+    MAGIC = None
+    ARMOR_BEGIN = None
+    ARMOR_END = None
+
+    def _armor(self, data):
+        encoded = b2a_base64(data).replace(b'\n', b'')
+        lines = [self.ARMOR_BEGIN] + [
+            encoded[i:i+64] for i in range(0, len(encoded), 64)
+        ] + [self.ARMOR_END, b'']
+        return b'\n'.join(lines)
+
+    def _dearmor(self, data):
+        lines = data.strip().split(b'\n')
+        if lines[-1].strip() != self.ARMOR_END:
+            raise ValueError('truncated message.')
+        return a2b_base64(b''.join(line.strip() for line in lines[1:-1]))
+
+    def _unpack(self, data):
+        # Return the message that follows MAGIC, removing the armor if needed.
+        if data.startswith(self.ARMOR_BEGIN):
+            data = self._dearmor(data)
+        if not data.startswith(self.MAGIC):
+            raise ValueError('unrecognized message.')
+        return data[len(self.MAGIC):]
+
+    def is_encrypted(self, data):
+        """Return true if data was encrypted by this backend."""
+        return data.startswith(self.MAGIC) or data.startswith(self.ARMOR_BEGIN)
+
+    def decrypt_file(self, f):
+        """Decrypt an open file."""
+        return self.decrypt(f.read())
+
+
+class AeadBackend(_ArmoredBackend):
+    """
+    In-process encryption backend
+
+    Encrypts and decrypts in-process using ChaCha20-Poly1305, an authenticated
+    cipher, with a 256-bit key, and so avoids running gpg for every file.
+    The key is kept in a file that is itself encrypted with gpg, so gpg is
+    run only once per session, to unlock the key.  Requires the cryptography
+    package.
+
+    Data that was not encrypted by this backend, such as a vault encrypted
+    with gpg, is passed on to the fallback backend (normally gpg), so
+    existing files can still be read.  Everything written is encrypted with
+    the key, which does not depend on the recipients, so only files that are
+    read by nothing but Abraxas should be written with this backend.
+    """
+
+    MAGIC = b'abraxas aead 1\n'
+    ARMOR_BEGIN = b'-----BEGIN ABRAXAS AEAD MESSAGE-----'
+    ARMOR_END = b'-----END ABRAXAS AEAD MESSAGE-----'
+    NONCE_SIZE = 12
+    KEY_SIZE = 32
+
+    def __init__(self, key, fallback=None):
+        """
+        Arguments:
+        key (bytes)
+            The 256-bit key.
+        fallback (backend)
+            Used for data not encrypted by this backend.
+        """
+        if len(key) != self.KEY_SIZE:
+            raise ValueError('key must be %d bytes.' % self.KEY_SIZE)
+        self.key = key
+        self.fallback = fallback
+        self._cipher = None
+
+    @classmethod
+    def create_key(cls, path, gpg, gpg_id):
+        """
+        Create a new random key and save it to path, encrypted with gpg.
+        Returns an error message or None if successful.
+        """
+        encrypted = gpg.encrypt(
+            b2a_base64(os.urandom(cls.KEY_SIZE)), gpg_id,
+            always_trust=True, armor=True)
+        if not encrypted.ok:
+            return "%s: unable to encrypt.\n%s" % (path, encrypted.stderr)
+        try:
+            with open(path, 'w') as f:
+                f.write(str(encrypted))
+            os.chmod(path, 0o600)
+        except IOError as err:
+            return '%s: %s.' % (err.filename, err.strerror)
+
+    @classmethod
+    def unlock(cls, path, gpg):
+        """
+        Read the key from path, decrypting it with gpg, and return a backend
+        that uses it with gpg as its fallback.
+
+        Raises IOError if the key cannot be read and ValueError if it is
+        invalid.
+        """
+        with open(path, 'rb') as f:
+            decrypted = gpg.decrypt_file(f)
+        if not decrypted.ok:
+            raise ValueError(
+                "%s: unable to decrypt.\n%s" % (path, decrypted.stderr))
+        try:
+            key = a2b_base64(decrypted.data)
+        except BinasciiError:
+            raise ValueError("%s: invalid key." % path)
+        return cls(key, gpg)
+
+    def _get_cipher(self):
+        if self._cipher is None:
+            from cryptography.hazmat.primitives.ciphers.aead import (
+                ChaCha20Poly1305
+            )
+            self._cipher = ChaCha20Poly1305(self.key)
+        return self._cipher
+
+    def encrypt(self, data, recipients=None, always_trust=False, armor=True):
+        """
+        Encrypt data.
+
+        The recipients and always_trust are accepted for compatibility with
+        gnupg and are ignored.
+        """
+        if type(data) != bytes:
+            data = data.encode('utf-8')
+        try:
+            cipher = self._get_cipher()
+        except ImportError as err:
+            return _Result(False, stderr=str(err))
+        nonce = os.urandom(self.NONCE_SIZE)
+        encrypted = self.MAGIC + nonce + cipher.encrypt(
+            nonce, data, self.MAGIC)
+        return _Result(True, self._armor(encrypted) if armor else encrypted)
+
+    def decrypt(self, data):
+        """Decrypt data."""
+        if type(data) != bytes:
+            data = data.encode('utf-8')
+        if not self.is_encrypted(data):
+            if self.fallback:
+                return self.fallback.decrypt(data)
+            return _Result(False, stderr='not encrypted by this backend.')
+        try:
+            data = self._unpack(data)
+            nonce = data[:self.NONCE_SIZE]
+            return _Result(True, self._get_cipher().decrypt(
+                nonce, data[self.NONCE_SIZE:], self.MAGIC))
+        except ImportError as err:
+            return _Result(False, stderr=str(err))
+        except Exception as err:
+            # the cryptography package raises InvalidTag if the data has been
+            # corrupted or was encrypted with another key
+            return _Result(False, stderr='%s %s' % (
+                err.__class__.__name__, err))
+
+
+class FakeGpg(_ArmoredBackend):
+    """
+    Stand-in for gpg, for use in testing
+
+    Provides the same interface as gnupg.GPG, but rather than encrypting the
+    data it simply wraps it along with the recipients, in-process and
+    without any randomness, so encrypting the same data always gives the same
+    result and no gpg processes are run.  It provides no security whatsoever.
+
+    The number of times data was encrypted and decrypted is counted.
+    """
+
+    MAGIC = b'abraxas fake 1\n'
+    ARMOR_BEGIN = b'-----BEGIN ABRAXAS FAKE MESSAGE-----'
+    ARMOR_END = b'-----END ABRAXAS FAKE MESSAGE-----'
+
+    def __init__(self):
+        self.encryptions = 0
+        self.decryptions = 0
+
+    def encrypt(self, data, recipients, always_trust=False, armor=True):
+        """Encrypt data, gpg requires at least one recipient."""
+        if not recipients:
+            return _Result(False, stderr='no recipients given.')
+        if type(recipients) not in [list, tuple]:
+            recipients = [recipients]
+        if type(data) != bytes:
+            data = data.encode('utf-8')
+        self.encryptions += 1
+        header = ('%s\n' % ' '.join(recipients)).encode('utf-8')
+        wrapped = self.MAGIC + header + data
+        return _Result(True, self._armor(wrapped) if armor else wrapped)
+
+    def decrypt(self, data):
+        """Decrypt data."""
+        if type(data) != bytes:
+            data = data.encode('utf-8')
+        self.decryptions += 1
+        try:
+            header, data = self._unpack(data).split(b'\n', 1)
+        except (ValueError, BinasciiError) as err:
+            return _Result(False, stderr='decryption failed: %s' % err)
+        return _Result(True, data)
+
+# vim: set sw=4 sts=4 et:
@@ -1,4 +1,6 @@
+import os
 import sys
+from time import sleep
 
 # This module provides some tools for manipulating the position of the cursor.
 # This is useful for programs that need to update some simple pieces of 
@@ -97,3 +99,41 @@ def conceal():
 def reveal():
     """ Reveal the cursor. """
     write('\033[?25h')
+
+
+def wait_for_key(timeout):
+    """
+    Wait until either a key is pressed or timeout seconds have passed.
+
+    Returns True if a key was pressed. The key is consumed and is not echoed.
+    If standard input is not a terminal this simply sleeps.
+    """
+    try:
+        import termios
+        import select
+    except ImportError:
+        sleep(timeout)
+        return False
+    try:
+        fd = sys.stdin.fileno()
+        if not os.isatty(fd):
+            sleep(timeout)
+            return False
+        settings = termios.tcgetattr(fd)
+    except (termios.error, AttributeError, ValueError, IOError, OSError):
+        sleep(timeout)
+        return False
+    # Turn off canonical mode and echo so a single keystroke is available
+    # immediately and is not shown; signals (Ctrl-C) are left enabled.
+    quiet = termios.tcgetattr(fd)
+    quiet[3] &= ~(termios.ICANON | termios.ECHO)
+    quiet[6][termios.VMIN] = 1
+    quiet[6][termios.VTIME] = 0
+    try:
+        termios.tcsetattr(fd, termios.TCSANOW, quiet)
+        ready = select.select([fd], [], [], timeout)[0]
+        if ready:
+            os.read(fd, 1024)
+        return bool(ready)
+    finally:
+        termios.tcsetattr(fd, termios.TCSADRAIN, settings)
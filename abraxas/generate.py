@@ -35,6 +35,14 @@ from abraxas.logger import Logging
 from abraxas.dictionary import Dictionary
 from abraxas.master import _MasterPassword
 from abraxas.accounts import _Accounts
+from abraxas.vault import _Vault
+from abraxas.archive import (
+    _ArchiveDigests, _ShardedArchive, get_digests_path
+)
+from abraxas.crypto import AeadBackend
+from abraxas.manifest import _ExportManifest, derive_key, get_stamp
+from abraxas.timing import PhaseTimer
+from abraxas.version import VERSION
 from abraxas.prefs import (
     DEFAULT_ACCOUNTS_FILENAME,
     DEFAULT_SETTINGS_DIR,
@@ -45,7 +53,9 @@ from abraxas.prefs import (
     MASTER_PASSWORD_FILE_INITIAL_CONTENTS,
     ACCOUNTS_FILE_INITIAL_CONTENTS,
     SECRETS_SHA1, CHARSETS_SHA1,
-    DEFAULT_LOG_FILENAME, DEFAULT_ARCHIVE_FILENAME
+    DEFAULT_LOG_FILENAME, DEFAULT_ARCHIVE_FILENAME,
+    VAULT_FILENAME, EXPORT_MANIFEST_FILENAME,
+    CRYPTO_BACKEND, AEAD_KEY_FILENAME
 )
 from textwrap import dedent
 import argparse
@@ -67,7 +77,8 @@ class PasswordGenerator:
 
     def __init__(
         self, settings_dir=None, init=None, logger=None, gpg_home=None,
-        stateless=False
+        stateless=False, timings=None, gpg=None, crypto_backend=None,
+        title_provider=None
     ):
         """
         Arguments:
@@ -97,6 +108,28 @@ class PasswordGenerator:
         stateless (bool)
             Boolean that indicates that Abraxas should operate without 
             accessing the user's master password and accounts files.
+        timings (PhaseTimer object)
+            Accumulates the time spent in the various phases of the run; it is
+            available as self.timings. One is created if not given. If the
+            logger provides set_timings(), the timer is passed to it so the
+            timings can be added to the log.
+        gpg (object)
+            Object used to encrypt and decrypt files in place of the
+            gnupg.GPG object that is normally created. It must provide
+            encrypt(), decrypt() and decrypt_file() as gnupg.GPG does.
+        crypto_backend (string)
+            Either 'gpg', in which case files are encrypted and decrypted by 
+            gpg, or 'aead', in which case the files private to Abraxas, the 
+            vault and the log file, are encrypted and decrypted in-process 
+            with a key that gpg unlocks once (see AeadBackend).  
+            CRYPTO_BACKEND is used if not given.  With 'aead', gpg (or the 
+            gnupg.GPG object) is still used for the files that are read or 
+            edited with gpg: the settings files, the archive and the 
+            Avendesora files.
+        title_provider (title provider)
+            Object used to find the title of the active window for account 
+            discovery in place of the one given by TITLE_PROVIDER.  It must 
+            provide get_title() (see abraxas.titles).
         """
 
         if not settings_dir:
@@ -106,30 +139,63 @@ class PasswordGenerator:
             logger = Logging()
         self.logger = logger
         self.stateless = stateless
+        self.title_provider = title_provider
+        self.account = None
+        self.timings = timings if timings else PhaseTimer()
+        if hasattr(logger, 'set_timings'):
+            logger.set_timings(self.timings)
         self.accounts_path = make_path(
             self.settings_dir, DEFAULT_ACCOUNTS_FILENAME)
 
         # Get the dictionary
-        self.dictionary = Dictionary(
-            DICTIONARY_FILENAME, self.settings_dir, logger)
+        with self.timings.phase('dictionary'):
+            self.dictionary = Dictionary(
+                DICTIONARY_FILENAME, self.settings_dir, logger)
 
         # Activate GPG
-        gpg_args = {'gpgbinary': GPG_BINARY}
-        if gpg_home:
-            gpg_args.update({'gnupghome': gpg_home})
-        self.gpg = gnupg.GPG(**gpg_args)
+        if gpg:
+            self.gpg = gpg
+        else:
+            gpg_args = {'gpgbinary': GPG_BINARY}
+            if gpg_home:
+                gpg_args.update({'gnupghome': gpg_home})
+            with self.timings.phase('gpg'):
+                self.gpg = gnupg.GPG(**gpg_args)
+        self.cipher = self.gpg
+            # used for the files private to Abraxas
+        crypto_backend = crypto_backend or CRYPTO_BACKEND
+        if crypto_backend == 'aead':
+            if not stateless:
+                self.cipher = self._unlock_aead_backend(self.gpg, init)
+        elif crypto_backend != 'gpg':
+            self.logger.error(
+                "%s: unknown encryption backend (expected 'gpg' or "
+                "'aead')." % crypto_backend)
 
         # Process master password file
         self.master_password_path = make_path(
             self.settings_dir, MASTER_PASSWORD_FILENAME)
         if init:
             self._create_initial_settings_files(gpg_id=init)
-        self.master_password = _MasterPassword(
-            self.master_password_path,
-            self.dictionary,
-            self.gpg,
-            self.logger,
-            stateless)
+
+        # Use the compiled vault in place of the settings files if it is 
+        # current
+        self.vault = _Vault(
+            make_path(self.settings_dir, VAULT_FILENAME),
+            self.cipher, self.logger, self.timings)
+        self.compiled = None
+        if not stateless and not init:
+            with self.timings.phase('vault'):
+                self.compiled = self.vault.load(self.dictionary.hash)
+        with self.timings.phase('master password'):
+            self.master_password = _MasterPassword(
+                self.master_password_path,
+                self.dictionary,
+                self.gpg,
+                self.logger,
+                stateless,
+                self.timings,
+                self.compiled['master'] if self.compiled else None)
         try:
             path = self.master_password.data['accounts']
             if path:
@@ -137,6 +203,39 @@ class PasswordGenerator:
         except KeyError:
             pass
 
+    def _unlock_aead_backend(self, gpg, init):
+        """
+        Unlock the key for the in-process encryption backend (PRIVATE)
+
+        The key is created first if initializing and it does not exist.
+
+        Arguments:
+        gpg (gnupg object)
+            Used to decrypt the key, and to decrypt any files that were not 
+            encrypted by the in-process backend.
+        init (string)
+            User's GPG ID, given if initializing.
+
+        Returns:
+            AeadBackend object.
+        """
+        path = make_path(self.settings_dir, AEAD_KEY_FILENAME)
+        if init and not exists(path):
+            mkdir(self.settings_dir)
+            error = AeadBackend.create_key(path, gpg, init)
+            if error:
+                self.logger.error(error)
+            self.logger.display("%s: created." % path)
+        with self.timings.phase('unlock key'):
+            try:
+                return AeadBackend.unlock(path, gpg)
+            except IOError as err:
+                self.logger.error(
+                    "%s: %s.  Use 'abraxas --init <GPG ID>' to create it." % (
+                        err.filename, err.strerror))
+            except ValueError as err:
+                self.logger.error(str(err))
+
     def _create_initial_settings_files(self, gpg_id):
         """
         Create initial version of settings files for the user (PRIVATE)
@@ -220,24 +319,66 @@ class PasswordGenerator:
         template (string)
             The template to be used if one is not found in the account.
         """
-        accounts = _Accounts(
-            self.accounts_path, self.logger, self.gpg, template, self.stateless
-        )
+        with self.timings.phase('read accounts'):
+            accounts = _Accounts(
+                self.accounts_path, self.logger, self.gpg, template,
+                self.stateless, self.timings, self.master_password.index_key,
+                self.compiled['accounts'] if self.compiled else None,
+                self.title_provider
+            )
         self.accounts = accounts
         self.all_templates = accounts.all_templates
         self.all_accounts = accounts.all_accounts
         self.find_accounts = accounts.find_accounts
         self.search_accounts = accounts.search_accounts
+        self.has_account = accounts.has_account
         if not self.stateless:
             self.logger.set_logfile(
                 accounts.get_log_file(),
-                accounts.gpg,
+                self.cipher,
                 accounts.get_gpg_id())
+            if self.vault.stale:
+                self.compile_vault(required=False)
+
+    def compile_vault(self, required=True):
+        """
+        Compile the master password and accounts files into the vault.
+
+        The vault is a single encrypted file that holds the merged master 
+        passwords and accounts along with the alias table and the account 
+        discovery index.  It is used in place of the files, and so 
+        saves decrypting and running each of them, until any of the files or 
+        the dictionary change, at which point it is recompiled.
+
+        Requires that the accounts have been read.
+
+        Arguments:
+        required (bool)
+            If false, a failure to write the vault is only logged.  It is
+            false when an out of date vault is recompiled automatically, as
+            the accounts have already been read from the files.
+
+        Returns true if the vault was written.
+        """
+        with self.timings.phase('compile vault'):
+            master = self.master_password.get_compiled()
+            accounts = self.accounts.get_compiled()
+            return self.vault.save(
+                {'master': master, 'accounts': accounts},
+                master['sources'] + accounts['sources'],
+                self.dictionary.hash,
+                self.accounts.get_gpg_id(),
+                required)
 
     def get_account(self, account_id, quiet=False):
         """
         Activate and return an account.
 
+        The account becomes the active account, which is used by 
+        generate_password() and generate_answer() when they are not given an 
+        account.  Use lookup_account() instead if the generator is shared 
+        between threads.
+
         Arguments:
         account_id (string)
             The account id or alias.
@@ -249,8 +390,36 @@ class PasswordGenerator:
         Returns:
             Account object.
         """
-        account = self.accounts.get_account(account_id)
+        account = self.lookup_account(account_id, quiet)
         self.account = account
+        return account
+
+    def lookup_account(self, account_id, quiet=False, title=None):
+        """
+        Return an account without activating it.
+
+        The account is an immutable handle that is passed explicitly to 
+        generate_password() and generate_answer().  Neither this method nor 
+        those change the state of the generator, so once the accounts have 
+        been read any number of threads may use the generator concurrently.
+
+        Arguments:
+        account_id (string)
+            The account id or alias.
+        quiet (bool)
+            If true, the use of the account is only noted in the log file if
+            DEBUG is true.
+        title (string)
+            The title of the active window. Only used if account_id is not
+            given, in which case the account is found from the title. If the
+            title is not given it is found by the title provider given to the
+            constructor, or else by the one selected by TITLE_PROVIDER.
+
+        Returns:
+            Account object.
+        """
+        with self.timings.phase('get account'):
+            account = self.accounts.get_account(account_id, title=title)
         if quiet:
             self.logger.debug('Using account: %s' % account.get_id())
         else:
@@ -263,7 +432,7 @@ class PasswordGenerator:
 
         Arguments:
         account (object)
-            Account object.
+            Account object. The active account is used if not given.
         master_password (string)
             Use to override the master password associated with the account.
             If the account does not have a master password, or if there is no
@@ -274,8 +443,9 @@ class PasswordGenerator:
         Returns:
             The desired password or passphrase (string).
         """
-        return self.master_password.generate_password(
-            account if account else self.account, master_password)
+        with self.timings.phase('derive'):
+            return self.master_password.generate_password(
+                account if account else self.account, master_password)
 
     def generate_answer(self, question, account=None):
         """
@@ -283,7 +453,7 @@ class PasswordGenerator:
 
         Arguments:
         account (object)
-            Account object.
+            Account object. The active account is used if not given.
         question (string or integer)
             Specifies which question is being asked. May either be the question
             text (a string) or it may be an index into the list of questions in
@@ -292,36 +462,72 @@ class PasswordGenerator:
         Returns:
             The question text and the corresponding answer (tuple of strings).
         """
-        return self.master_password.generate_answer(
-            account if account else self.account, question)
+        with self.timings.phase('derive'):
+            return self.master_password.generate_answer(
+                account if account else self.account, question)
+
+    def forget_master_passwords(self):
+        """
+        Forget any master passwords that the user was asked for.
+
+        Master passwords entered by the user are remembered for 
+        MASTER_PASSWORD_TTL seconds so that the user is only asked once when 
+        generating many secrets.  Long running programs can call this once 
+        they are done to overwrite and discard them immediately.
+        """
+        self.master_password.forget_master_passwords()
+
+    def _get_secrets(self, account_id):
+        # Returns the password and the questions and answers of an account, 
+        # in the form used for the archive.
+        account = self.lookup_account(account_id, quiet=True)
+        password = self.generate_password(account)
+        questions = []
+        for question in account.get_security_questions():
+            # convert the result to a list rather than leaving it a tuple
+            # because tuples are formatted oddly in yaml
+            questions += [list(self.generate_answer(question, account))]
+        return {'password': password, 'questions': questions}
 
     def print_changed_secrets(self):
         """
         Identify updated secrets
 
         Inform the user of any secrets that have changed since they have been
-        archived.
+        archived.  The secrets are first checked against the archive digests, 
+        and only if they differ is the archive decrypted to find what changed.
         """
         self.logger.log("Print changed secrets.")
+        filename = expand_path(self.accounts.get_archive_file())
+        current_secrets = dict(
+            (account_id, self._get_secrets(account_id))
+            for account_id in self.all_accounts()
+        )
+
+        digests = _ArchiveDigests(
+            get_digests_path(filename),
+            self.master_password.get_archive_key(),
+            self.logger)
+        if digests.load() and digests.matches(current_secrets):
+            self.logger.log("No new accounts.")
+            self.logger.log("No deleted accounts.")
+            self.logger.log("No accounts with changed passwords")
+            self.logger.log("No accounts with changed questions")
+            return
+
         try:
             import yaml
         except ImportError:
             self.logger.error(
                 'archive feature requires yaml, which is not available.')
-
-        filename = expand_path(self.accounts.get_archive_file())
-        try:
-            with open(filename, 'rb') as f:
-                encrypted_secrets = f.read()
-        except IOError as err:
-            self.logger.error('%s: %s.' % (err.filename, err.strerror))
-
-        unencrypted_secrets = str(self.gpg.decrypt(encrypted_secrets))
-        archived_secrets = yaml.load(unencrypted_secrets)
+        archive = _ShardedArchive(filename, self.gpg, self.logger)
+        archived_secrets = {}
+        for unencrypted_secrets in archive.read():
+            archived_secrets.update(yaml.safe_load(unencrypted_secrets) or {})
 
         # Look for changes in the accounts
         archived_ids = set(archived_secrets.keys())
-        current_ids = set(list(self.all_accounts()))
+        current_ids = set(current_secrets.keys())
         new_ids = current_ids - archived_ids
         deleted_ids = archived_ids - current_ids
         if new_ids:
@@ -339,11 +545,8 @@ class PasswordGenerator:
         accounts_with_password_diffs = []
         accounts_with_question_diffs = []
         for account_id in self.all_accounts():
-            questions = []
-            account = self.get_account(account_id, quiet=True)
-            password = self.generate_password(account)
-            for i in account.get_security_questions():
-                questions += [list(self.generate_answer(i, account))]
+            password = current_secrets[account_id]['password']
+            questions = current_secrets[account_id]['questions']
             if account_id in archived_secrets:
                 # check that password is unchanged
                 if password != archived_secrets[account_id]['password']:
@@ -401,7 +604,8 @@ class PasswordGenerator:
         """
         Archive secrets
 
-        Save all secrets to the archive file.
+        Save all secrets to the archive, along with their digests.  Only the 
+        shards of the archive whose accounts have changed are rewritten.
         """
         self.logger.log("Archive secrets.")
         try:
@@ -413,34 +617,50 @@ class PasswordGenerator:
         # Loop through accounts saving passwords and questions
         all_secrets = {}
         for account_id in self.all_accounts():
-            questions = []
-            account = self.get_account(account_id, quiet=True)
-            password = self.generate_password(account)
+            all_secrets[account_id] = self._get_secrets(account_id)
             self.logger.debug("    Saving password.")
-            for question in account.get_security_questions():
-                # convert the result to a list rather than leaving it a tuple
-                # because tuples are formatted oddly in yaml
-                questions += [list(self.generate_answer(question, account))]
+            for question, answer in all_secrets[account_id]['questions']:
                 self.logger.debug(
                     "    Saving question (%s) and its answer." % question)
-            all_secrets[account_id] = {
-                'password': password,
-                'questions': questions
-            }
-
-        # Convert results to yaml archive
-        unencrypted_secrets = yaml.dump(all_secrets)
 
-        # Encrypt and save yaml archive
-        gpg_id = self.accounts.get_gpg_id()
-        encrypted_secrets = self.gpg.encrypt(unencrypted_secrets, gpg_id)
+        # Find the shards that have changed
         filename = expand_path(self.accounts.get_archive_file())
-        try:
-            with open(filename, 'w') as f:
-                f.write(str(encrypted_secrets))
-            os.chmod(filename, 0o600)
-        except IOError as err:
-            self.logger.error('%s: %s.' % (err.filename, err.strerror))
+        digests = _ArchiveDigests(
+            get_digests_path(filename),
+            self.master_password.get_archive_key(),
+            self.logger)
+        digests.load()
+        changed = digests.update(all_secrets)
+        archive = _ShardedArchive(filename, self.gpg, self.logger)
+        archive.create()
+        members = {}
+        for account_id in all_secrets:
+            members.setdefault(
+                digests.get_shard(account_id), []).append(account_id)
+        for shard, account_ids in members.items():
+            if shard not in changed and not archive.has_shard(shard):
+                changed[shard] = sorted(account_ids)
+        for shard in archive.get_shards():
+            # remove stale shards, such as those left by another master password
+            if shard not in members:
+                changed[shard] = []
+
+        # Convert each changed shard to yaml, encrypt it and save it
+        gpg_id = self.accounts.get_gpg_id()
+        for shard, account_ids in sorted(changed.items()):
+            if account_ids:
+                unencrypted_secrets = yaml.dump(dict(
+                    (account_id, all_secrets[account_id])
+                    for account_id in account_ids))
+            else:
+                unencrypted_secrets = None
+            archive.write_shard(shard, unencrypted_secrets, gpg_id)
+        self.logger.log("Rewrote %d of %d archive shards." % (
+            len(changed), digests.NUM_SHARDS))
+        archive.retire()
+
+        # Save the digests
+        digests.save()
 
     def avendesora_archive(self):
         """
@@ -450,8 +670,8 @@ class PasswordGenerator:
         """
         from binascii import b2a_base64, Error as BinasciiError
         self.logger.log("Archive secrets.")
-        source_files = set()
         dest_files = {}
+            # maps each destination file to its source and accounts
         gpg_ids = {}
         avendesora_dir = make_path(self.settings_dir, 'avendesora')
         mkdir(avendesora_dir)
@@ -489,17 +709,10 @@ class PasswordGenerator:
                 text = '_' + text
             return text
 
-        # Loop through accounts saving passwords and questions
-        all_secrets = {}
-        for account_id in self.all_accounts():
-            account = self.get_account(account_id, quiet=True)
-            data = account.__dict__['data']
-            ID = account.__dict__['ID']
-            #aliases = data.get('aliases', [])
-            #if set([ID] + aliases) & do_not_export:
-            if ID in do_not_export:
-                print('skipping', ID)
-                continue
+        def export_account(account):
+            # Returns the account translated to an Avendesora account.
+            data = account.get_data()
+            ID = account.get_id()
             class_name = make_camel_case(ID)
             output = [
                 'class %s(Account): # %s' % (class_name, '{''{''{1')
@@ -507,37 +720,6 @@ class PasswordGenerator:
             # TODO -- must make ID a valid class name: convert xxx-xxx to camelcase
             self.logger.debug("    Saving %s account." % ID)
 
-            try:
-                source_filepath = data['_source_file_']
-                dest_filepath = make_path(
-                    avendesora_dir, rel_path(source_filepath, self.settings_dir)
-                )
-                if source_filepath not in source_files:
-                    source_files.add(source_filepath)
-
-                    # get recipient ids from existing file
-                    if get_extension(source_filepath) in ['gpg', 'asc']:
-                        try:
-                            gpg = Execute(
-                                ['gpg', '--list-packets', source_filepath],
-                                stdout=True, wait=True
-                            )
-                            gpg_ids[dest_filepath] = []
-                            for line in gpg.stdout.split('\n'):
-                                if line.startswith(':pubkey enc packet:'):
-                                    words = line.split()
-                                    assert words[7] == 'keyid'
-                                    gpg_ids[dest_filepath].append(words[8])
-                        except ExecuteError as err:
-                            print(str(err))
-                    else:
-                        gpg_ids[dest_filepath] = None
-                    dest_files[dest_filepath] = {None: header % source_filepath}
-            except KeyError:
-                raise AssertionError('%s: SOURCE FILE MISSING.' % ID)
-            except IOError as err:
-                self.logger.error('%s: %s.' % (err.filename, err.strerror))
-
             output.append("    NAME = %r" % ID)
             password = self.generate_password(account)
             output.append("    passcode = Hidden(%r)" % b2a_base64(
@@ -613,42 +795,124 @@ class PasswordGenerator:
 
             output.append('')
             output.append('')
-            dest_files[dest_filepath][ID] = '\n'.join(output)
+            return '\n'.join(output)
+
+        # Group the accounts by the file they are exported to
+        for account_id in self.all_accounts():
+            account = self.lookup_account(account_id, quiet=True)
+            data = account.get_data()
+            ID = account.get_id()
+            #aliases = data.get('aliases', [])
+            #if set([ID] + aliases) & do_not_export:
+            if ID in do_not_export:
+                self.logger.display('%s: not exported.' % ID)
+                continue
+            try:
+                source_filepath = data['_source_file_']
+            except KeyError:
+                raise AssertionError('%s: SOURCE FILE MISSING.' % ID)
+            dest_filepath = make_path(
+                avendesora_dir, rel_path(source_filepath, self.settings_dir)
+            )
+            if dest_filepath not in dest_files:
+                dest_files[dest_filepath] = {
+                    'source': source_filepath, 'accounts': [], 'sources': set()
+                }
+            dest_files[dest_filepath]['accounts'].append(account)
+            # the files that hold the account and its templates
+            dest_files[dest_filepath]['sources'].update(
+                each['_source_file_'] for each in data.maps
+                if '_source_file_' in each
+            )
 
+        # Everything else that affects the contents of the files
+        gpg_id = self.accounts.get_gpg_id()
+        inputs = {
+            'master': [
+                [path, get_stamp(path)]
+                for path in self.master_password.sources
+            ],
+            'dictionary': self.dictionary.hash,
+            'signatures': [SECRETS_SHA1, CHARSETS_SHA1],
+            'version': VERSION,
+            'gpg_id': gpg_id,
+            'do_not_export': sorted(do_not_export),
+        }
+        archive_key = self.master_password.get_archive_key()
+        manifest = _ExportManifest(
+            make_path(self.settings_dir, EXPORT_MANIFEST_FILENAME),
+            derive_key(archive_key, 'abraxas export') if archive_key else None,
+            self.logger)
+        manifest.load()
 
         # This version uses default gpg id to encrypt files.
         # Could also take gpg ids from actual files.
-        # The gpg ids are gathered from files above, but code to use them is
+        # The gpg ids are gathered from files below, but code to use them is
         # currently commented out.
-        for filepath, accounts in dest_files.items():
+        written = skipped = 0
+        for filepath, export in sorted(dest_files.items()):
+            source_filepath = export['source']
+            account_ids = [account.get_id() for account in export['accounts']]
+            if get_extension(filepath) not in ['gpg', 'asc']:
+                filepath += '.gpg'
+            if manifest.is_current(
+                filepath, export['sources'], account_ids, inputs
+            ):
+                self.logger.log('%s: unchanged, skipped.' % filepath)
+                skipped += 1
+                continue
             try:
-                header = accounts.pop(None)
+                # get recipient ids from existing file
+                if get_extension(source_filepath) in ['gpg', 'asc']:
+                    try:
+                        gpg = Execute(
+                            ['gpg', '--list-packets', source_filepath],
+                            stdout=True, wait=True
+                        )
+                        gpg_ids[filepath] = []
+                        for line in gpg.stdout.split('\n'):
+                            if line.startswith(':pubkey enc packet:'):
+                                words = line.split()
+                                assert words[7] == 'keyid'
+                                gpg_ids[filepath].append(words[8])
+                    except ExecuteError as err:
+                        self.logger.log(str(err))
+                else:
+                    gpg_ids[filepath] = None
+
+                accounts = dict(
+                    (account.get_id(), export_account(account))
+                    for account in export['accounts']
+                )
                 contents = '\n'.join(
-                    [header] + [accounts[k] for k in sorted(accounts)]
+                    [header % source_filepath] +
+                    [accounts[k] for k in sorted(accounts)]
                 )
                 mkdir(get_head(filepath))
                 os.chmod(get_head(filepath), 0o700)
-                print('%s: writing.' % filepath)
+                self.logger.display('%s: writing.' % filepath)
                 # encrypt all files with default gpg ID
                 #if gpg_ids[filepath]:
                 #    gpg_id = gpg_ids[filepath]
-                if True:
-                    if get_extension(filepath) not in ['gpg', 'asc']:
-                        filepath += '.gpg'
-                    gpg_id = self.accounts.get_gpg_id()
-                    encrypted = self.gpg.encrypt(
-                        contents, gpg_id, always_trust=True, armor=True
-                    )
-                    if not encrypted.ok:
-                        self.logger.error(
-                            "%s: unable to encrypt.\n%s" % (
-                                filename, encrypted.stderr))
-                    contents = str(encrypted)
+                encrypted = self.gpg.encrypt(
+                    contents, gpg_id, always_trust=True, armor=True
+                )
+                if not encrypted.ok:
+                    self.logger.error(
+                        "%s: unable to encrypt.\n%s" % (
+                            filepath, encrypted.stderr))
+                contents = str(encrypted)
                 with open(filepath, 'w') as f:
                     f.write(contents)
                     os.chmod(filepath, 0o600)
             except IOError as err:
                 self.logger.error('%s: %s.' % (err.filename, err.strerror))
+            manifest.record(filepath, export['sources'], account_ids, inputs)
+            written += 1
+        manifest.save()
+        self.logger.display(
+            "%d files written, %d unchanged files skipped." % (
+                written, skipped))
 
 
 class PasswordError(Exception):
@@ -21,7 +21,7 @@
 # Imports (fold)
 from __future__ import print_function, division
 from fileutils import expandPath as expand_path, getExt as get_extension
-from fileutils import Execute, ExecuteError
+from fileutils import Spawner, ExecuteError
 from abraxas.prefs import DEBUG, NOTIFIER_NORMAL, NOTIFIER_ERROR
 import sys
 import os
@@ -50,7 +50,9 @@ class Logging:
         prog_name (string)
             Program name, pre-pended to error messages.
         use_notifier (bool)
-            Send messages to notifier rather than stdout.
+            Send messages to notifier rather than stdout. The messages are
+            batched up and sent as a single notification, in the background,
+            when the logger terminates (or when an error occurs).
         output_callback (function)
             This function will be called with any normal output. It takes a
             single argument, a string, that contains the message. If not
@@ -75,6 +77,13 @@ class Logging:
         self.output_callback = output_callback
         self.exception = exception
         self.cache = []
+        self.notifications = []
+        self.timings = None
+        self.spawner = Spawner(
+            onFailure=lambda cmd, status: sys.stderr.write(
+                'Failed to run notifier: unexpected exit status (%d).\n' % (
+                    status))
+        ) if use_notifier else None
         if not argv:
             argv = sys.argv
         if argv:
@@ -109,16 +118,20 @@ class Logging:
         self.gpg = gpg
         self.gpg_id = gpg_id
 
+    def set_timings(self, timings):
+        """
+        Specify the phase timer (see abraxas.timing) whose summary is to be
+        added to the log upon termination.
+        """
+        self.timings = timings
+
     def display(self, msg):
         """Display the message on standard out and log it."""
         self.log(msg)
         if self.output_callback:
             self.output_callback(msg)
         elif self.use_notifier and NOTIFIER_NORMAL:
-            try:
-                Execute(NOTIFIER_NORMAL + [msg])
-            except ExecuteError as err:
-                self.error('Failed to run notifier: %s' % str(err))
+            self.notifications.append(msg)
         else:
             print(msg)
 
@@ -144,12 +157,27 @@ class Logging:
         else:
             msg = [self.prog_name, msg] if self.prog_name else [msg]
             if self.use_notifier and NOTIFIER_ERROR:
-                try:
-                    Execute(NOTIFIER_ERROR + msg)
-                except ExecuteError as err:
-                    sys.exit('Failed to run notifier: %s' % str(err))
+                # include any pending messages as they provide context
+                self.notifications.append(': '.join(msg))
+                self.notify(NOTIFIER_ERROR)
             sys.exit(': '.join(msg))
 
+    def notify(self, notifier=None):
+        """Send the pending messages to the notifier as one notification.
+
+        The notifier runs in the background. It is given a few seconds to
+        finish when the program exits.
+        """
+        if not self.notifications:
+            return
+        msg = '\n'.join(self.notifications)
+        self.notifications = []
+        try:
+            self.spawner.run((notifier or NOTIFIER_NORMAL) + [msg])
+        except ExecuteError as err:
+            sys.stderr.write('Failed to run notifier: %s\n' % str(err))
+            print(msg)
+
     def terminate(self):
         """Normal termination.
 
@@ -157,9 +185,13 @@ class Logging:
         called, execution never returns to the calling program.
         """
         self.log('Terminates normally.')
+        self.notify()
         sys.exit()
 
     def _terminate(self):
+        self.notify()
+        if self.timings:
+            self.log(self.timings.summary())
         if not self.logfile:
             return
         contents = '\n'.join(self.cache) + '\n'
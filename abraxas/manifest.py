@@ -0,0 +1,310 @@
+# Abraxas Manifest
+#
+# Records which of a set of source files defines each name, so that only the
+# files that are actually needed have to be decrypted.
+#
+# Copyright (C) 2013-14 Kenneth S. Kundert and Kale Kundert
+
+# License (fold)
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+
+# Imports (fold)
+from __future__ import print_function, division
+import hashlib
+import hmac
+import json
+import os
+
+
+def get_stamp(path):
+    """
+    Return the stamp of a file (its modification time and size), or None if 
+    it does not exist.
+    """
+    try:
+        status = os.stat(path)
+    except OSError:
+        return None
+    return [
+        getattr(status, 'st_mtime_ns', int(status.st_mtime * 1e9)),
+        status.st_size
+    ]
+
+
+def derive_key(secret, purpose):
+    """
+    Derive a key from secret material (bytes) that is only used for purpose.
+    """
+    return hmac.new(secret, purpose.encode('utf-8'), hashlib.sha256).digest()
+
+
+class _Manifest:
+    """
+    Abraxas Manifest
+
+    Maps names (account IDs, aliases, hosts, master password IDs, etc.) to
+    the source files that must be loaded to resolve them.  The names are
+    stored as keyed HMACs, so the manifest does not reveal them to anyone who
+    does not hold the key, and the manifest as a whole is protected by a MAC
+    computed with the same key.
+
+    Along with the names, the manifest holds a stamp (modification time and
+    size) for each of the source files.  The manifest is only used if it was
+    written with the same key for the same sources and none of the stamps
+    have changed, otherwise the owner is expected to load all the sources and
+    rebuild it.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path, key, sources, logger):
+        """
+        Arguments:
+        path (string)
+            Path to the manifest file.
+        key (bytes)
+            Key used for the HMACs.
+        sources (list of strings)
+            Paths to the source files.
+        logger (logger object)
+            Used to log whether the manifest is used or rebuilt.
+        """
+        self.path = path
+        self.key = key
+        self.sources = list(sources)
+        self.positions = dict(
+            (source, index) for index, source in enumerate(self.sources))
+        self.logger = logger
+        self.entries = {}
+        self.groups = {}
+
+    def _digest(self, kind, name):
+        message = '%s\0%s' % (kind, name)
+        return hmac.new(
+            self.key, message.encode('utf-8'), hashlib.sha256
+        ).hexdigest()[:32]
+
+    def _mac(self, body):
+        return hmac.new(
+            self.key, json.dumps(body, sort_keys=True).encode('utf-8'),
+            hashlib.sha256
+        ).hexdigest()
+
+    def load(self):
+        """
+        Read the manifest.
+
+        Returns true if the manifest is current and can be used.
+        """
+        try:
+            with open(self.path) as f:
+                manifest = json.load(f)
+            body = manifest['body']
+            if not hmac.compare_digest(
+                str(manifest['mac']), self._mac(body)
+            ):
+                self.logger.log('%s: stale key, ignored.' % self.path)
+                return False
+            if body['version'] != self.VERSION:
+                return False
+            if body['sources'] != [
+                [source, get_stamp(source)] for source in self.sources
+            ]:
+                self.logger.log('%s: sources have changed.' % self.path)
+                return False
+            self.entries = body['entries']
+            self.groups = body['groups']
+        except (IOError, ValueError, KeyError, TypeError):
+            return False
+        self.logger.log('Using %s.' % self.path)
+        return True
+
+    def save(self):
+        """
+        Write the manifest.
+
+        The manifest is only an optimization, so failures are logged and
+        otherwise ignored.
+        """
+        body = {
+            'version': self.VERSION,
+            'sources': [
+                [source, get_stamp(source)] for source in self.sources
+            ],
+            'entries': self.entries,
+            'groups': self.groups,
+        }
+        manifest = {'body': body, 'mac': self._mac(body)}
+        temp = self.path + '.new'
+        try:
+            with open(temp, 'w') as f:
+                json.dump(manifest, f, sort_keys=True)
+            os.chmod(temp, 0o600)
+            os.rename(temp, self.path)
+            self.logger.log('Wrote %s.' % self.path)
+        except (IOError, OSError) as err:
+            self.logger.log('%s: %s.' % (err.filename, err.strerror))
+
+    def clear(self):
+        """Forget all names and groups."""
+        self.entries = {}
+        self.groups = {}
+
+    def _indices(self, paths):
+        return set(self.positions[path] for path in paths)
+
+    def add(self, kind, name, paths):
+        """Record that the given source files are needed to resolve name."""
+        digest = self._digest(kind, name)
+        indices = self._indices(paths).union(self.entries.get(digest, []))
+        self.entries[digest] = sorted(indices)
+
+    def add_to_group(self, group, paths):
+        """Record that the given source files are members of group."""
+        indices = self._indices(paths).union(self.groups.get(group, []))
+        self.groups[group] = sorted(indices)
+
+    def lookup(self, kind, name):
+        """
+        Return the source files needed to resolve name, or None if the name
+        is not known.
+        """
+        indices = self.entries.get(self._digest(kind, name))
+        if indices is None:
+            return None
+        return [self.sources[index] for index in indices]
+
+    def get_group(self, group):
+        """Return the source files that are members of group."""
+        return [self.sources[index] for index in self.groups.get(group, [])]
+
+
+class _ExportManifest:
+    """
+    Abraxas Export Manifest
+
+    Records what each file written by 'abraxas --export' was made from: the
+    stamps of the accounts files that hold its accounts and their templates,
+    and a keyed digest of the IDs of its accounts along with everything else
+    that affects its contents (the master password files, the dictionary,
+    the version of Abraxas, etc.).  It also records the SHA1 hash of the file
+    as written.  A file whose record still matches need not be regenerated.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path, key, logger):
+        """
+        Arguments:
+        path (string)
+            Path to the manifest file.
+        key (bytes)
+            Key used for the digests, None if there is no key (the manifest is
+            then neither read nor written, and every file is regenerated).
+        logger (logger object)
+            Used to log whether the manifest is used.
+        """
+        self.path = path
+        self.key = key
+        self.logger = logger
+        self.entries = {}
+
+    def _digest(self, values):
+        return hmac.new(
+            self.key, json.dumps(values, sort_keys=True).encode('utf-8'),
+            hashlib.sha256
+        ).hexdigest()
+
+    @staticmethod
+    def _hash(path):
+        try:
+            with open(path, 'rb') as f:
+                return hashlib.sha1(f.read()).hexdigest()
+        except IOError:
+            return None
+
+    def _entry(self, sources, account_ids, inputs):
+        return {
+            'sources': [
+                [source, get_stamp(source)] for source in sorted(sources)
+            ],
+            'accounts': self._digest([sorted(account_ids), inputs]),
+        }
+
+    def load(self):
+        """Read the manifest, returns true if it can be used."""
+        if not self.key:
+            return False
+        try:
+            with open(self.path) as f:
+                manifest = json.load(f)
+            if manifest['version'] != self.VERSION:
+                return False
+            if not hmac.compare_digest(
+                str(manifest['check']), self._digest('check')
+            ):
+                return False
+            self.entries = manifest['entries']
+        except (IOError, ValueError, KeyError, TypeError):
+            return False
+        self.logger.log('Using %s.' % self.path)
+        return True
+
+    def save(self):
+        """
+        Write the manifest.
+
+        The manifest is only an optimization, so failures are logged and
+        otherwise ignored.
+        """
+        if not self.key:
+            return
+        manifest = {
+            'version': self.VERSION,
+            'check': self._digest('check'),
+            'entries': self.entries,
+        }
+        temp = self.path + '.new'
+        try:
+            with open(temp, 'w') as f:
+                json.dump(manifest, f, sort_keys=True)
+            os.chmod(temp, 0o600)
+            os.rename(temp, self.path)
+            self.logger.log('Wrote %s.' % self.path)
+        except (IOError, OSError) as err:
+            self.logger.log('%s: %s.' % (err.filename, err.strerror))
+
+    def is_current(self, dest, sources, account_ids, inputs):
+        """
+        Return true if dest was made from the given accounts files and 
+        accounts with the given inputs and has not changed since.
+        """
+        entry = self.entries.get(dest)
+        if not entry or not self.key:
+            return False
+        current = self._entry(sources, account_ids, inputs)
+        return (
+            entry['sources'] == current['sources'] and
+            entry['accounts'] == current['accounts'] and
+            entry['hash'] == self._hash(dest)
+        )
+
+    def record(self, dest, sources, account_ids, inputs):
+        """Record what dest, which has just been written, was made from."""
+        if self.key:
+            entry = self._entry(sources, account_ids, inputs)
+            entry['hash'] = self._hash(dest)
+            self.entries[dest] = entry
+
+# vim: set sw=4 sts=4 et:
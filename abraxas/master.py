@@ -20,20 +20,84 @@
 
 # Imports (fold)
 import abraxas.secrets as secrets
+from binascii import hexlify, unhexlify
 import hashlib
+import json
 from fileutils import (
     makePath as make_path,
     getHead as get_head,
     getExt as get_extension,
 )
 from abraxas.prefs import (
-    DEFAULT_SETTINGS_DIR, MASTER_PASSWORD_FILENAME,
-    DICTIONARY_SHA1, SECRETS_SHA1, CHARSETS_SHA1
+    DEFAULT_SETTINGS_DIR, MASTER_PASSWORD_FILENAME, MASTER_MANIFEST_FILENAME,
+    DICTIONARY_SHA1, SECRETS_SHA1, CHARSETS_SHA1, MASTER_PASSWORD_TTL,
+    EQUIVALENT_SECRETS_SHA1S
 )
+from abraxas.manifest import _Manifest, derive_key
+from abraxas.timing import PhaseTimer
 from textwrap import wrap
 import sys
+import threading
+import time
 import traceback
 
+_now = getattr(time, 'monotonic', time.time)
+
+
+class _PasswordCache:
+    """
+    Master passwords entered by the user
+
+    Keeps the master passwords the user was asked for, keyed by the group of 
+    accounts they apply to, so that operations over many accounts (archive, 
+    changed, export) only ask once per group.  An entry expires ttl seconds 
+    after it was entered (never if ttl is None).  The passwords are held as 
+    bytearrays that are overwritten with zeros when they expire or are 
+    cleared, though copies may remain in strings that were handed out.
+    """
+
+    def __init__(self, ttl=MASTER_PASSWORD_TTL):
+        self.ttl = ttl
+        self.entries = {}
+            # maps key to the password (a bytearray) and the time it expires
+
+    @staticmethod
+    def _zeroize(secret):
+        for index in range(len(secret)):
+            secret[index] = 0
+
+    def get(self, key):
+        """Return the password for key, or None if it is not known."""
+        try:
+            secret, expires = self.entries[key]
+        except KeyError:
+            return None
+        if expires is not None and _now() >= expires:
+            self._zeroize(secret)
+            del self.entries[key]
+            return None
+        secret = bytes(secret)
+        return secret if str is bytes else secret.decode('utf-8')
+
+    def add(self, key, password):
+        """Remember password for key."""
+        if self.ttl == 0:
+            return
+        if key in self.entries:
+            self._zeroize(self.entries[key][0])
+        if type(password) != bytes:
+            password = password.encode('utf-8')
+        self.entries[key] = (
+            bytearray(password),
+            None if self.ttl is None else _now() + self.ttl
+        )
+
+    def clear(self):
+        """Forget all passwords."""
+        for secret, expires in self.entries.values():
+            self._zeroize(secret)
+        self.entries = {}
+
 
 class _MasterPassword:
     """
@@ -41,20 +105,57 @@ class _MasterPassword:
 
     Responsible for reading and managing the data from the master password 
     file.
+
+    The additional master password files are only read when they are needed.  
+    A manifest records which of them define each master password and each 
+    password override, so a password that is in the master password file 
+    itself never causes them to be read, and one that is not only causes the 
+    files that define it to be read.  The manifest is rebuilt whenever any of 
+    the files change.
     """
 
-    def __init__(self, path, dictionary, gpg, logger, stateless):
+    COMPILED_FIELDS = [
+        'accounts', 'passwords', 'default_password', 'password_overrides',
+        'dict_hash', 'secrets_hash', 'charsets_hash'
+    ]
+
+    def __init__(
+        self, path, dictionary, gpg, logger, stateless, timings=None,
+        compiled=None
+    ):
         self.path = path
         self.dictionary = dictionary
         self.gpg = gpg
         self.logger = logger
         self.stateless = stateless
-        self.data = self._read_master_password_file()
+        self.timings = timings if timings else PhaseTimer()
+        self.index_key = None
+            # key for the manifests, derived from the master password file
+        self.sources = [path]
+            # paths to the master password files in the order they are applied
+        self.loaded = {}
+            # maps the path to each file read to its passwords and overrides
+        self.manifest = None
+            # only set while some of the files have not been read
+        self.lock = threading.RLock()
+        self.prompt = True
+            # if false, the user is never asked for a master password
+        self.cache = _PasswordCache()
+            # the master passwords that the user was asked for
+        if compiled:
+            # the files have already been read and merged by the vault
+            self.sources = compiled['sources']
+            self.data = compiled['data']
+            if compiled.get('index_key'):
+                self.index_key = unhexlify(compiled['index_key'])
+        else:
+            self.data = self._read_master_password_file()
         self.passphrase = secrets.Passphrase(
             lambda text: logger.display(text))
         self.password = secrets.Password(
             lambda text: logger.display(text))
-        self._validate_assumptions()
+        with self.timings.phase('validate'):
+            self._validate_assumptions()
 
     def _read_master_password_file(self):
         data = {
@@ -67,13 +168,18 @@ class _MasterPassword:
         if not self.stateless:
             try:
                 with open(self.path, 'rb') as f:
-                    decrypted = self.gpg.decrypt_file(f)
+                    with self.timings.phase('decrypt'):
+                        decrypted = self.gpg.decrypt_file(f)
                     if not decrypted.ok:
                         self.logger.error("%s" %
                             "%s: unable to decrypt." % (self.path),
                         )
-                    code = compile(decrypted.data, self.path, 'exec')
-                    exec(code, data)
+                    self.index_key = derive_key(
+                        decrypted.data, 'abraxas manifest')
+                    with self.timings.phase('compile'):
+                        code = compile(decrypted.data, self.path, 'exec')
+                    with self.timings.phase('exec'):
+                        exec(code, data)
             except IOError as err:
                 self.logger.display(
                     'Warning: could not read master password file %s: %s.' % (
@@ -88,60 +194,139 @@ class _MasterPassword:
                 self.logger.error(
                     '%s: master password ID must be a string.' % ID)
 
-        # Open additional master password files
+        # Find additional master password files
         additional_password_files = data.get(
             'additional_master_password_files', [])
         if type(additional_password_files) == str:
             additional_password_files = [additional_password_files]
-        for each in additional_password_files:
-            more_data = {}
-            path = make_path(get_head(self.path), each)
-            if get_extension(path) in ['gpg', 'asc']:
-                # File is GPG encrypted, decrypt it
-                try:
-                    with open(path, 'rb') as f:
+        self.sources = [self.path] + [
+            make_path(get_head(self.path), each)
+            for each in additional_password_files
+        ]
+        self.loaded[self.path] = {
+            'passwords': dict(data.get('passwords', {})),
+            'password_overrides': dict(data.get('password_overrides', {})),
+        }
+        self.data = data
+
+        # Open the manifest and defer reading the additional files
+        manifest = None
+        if self.index_key:
+            manifest = _Manifest(
+                make_path(get_head(self.path), MASTER_MANIFEST_FILENAME),
+                self.index_key, self.sources, self.logger)
+            with self.timings.phase('manifest'):
+                current = manifest.load()
+            if current:
+                self.manifest = manifest
+                return data
+
+        # Open additional master password files
+        self._load(self.sources[1:])
+        if manifest:
+            with self.timings.phase('manifest'):
+                manifest.clear()
+                for path, more_data in self.loaded.items():
+                    if path == self.path:
+                        # always read
+                        continue
+                    for ID in more_data['passwords']:
+                        manifest.add('password', ID, [path])
+                    for ID in more_data['password_overrides']:
+                        manifest.add('override', ID, [path])
+                manifest.save()
+        return data
+
+    def _read_additional_file(self, path):
+        # Returns the data from an additional master password file.
+        more_data = {}
+        if get_extension(path) in ['gpg', 'asc']:
+            # File is GPG encrypted, decrypt it
+            try:
+                with open(path, 'rb') as f:
+                    with self.timings.phase('decrypt'):
                         decrypted = self.gpg.decrypt_file(f)
-                        if not decrypted.ok:
-                            self.logger.error("%s" %
-                                "%s: unable to decrypt." % (path),
-                            )
-                            continue
+                    if not decrypted.ok:
+                        self.logger.error("%s" %
+                            "%s: unable to decrypt." % (path),
+                        )
+                        return {}
+                    with self.timings.phase('compile'):
                         code = compile(decrypted.data, path, 'exec')
+                    with self.timings.phase('exec'):
                         exec(code, more_data)
-                except IOError as err:
-                    self.logger.display('%s: %s.  Ignored.' % (
-                        err.filename, err.strerror
-                    ))
-                    continue
-            else:
-                self.logger.error(
-                    "%s: must have .gpg or .asc extension" % (path))
-
-            # Check for duplicate master passwords
-            existing_names = set(data.get('passwords', {}).keys())
-            new_passwords = more_data.get('passwords', {})
-            new_names = set(new_passwords.keys())
-            names_in_common = sorted(
-                existing_names.intersection(new_names))
-            if names_in_common:
-                self.logger.display(
-                    "%s: overrides existing password:\n    %s" % (
-                        path, ',\n    '.join(sorted(names_in_common))))
-            data['passwords'].update(new_passwords)
-
-            # Check for duplicate passwords overrides
-            existing_names = set(data['password_overrides'].keys())
-            new_overrides = more_data.get('password_overrides', {})
-            new_names = set(new_overrides.keys())
-            names_in_common = sorted(
-                existing_names.intersection(new_names))
-            if names_in_common:
-                self.logger.display(
-                    "%s: overrides existing password overrides:\n    %s" % (
-                        path, ',\n    '.join(sorted(names_in_common))))
-            data['password_overrides'].update(new_overrides)
+            except IOError as err:
+                self.logger.display('%s: %s.  Ignored.' % (
+                    err.filename, err.strerror
+                ))
+                return {}
+        else:
+            self.logger.error(
+                "%s: must have .gpg or .asc extension" % (path))
+        return more_data
 
-        return data
+    def _load(self, paths):
+        # Reads the given additional master password files, then merges the 
+        # passwords and overrides from all the files read so far, in order, 
+        # so that later files override earlier ones.
+        paths = [path for path in self.sources[1:] if path in paths]
+        if hasattr(self.gpg, 'prefetch'):
+            # allow the files to be decrypted concurrently
+            self.gpg.prefetch([
+                path for path in paths
+                if get_extension(path) in ['gpg', 'asc']
+            ])
+        for path in paths:
+            more_data = self._read_additional_file(path)
+            self.loaded[path] = {
+                'passwords': more_data.get('passwords', {}),
+                'password_overrides': more_data.get('password_overrides', {}),
+            }
+
+        passwords = {}
+        password_overrides = {}
+        for path in self.sources:
+            if path not in self.loaded:
+                continue
+            more_data = self.loaded[path]
+            if path != self.path and not self.manifest:
+                # all the files are read in order, so report duplicates
+                # Check for duplicate master passwords
+                names_in_common = sorted(set(passwords.keys()).intersection(
+                    more_data['passwords'].keys()))
+                if names_in_common:
+                    self.logger.display(
+                        "%s: overrides existing password:\n    %s" % (
+                            path, ',\n    '.join(names_in_common)))
+
+                # Check for duplicate passwords overrides
+                names_in_common = sorted(
+                    set(password_overrides.keys()).intersection(
+                        more_data['password_overrides'].keys()))
+                if names_in_common:
+                    self.logger.display(
+                        "%s: overrides existing password overrides:\n    %s"
+                        % (path, ',\n    '.join(names_in_common)))
+            passwords.update(more_data['passwords'])
+            password_overrides.update(more_data['password_overrides'])
+        self.data['passwords'] = passwords
+        self.data['password_overrides'] = password_overrides
+
+    def _require(self, kind, name):
+        # Reads the additional master password files that define name.
+        with self.lock:
+            if self.manifest:
+                paths = set(self.manifest.lookup(kind, name) or [])
+                paths -= set(self.loaded)
+                if paths:
+                    self._load(paths)
+
+    def _load_all(self):
+        # Reads any additional master password files not yet read.
+        with self.lock:
+            if self.manifest:
+                self._load(set(self.sources) - set(self.loaded))
+                self.manifest = None
 
     def _validate_assumptions(self):
         # Check that dictionary has not changed.
@@ -152,9 +337,9 @@ class _MasterPassword:
         self.dictionary.validate(self.data.get('dict_hash', DICTIONARY_SHA1))
 
         # Check that secrets.py and charset.py have not changed
-        for each, sha1 in [
-            ('secrets', SECRETS_SHA1),
-            ('charsets', CHARSETS_SHA1)
+        for each, sha1, equivalents in [
+            ('secrets', SECRETS_SHA1, EQUIVALENT_SECRETS_SHA1S),
+            ('charsets', CHARSETS_SHA1, [])
         ]:
             path = make_path(get_head(__file__), each + '.py')
             try:
@@ -173,8 +358,13 @@ class _MasterPassword:
             # will exist, and we will compare the current hash for the file 
             # against that stored in the master password file, otherwise we 
             # will compare against the one present when the program was 
-            # configured.
-            if hash != self.data.get('%s_hash' % each, sha1):
+            # configured.  A hash of an earlier version of the file that is 
+            # known to give the same results is accepted if the file is 
+            # unchanged since the program was configured.
+            expected = self.data.get('%s_hash' % each, sha1)
+            if hash == sha1 and expected in equivalents:
+                continue
+            if hash != expected:
                 self.logger.display("Warning: '%s' has changed." % path)
                 self.logger.display("    " + "\n    ".join(wrap(' '.join([
                     "This could result in passwords that are inconsistent",
@@ -195,7 +385,9 @@ class _MasterPassword:
         """Get the master password associated with this account.
 
         If there is none, use the default.
-        If there is no default, ask the user for a password.
+        If there is no default, ask the user for a password.  The password 
+        given is remembered for the other accounts that have no master 
+        password, until it expires from the cache.
         """
         passwords = self._get_field('passwords')
         default_password = self._get_field('default_password')
@@ -206,25 +398,73 @@ class _MasterPassword:
         else:
             password_id = default_password
         if password_id:
+            self._require('password', password_id)
+            passwords = self._get_field('passwords')
             try:
                 return passwords[password_id]
             except KeyError:
                 self.logger.error(
                     '%s: master password not found.' % password_id)
+        elif not self.prompt:
+            self.logger.error(
+                "%s: no master password available." % account.ID)
         else:
-            import getpass
-            try:
-                self.logger.display(
-                    "Provide master password for account '%s'." % account.ID)
-                master_password = getpass.getpass()
-                if not master_password:
-                    self.logger.display("Warning: Master password is empty.")
-                return master_password
-            except (EOFError, KeyboardInterrupt):
-                sys.exit()
+            # held while asking so that concurrent callers only ask once
+            with self.lock:
+                master_password = self.cache.get(None)
+                if master_password is not None:
+                    return master_password
+                import getpass
+                try:
+                    self.logger.display(
+                        "Provide master password for account '%s'." % (
+                            account.ID))
+                    master_password = getpass.getpass()
+                    if not master_password:
+                        self.logger.display(
+                            "Warning: Master password is empty.")
+                    self.cache.add(None, master_password)
+                    return master_password
+                except (EOFError, KeyboardInterrupt):
+                    sys.exit()
+
+    def forget_master_passwords(self):
+        """Forget any master passwords that the user was asked for."""
+        self.cache.clear()
+
+    def get_compiled(self):
+        """
+        Return the merged contents of the files, for the vault, along with the 
+        key for the manifests and the title cache.
+        """
+        self._load_all()
+        return {
+            'sources': self.sources,
+            'index_key': (
+                hexlify(self.index_key).decode('ascii')
+                if self.index_key else None
+            ),
+            'data': dict(
+                (key, self.data[key])
+                for key in self.COMPILED_FIELDS if key in self.data
+            ),
+        }
+
+    def get_archive_key(self):
+        """
+        Return the key for the archive digests, derived from the master 
+        passwords, or None if there are no master passwords.
+        """
+        self._load_all()
+        passwords = self._get_field('passwords')
+        if not passwords:
+            return None
+        material = json.dumps(sorted(passwords.items()))
+        return derive_key(material.encode('utf-8'), 'abraxas archive')
 
     def password_names(self):
         """Return a list that contains the name of the master passwords."""
+        self._load_all()
         return self._get_field('passwords').keys()
 
     def generate_password(self, account, master_password=None):
@@ -233,6 +473,7 @@ class _MasterPassword:
         Generally you should not need to pass in the master_password. This is
         only done for testing the stateless password generation.
         """
+        self._require('override', account.get_id())
         try:
             return self.data['password_overrides'][account.get_id()]
         except KeyError:
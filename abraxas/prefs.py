@@ -25,12 +25,25 @@ import re
 # Filenames (folds)
 DEFAULT_SETTINGS_DIR = '~/.config/abraxas'
 MASTER_PASSWORD_FILENAME = 'master.gpg'
+MASTER_MANIFEST_FILENAME = 'master.manifest'
+    # records which master password file holds each password
 DEFAULT_ACCOUNTS_FILENAME = 'accounts'
     # accounts file will be encrypted if you add .gpg or .asc extension
 DICTIONARY_FILENAME = 'words'
 DEFAULT_LOG_FILENAME = 'log'
     # log file will be encrypted if you add .gpg or .asc extension
 DEFAULT_ARCHIVE_FILENAME = 'archive.gpg'
+ACCOUNTS_MANIFEST_FILENAME = 'accounts.manifest'
+    # records which accounts file holds each account, kept with accounts file
+TITLE_CACHE_FILENAME = 'titles.cache'
+    # records the account selected for each window title, kept with accounts
+    # file
+VAULT_FILENAME = 'vault.gpg'
+    # compiled master password and accounts files, created by --compile
+EXPORT_MANIFEST_FILENAME = 'avendesora.manifest'
+    # records what each file written by --export was made from
+AEAD_KEY_FILENAME = 'aead-key.gpg'
+    # key used by the in-process encryption backend, encrypted with gpg
 
 
 # Defaults (folds)
@@ -48,6 +61,19 @@ LABEL_STYLE = 'normal'
     # invisible (these need to be implemented by underlying terminal, and some
     # are not (such a blink and dim)
 INITIAL_AUTOTYPE_DELAY = 0.0
+CRYPTO_BACKEND = 'gpg'
+    # Use 'gpg' to have gpg encrypt and decrypt the vault and log file, or
+    # 'aead' to do so in-process with a key that gpg unlocks once per session
+    # (requires the python cryptography package).  Files that were encrypted
+    # by gpg can still be read with 'aead'.  The settings files, archive and
+    # Avendesora files are always encrypted with gpg.
+TITLE_CACHE_SIZE = 64
+    # The number of window titles for which the selected account is
+    # remembered (use 0 to always search the accounts).
+MASTER_PASSWORD_TTL = 900
+    # A master password that you were asked for is remembered for this many
+    # seconds (use None to remember it until the program exits, 0 to never
+    # remember it).
 DEBUG = False
     # Turns on the logging of extra information, but may expose sensitive
     # account information in the log file.
@@ -61,6 +87,11 @@ PREFER_HTTPS = True
 # Utility programs (folds)
 XDOTOOL = '/usr/bin/xdotool'
 XSEL = '/usr/bin/xsel'
+TITLE_PROVIDER = 'x11'
+    # Use 'x11' to ask the X server for the title of the active window, with
+    # xdotool used if that fails, or 'xdotool' to always use xdotool.
+XCLIP = '/usr/bin/xclip'
+    # xclip is only needed for queued clipboard pastes (--queue)
 GPG_BINARY = 'gpg2'
 NOTIFIER_NORMAL = ['notify-send', '--urgency=low']
 NOTIFIER_ERROR = ['notify-send', '--urgency=normal']
@@ -69,7 +100,12 @@ NOTIFIER_ERROR = ['notify-send', '--urgency=normal']
 # These signatures must be the sha1 signatures for the corresponding files
 # Regenerate them with 'sha1sum <filename>'
 # These are used in creating the initial master password file.
-SECRETS_SHA1 = "5d1c97a0fb699241fca5d50a7ad0508047990510"
+SECRETS_SHA1 = "effe2e246c74266a874e2ca3b551bd815f27d3ee"
+EQUIVALENT_SECRETS_SHA1S = [
+    "5d1c97a0fb699241fca5d50a7ad0508047990510",  # 1.8
+]
+    # earlier versions of secrets.py that generate exactly the same secrets,
+    # a master password file that records one of these need not be updated
 CHARSETS_SHA1 = "dab48b2103ebde97f78cfebd15cc1e66d6af6ed0"
 DICTIONARY_SHA1 = "d9aa1c08e08d6cacdf82819eeb5832429eadb95a"
 
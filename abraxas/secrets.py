@@ -2,6 +2,7 @@
 
 import hashlib
 import string
+import struct
 
 # Globals {{{1
 DEFAULT_PASSPHRASE_LENGTH = 4
@@ -10,19 +11,25 @@ DEFAULT_SEPARATOR = ' '
 DEFAULT_ALPHABET = string.ascii_letters + string.digits
 
 # Utilities {{{1
-# Partition a string into chunks, each of chars_per_chunk characters, and return
-# them one at a time until either the string is exhausted or num_chars have been
-# returned.  In this case, the string consists of hexadecimal characters (0-9,
-# a-f), and so each chunk can be treated as a hexadecimal number or
-# chars_per_chunk digits.
-def _partition(hexstr, chars_per_chunk, num_chunks):
-    max_chars = len(hexstr)
-    for index in range(num_chunks):
-        start = index*chars_per_chunk
-        end = (index + 1)*chars_per_chunk
-        if end > max_chars:
-            break
-        yield hexstr[start:end]
+# Return the table used to map each byte of the digest to a character of the
+# alphabet: entry i is the character alphabet[i % len(alphabet)].  The table
+# is bytes, for use with translate, if every character of the alphabet fits
+# in a byte, otherwise it is a tuple of characters.  The tables are cached by
+# alphabet.
+_alphabet_tables = {}
+def _alphabet_table(alphabet):
+    try:
+        return _alphabet_tables[alphabet]
+    except KeyError:
+        pass
+    chars = tuple(alphabet[index % len(alphabet)] for index in range(256))
+    try:
+        table = bytes(bytearray(ord(char) for char in chars))
+    except ValueError:
+        # alphabet contains characters beyond latin-1
+        table = chars
+    _alphabet_tables[alphabet] = table
+    return table
 
 # Pass phrase class {{{1
 # Reads a dictionary and generates a pass phrase using those words.
@@ -47,22 +54,21 @@ class Passphrase():
         key += account.get_version()
         key += account.get_id()
         key += master_password
-        digest = hashlib.sha512((key).encode('utf-8')).hexdigest()
+        digest = hashlib.sha512((key).encode('utf-8')).digest()
         length = account.get_num_words(DEFAULT_PASSPHRASE_LENGTH)
         separator = account.get_separator(DEFAULT_SEPARATOR)
         words = dictionary.get_words()
 
         # Generate pass phrase
-        phrase = []
         self.check_length(words, 16)
-        for chunk in _partition(digest, 4, length):
-            # chunk is a string that contains 4 hexadecimal digits (the
-            # characters '0'-'9' and 'a'-'f').  It is converted into an integer
-            # between 0 and 65535 that is then used as an index to choose a
-            # word from the dictionary.
-            index = int(chunk, 16) % len(words)
-            phrase += [words[index]]
-        passphrase = separator.join(phrase)
+        # Each word is chosen by a 16 bit chunk of the digest, taken as a
+        # big-endian integer between 0 and 65535 and used as an index into the
+        # dictionary.  The digest holds at most 32 such chunks.
+        length = min(max(length, 0), len(digest)//2)
+        indices = struct.unpack('>%dH' % length, digest[:2*length])
+        num_words = len(words)
+        passphrase = separator.join(
+            [words[index % num_words] for index in indices])
         return account.get_prefix() + passphrase + account.get_suffix()
 
 # Password class {{{1
@@ -87,18 +93,21 @@ class Password():
         key += account.get_version()
         key += account.get_id()
         key += master_password
-        digest = hashlib.sha512((key).encode('utf-8')).hexdigest()
+        digest = hashlib.sha512((key).encode('utf-8')).digest()
         length = account.get_num_chars(DEFAULT_PASSWORD_LENGTH)
 
         # Generate password
-        password = ''
         alphabet = account.get_alphabet(DEFAULT_ALPHABET)
         self.check_length(alphabet, 8)
-        for chunk in _partition(digest, 2, length):
-            # chunk is a string that contains 2 hexadecimal digits (the
-            # characters '0'-'9' and 'a'-'f').  It is converted into an integer
-            # between 0 and 255 that is then used as an index to choose a
-            # word from the alphabet.
-            index = int(chunk, 16) % len(alphabet)
-            password += alphabet[index]
+        # Each character is chosen by a byte of the digest, an integer between
+        # 0 and 255 that is used as an index into the alphabet.  The table
+        # holds the character chosen by each possible byte.
+        chunk = digest[:max(length, 0)]
+        table = _alphabet_table(alphabet)
+        if type(table) == bytes:
+            password = chunk.translate(table)
+            if str is not bytes:
+                password = password.decode('latin-1')
+        else:
+            password = ''.join([table[index] for index in bytearray(chunk)])
         return (account.get_prefix() + password + account.get_suffix())
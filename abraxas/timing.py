@@ -0,0 +1,163 @@
+# Abraxas Timing
+#
+# Measures how long the various phases of a run take.
+#
+# Copyright (C) 2013-14 Kenneth S. Kundert and Kale Kundert
+
+# License (fold)
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+
+# Imports (fold)
+from __future__ import print_function, division
+from contextlib import contextmanager
+from collections import OrderedDict
+from fileutils import getExt as get_extension
+import sys
+import threading
+import time
+try:
+    now = time.monotonic_ns
+except AttributeError:
+    # python2
+    now = lambda: int(time.time()*1e9)
+
+
+class PhaseTimer:
+    """
+    Phase Timer
+
+    Accumulates the time spent in each phase of a run.  Phases nest, so a phase
+    is identified by its path: the names of the phase and of the phases that
+    enclose it.  Use as follows:
+
+        with timings.phase('read accounts'):
+            with timings.phase('decrypt'):
+                ...
+
+    Times are measured with a monotonic clock in nanoseconds.  A phase that is
+    entered repeatedly accumulates both its time and the number of times it was
+    entered.
+
+    A timer may be shared by several threads.  Each thread nests its phases 
+    independently and the times from all threads are accumulated together.
+    """
+
+    def __init__(self):
+        self.phases = OrderedDict()
+            # maps path to [number of times entered, total time in ns]
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    @property
+    def stack(self):
+        # the names of the phases the current thread is in
+        try:
+            return self.local.stack
+        except AttributeError:
+            self.local.stack = []
+            return self.local.stack
+
+    @contextmanager
+    def phase(self, name):
+        """Time the enclosed code as a phase called name."""
+        stack = self.stack
+        stack.append(name)
+        path = tuple(stack)
+        with self.lock:
+            totals = self.phases.setdefault(path, [0, 0])
+        start = now()
+        try:
+            yield
+        finally:
+            elapsed = now() - start
+            stack.pop()
+            with self.lock:
+                totals[0] += 1
+                totals[1] += elapsed
+
+    def total(self, *path):
+        """Return the total time spent in a phase in nanoseconds."""
+        return self.phases.get(path, [0, 0])[1]
+
+    def self_times(self):
+        """
+        Iterate through the phases giving the time spent in each phase that
+        is not accounted for by the phases nested within it.
+        """
+        with self.lock:
+            phases = list(self.phases.items())
+        for path, (count, total) in phases:
+            nested = sum(
+                child[1] for each, child in phases
+                if len(each) == len(path) + 1 and each[:-1] == path
+            )
+            yield path, max(total - nested, 0)
+
+    def summary(self):
+        """Return a human readable summary of the timings."""
+        lines = ['Timings:']
+        with self.lock:
+            phases = list(self.phases.items())
+        for path, (count, total) in phases:
+            lines.append('%s%s: %.3f ms%s' % (
+                '    '*len(path), path[-1], total/1e6,
+                ' (%d times)' % count if count > 1 else ''
+            ))
+        return '\n'.join(lines)
+
+    def collapsed(self):
+        """
+        Return the timings as collapsed stacks.
+
+        Each line gives the path, separated by semicolons, followed by the time
+        in microseconds, which is the format consumed by flamegraph.pl and
+        compatible tools.
+        """
+        return '\n'.join(
+            '%s %d' % (';'.join(path), time//1000)
+            for path, time in self.self_times()
+        ) + '\n'
+
+
+class Profile:
+    """
+    Profile
+
+    Implements --profile. If no filename is given, a summary of the phase
+    timings is written to the standard error. If the filename has a .folded
+    extension the phase timings are written to it as collapsed stacks.
+    Otherwise the whole run is profiled using cProfile and the statistics are
+    written to the file (read it with pstats).
+    """
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.profiler = None
+        if filename and get_extension(filename) != 'folded':
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def finish(self, timings):
+        """Stop profiling and write the results."""
+        if self.profiler:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.filename)
+        elif self.filename:
+            with open(self.filename, 'w') as f:
+                f.write(timings.collapsed())
+        else:
+            sys.stderr.write(timings.summary() + '\n')
+
+# vim: set sw=4 sts=4 et:
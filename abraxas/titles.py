@@ -0,0 +1,251 @@
+# Abraxas Window Titles
+#
+# Finds the title of the active window, and remembers which account was
+# selected for each window title so that account discovery need not be
+# repeated for the titles that are seen again and again.
+#
+# Copyright (C) 2013-14 Kenneth S. Kundert and Kale Kundert
+
+# License (fold)
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+
+# Imports (fold)
+from __future__ import print_function, division
+from abraxas.manifest import get_stamp
+from abraxas.prefs import XDOTOOL, TITLE_PROVIDER
+from abraxas.x11 import get_active_window_title, X11Error
+from fileutils import Execute, ExecuteError
+from collections import OrderedDict
+import hashlib
+import hmac
+import json
+import os
+
+
+# Title providers {{{1
+# A title provider is any object with a get_title() method that returns the
+# title of the active window, or raises X11Error or ExecuteError if it cannot.
+
+class X11TitleProvider:
+    """
+    Find the title of the active window by asking the X server directly
+
+    Avoids running xdotool, but requires a window manager that gives the
+    active window (_NET_ACTIVE_WINDOW), as most do.
+    """
+
+    def __init__(self, display=None):
+        """
+        Arguments:
+        display (string)
+            The X display, DISPLAY is used if not given.
+        """
+        self.display = display
+
+    def get_title(self):
+        return get_active_window_title(self.display)
+
+
+class XdotoolTitleProvider:
+    """Find the title of the active window using xdotool"""
+
+    def get_title(self):
+        xdotool = Execute([XDOTOOL, 'getactivewindow', 'getwindowname'])
+        return xdotool.stdout.strip()
+
+
+class FallbackTitleProvider:
+    """
+    Find the title of the active window using the first of several providers
+    that succeeds
+    """
+
+    def __init__(self, providers, logger):
+        """
+        Arguments:
+        providers (list of title providers)
+            The providers in the order they should be tried.
+        logger (logger object)
+            Used to log the failures and to report if every provider fails.
+        """
+        self.providers = providers
+        self.logger = logger
+
+    def get_title(self):
+        error = 'no way to find the title of the active window.'
+        for provider in self.providers:
+            try:
+                return provider.get_title()
+            except (X11Error, ExecuteError) as err:
+                error = str(err)
+                self.logger.log('%s: %s' % (provider.__class__.__name__, err))
+        self.logger.error(error)
+
+
+def get_title_provider(logger):
+    """
+    Return the title provider given by TITLE_PROVIDER, which falls back to
+    xdotool if the X server cannot be asked directly.
+    """
+    if TITLE_PROVIDER == 'x11':
+        providers = [X11TitleProvider(), XdotoolTitleProvider()]
+    else:
+        providers = [XdotoolTitleProvider()]
+    return FallbackTitleProvider(providers, logger)
+
+
+# Title cache {{{1
+class _TitleCache:
+    """
+    Abraxas Window Title Cache
+
+    Maps window titles to the account that account discovery selected for
+    them, including the account the user chose when the title matched several
+    accounts.  Only the most recently used titles are kept.
+
+    Both the titles and the account IDs are stored as keyed HMACs, so the
+    cache reveals neither to anyone who does not hold the key, and the cache
+    as a whole is protected by a MAC computed with the same key.  An account
+    is recovered by finding the candidate whose HMAC matches.  The cache is
+    discarded if it was written with another key or if any of the accounts
+    files have changed since.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path, key, sources, logger, size):
+        """
+        Arguments:
+        path (string)
+            Path to the cache file.
+        key (bytes)
+            Key used for the HMACs, None if there is no key (the cache is
+            then kept in memory only).
+        sources (list of strings)
+            Paths to the accounts files.
+        logger (logger object)
+            Used to log whether the cache is used.
+        size (int)
+            The number of titles to remember.
+        """
+        self.path = path
+        self.key = key
+        self.sources = list(sources)
+        self.logger = logger
+        self.size = size
+        self.entries = None
+            # maps the digest of each title to the digest of its account,
+            # least recently used first
+
+    def _digest(self, kind, name):
+        message = '%s\0%s' % (kind, name)
+        return hmac.new(
+            self.key or b'', message.encode('utf-8'), hashlib.sha256
+        ).hexdigest()[:32]
+
+    def _mac(self, body):
+        return hmac.new(
+            self.key, json.dumps(body, sort_keys=True).encode('utf-8'),
+            hashlib.sha256
+        ).hexdigest()
+
+    def _stamps(self):
+        return [[source, get_stamp(source)] for source in self.sources]
+
+    def _load(self):
+        # Reads the cache the first time it is needed.
+        if self.entries is not None:
+            return
+        self.entries = OrderedDict()
+        if not self.key:
+            return
+        try:
+            with open(self.path) as f:
+                cache = json.load(f)
+            body = cache['body']
+            if not hmac.compare_digest(str(cache['mac']), self._mac(body)):
+                self.logger.log('%s: stale key, ignored.' % self.path)
+                return
+            if body['version'] != self.VERSION:
+                return
+            if body['sources'] != self._stamps():
+                self.logger.log('%s: accounts have changed.' % self.path)
+                return
+            self.entries = OrderedDict(
+                (str(title), str(account))
+                for title, account in body['entries']
+            )
+        except (IOError, ValueError, KeyError, TypeError):
+            return
+        self.logger.log('Using %s.' % self.path)
+
+    def _save(self):
+        # The cache is only an optimization, so failures are logged and
+        # otherwise ignored.
+        if not self.key:
+            return
+        body = {
+            'version': self.VERSION,
+            'sources': self._stamps(),
+            'entries': [list(entry) for entry in self.entries.items()],
+        }
+        cache = {'body': body, 'mac': self._mac(body)}
+        temp = self.path + '.new'
+        try:
+            with open(temp, 'w') as f:
+                json.dump(cache, f, sort_keys=True)
+            os.chmod(temp, 0o600)
+            os.rename(temp, self.path)
+        except (IOError, OSError) as err:
+            self.logger.log('%s: %s.' % (err.filename, err.strerror))
+
+    def lookup(self, title, candidates):
+        """
+        Return the account remembered for title if it is amongst candidates
+        (a list of account IDs), otherwise None.
+        """
+        self._load()
+        digest = self._digest('title', title)
+        account = self.entries.get(digest)
+        if account is None:
+            return None
+        for ID in candidates:
+            if hmac.compare_digest(account, self._digest('account', ID)):
+                # mark the title as the most recently used
+                del self.entries[digest]
+                self.entries[digest] = account
+                self._save()
+                return ID
+        return None
+
+    def add(self, title, account_id):
+        """
+        Remember the account for title, forgetting the least recently used
+        titles if there are too many.
+        """
+        self._load()
+        digest = self._digest('title', title)
+        self.entries.pop(digest, None)
+        self.entries[digest] = self._digest('account', account_id)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+        self._save()
+
+    def clear(self):
+        """Forget all titles."""
+        self._load()
+        self.entries.clear()
+        self._save()
+
+# vim: set sw=4 sts=4 et:
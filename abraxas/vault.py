@@ -0,0 +1,188 @@
+# Abraxas Vault
+#
+# Responsible for reading and writing the compiled vault, a single encrypted
+# file that holds everything that would otherwise be read from the master
+# password and accounts files.
+#
+# Copyright (C) 2013-14 Kenneth S. Kundert and Kale Kundert
+
+# License (fold)
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+
+# Imports (fold)
+from __future__ import print_function, division
+from fileutils import exists
+from abraxas.timing import PhaseTimer
+import hashlib
+import json
+import os
+import struct
+import zlib
+
+
+def _to_str(value):
+    # JSON gives unicode strings under python2, convert them to str.
+    if type(value) == dict:
+        return dict((_to_str(k), _to_str(v)) for k, v in value.items())
+    if type(value) == list:
+        return [_to_str(each) for each in value]
+    if type(value) not in [str, int, float, bool, type(None)]:
+        return value.encode('utf-8')
+    return value
+
+
+class _Vault:
+    """
+    Abraxas Vault
+
+    The vault is created by 'abraxas --compile' from the master password
+    files, the accounts files and the dictionary.  It holds the merged and
+    validated master passwords and accounts, the alias table, the account
+    discovery index and the key for the title cache.  It also holds the SHA1
+    hash of each of the files it was compiled from, and it is only used if
+    none of them have changed.
+
+    The file is encrypted and consists of a header, a version number and the
+    contents as compressed JSON.
+    """
+
+    MAGIC = b'abraxas vault\n'
+    VERSION = 2
+
+    def __init__(self, path, gpg, logger, timings=None):
+        self.path = path
+        self.gpg = gpg
+        self.logger = logger
+        self.timings = timings if timings else PhaseTimer()
+        self.stale = False
+            # true if the vault exists but is out of date
+
+    @staticmethod
+    def _hash(path):
+        try:
+            with open(path, 'rb') as f:
+                return hashlib.sha1(f.read()).hexdigest()
+        except IOError:
+            return None
+
+    def exists(self):
+        return exists(self.path)
+
+    def load(self, dictionary_hash):
+        """
+        Read the vault.
+
+        Returns its contents, or None if there is no vault or it is out of
+        date, in which case stale is set.  The vault is only an optimization,
+        so if it cannot be read it is treated as being out of date, and the
+        problem is logged.
+        """
+        if not self.exists():
+            return None
+        with self.timings.phase('decrypt'):
+            try:
+                with open(self.path, 'rb') as f:
+                    decrypted = self.gpg.decrypt_file(f)
+            except (IOError, OSError) as err:
+                return self._ignore('%s.' % err.strerror)
+        if not decrypted.ok:
+            return self._ignore('unable to decrypt.\n%s' % decrypted.stderr)
+        data = decrypted.data
+        header = self.MAGIC + struct.pack('>H', self.VERSION)
+        if not data.startswith(header):
+            return self._ignore('unrecognized version.')
+        try:
+            with self.timings.phase('parse'):
+                contents = json.loads(
+                    zlib.decompress(data[len(header):]).decode('utf-8'))
+                if str is bytes:
+                    contents = _to_str(contents)
+
+            # Check that the vault is current
+            with self.timings.phase('check sources'):
+                changed = [
+                    path for path, sha1 in contents['sources']
+                    if self._hash(path) != sha1
+                ]
+            if contents['dictionary'] != dictionary_hash:
+                changed.append('dictionary')
+        except (zlib.error, ValueError, KeyError, TypeError) as err:
+            return self._ignore('corrupt (%s).' % err)
+        if changed:
+            self.logger.log("%s: out of date (%s has changed)." % (
+                self.path, ', '.join(changed)))
+            self.stale = True
+            return None
+        self.logger.log("Using %s." % self.path)
+        return contents
+
+    def _ignore(self, reason):
+        # The vault cannot be used, so it is considered to be out of date.
+        self.logger.log('%s: %s Ignored.' % (self.path, reason))
+        self.stale = True
+        return None
+
+    def save(self, contents, sources, dictionary_hash, gpg_id, required=True):
+        """
+        Write the vault.
+
+        Arguments:
+        contents (dict)
+            The compiled master passwords and accounts.
+        sources (list of strings)
+            The paths to the files they were compiled from.
+        dictionary_hash (string)
+            The hash of the dictionary.
+        gpg_id (string)
+            The GPG ID used to encrypt the vault.
+        required (bool)
+            If true, failing to write the vault is an error, otherwise the
+            failure is only logged (the vault is only an optimization, so an
+            ordinary run continues using the files the vault would replace).
+
+        Returns true if the vault was written.
+        """
+        fail = self.logger.error if required else self.logger.log
+        contents = dict(contents)
+        contents['sources'] = [[path, self._hash(path)] for path in sources]
+        contents['dictionary'] = dictionary_hash
+        try:
+            encoded = json.dumps(contents, sort_keys=True).encode('utf-8')
+        except (TypeError, ValueError) as err:
+            fail("cannot compile vault: %s" % err)
+            return False
+        data = (
+            self.MAGIC + struct.pack('>H', self.VERSION) +
+            zlib.compress(encoded)
+        )
+        with self.timings.phase('encrypt'):
+            encrypted = self.gpg.encrypt(
+                data, gpg_id, always_trust=True, armor=False)
+        if not encrypted.ok:
+            fail("%s: unable to encrypt.\n%s" % (self.path, encrypted.stderr))
+            return False
+        temp = self.path + '.new'
+        try:
+            with open(temp, 'wb') as f:
+                f.write(encrypted.data)
+            os.chmod(temp, 0o600)
+            os.rename(temp, self.path)
+        except (IOError, OSError) as err:
+            fail('%s: %s.' % (err.filename, err.strerror))
+            return False
+        self.stale = False
+        self.logger.log("Wrote %s." % self.path)
+        return True
+
+# vim: set sw=4 sts=4 et:
@@ -22,11 +22,13 @@
 # Imports (fold)
 from __future__ import print_function, division
 import abraxas.cursor as cursor
+from abraxas.clipboard import SelectionOwner
 from abraxas.prefs import (
-    LABEL_COLOR, LABEL_STYLE, XDOTOOL, XSEL, ALL_FIELDS, INITIAL_AUTOTYPE_DELAY
+    LABEL_COLOR, LABEL_STYLE, XDOTOOL, ALL_FIELDS, INITIAL_AUTOTYPE_DELAY
 )
 from fileutils import Execute, ExecuteError
 from time import sleep
+import json
 import re
 
 
@@ -43,12 +45,14 @@ class Writer:
     Abraxas Password Writer Base Class
     """
 
-    # PasswordWriter is responsible for sending output to the user. It has four 
+    # PasswordWriter is responsible for sending output to the user. It has five 
     # backends, one that writes verbosely to standard output assuming it is 
     # a TTY (TTY_Writer), one that writes quietly to standard output assuming 
-    # the output is being fed another program (StdoutWriter), one that writes to 
-    # the clipboard (ClipboardWriter), and one that mimics the keyboard 
-    # (AutotypeWriter).  To accommodate the four backends the output is gathered 
+    # the output is being fed another program (StdoutWriter), one that writes 
+    # a single JSON object to standard output for programs that want all the 
+    # fields at once (JsonWriter), one that writes to the clipboard 
+    # (ClipboardWriter), and one that mimics the keyboard (AutotypeWriter).  
+    # To accommodate the five backends the output is gathered 
     # up and converted into a script.  That script is interpreted by the 
     # appropriate backend to produce the output.  The script is a sequence of 
     # commands each with an argument.  Internally the script is saved as a list 
@@ -219,6 +223,16 @@ class TTY_Writer(Writer):
         now be sent to the user.
         """
         label_password = len(self.script) > 1
+        lines = []
+            # the lines written since the first timed secret, those holding
+            # secrets are None
+
+        def show(text, secret=False):
+            # Send text to stdout, noting where the timed secrets are.
+            print(text)
+            if secret or lines:
+                lines.extend(
+                    [None] if secret else [l for l in text.split('\n')])
 
         def highlight(label, value):
             # Attach color label to a value
@@ -228,28 +242,23 @@ class TTY_Writer(Writer):
         def display_secret(label, secret):
             # Send output to stdout with the labels.
             if self.wait:
-                text = highlight(label, secret)
-                try:
-                    cursor.write(text)
-                    cursor.move_back(len(text))
-                    sleep(self.wait)
-                    cursor.clear()
-                except KeyboardInterrupt:
-                    cursor.clear()
+                # Timed secrets are shown where they occur and are erased
+                # together once the script is done
+                show(highlight(label, secret), secret=True)
             elif label_password:
-                print(highlight(label, secret))
+                show(highlight(label, secret))
             else:
-                print(secret)
+                show(secret)
 
         def display_field(label, value):
             # Send field to stdout with the labels.
             if value:
                 if type(value) == list:
-                    print(highlight(label, '\n    '+',\n    '.join(value)))
+                    show(highlight(label, '\n    '+',\n    '.join(value)))
                 elif '\n' in value:
-                    print(highlight(label, '\n'+indent(value.strip(), '    ')))
+                    show(highlight(label, '\n'+indent(value.strip(), '    ')))
                 else:
-                    print(highlight(label, value.rstrip()))
+                    show(highlight(label, value.rstrip()))
 
         # Execute the script
         for action in self.script:
@@ -277,14 +286,14 @@ class TTY_Writer(Writer):
                 if questions:
                     if action[1] is None:
                         for index, question in enumerate(questions):
-                            print(highlight('QUESTION %d' % index, question))
+                            show(highlight('QUESTION %d' % index, question))
                     else:
                         try:
-                            print(highlight(
+                            show(highlight(
                                 'QUESTION %d' % action[1],
                                 questions[action[1]]))
                         except IndexError:
-                            print(highlight(
+                            show(highlight(
                                 'QUESTION %d' % action[1],
                                 '<not available>'))
             elif action[0] == 'answer':
@@ -293,15 +302,51 @@ class TTY_Writer(Writer):
                     display_secret(question, answer)
             else:
                 raise NotImplementedError
+        if lines:
+            self.erase(
+                [len(lines) - i for i, l in enumerate(lines) if l is None])
         self.logger.log('Writing to stdout.')
 
+    def erase(self, offsets):
+        """
+        Erase the secrets once wait seconds have passed or as soon as a key
+        is pressed.
+
+        Arguments:
+        offsets (list of ints)
+            The number of lines above the cursor of each line to be erased.
+        """
+        try:
+            cursor.wait_for_key(self.wait)
+        except KeyboardInterrupt:
+            pass
+        for offset in offsets:
+            cursor.move_up(offset)
+            cursor.clear()
+            cursor.move_down(offset)
+
 
 class ClipboardWriter(Writer):
     """
     Writes output to the system clipboard.
     """
     def __init__(self, *args, **kwargs):
+        """
+        Accepts the arguments of Writer.constructor() along with:
+
+        clipboard (clipboard object)
+            Instance of a class from abraxas.clipboard. By default
+            a SelectionOwner is used, which leaves the secret with a detached
+            process that clears the clipboard after wait seconds.
+        queue (bool)
+            Rather than copying all the output to the clipboard as a single
+            labeled block, queue each item so that successive pastes produce
+            the items one at a time (the username, then the password, etc.).
+        """
+        clipboard = kwargs.pop('clipboard', None)
+        self.queue = kwargs.pop('queue', False)
         self.constructor(*args, **kwargs)
+        self.clipboard = clipboard if clipboard else SelectionOwner(self.logger)
 
     def process_output(self):
         """
@@ -312,24 +357,25 @@ class ClipboardWriter(Writer):
         """
         lines = []
 
+        def add_field(label, value):
+            if type(value) == list:
+                value = ', '.join(value)
+            elif value:
+                value = value.rstrip()
+            if value:
+                lines.append(value if self.queue else "%s: %s" % (label, value))
+
         # Execute the script
         for action in self.script:
             if action[0] == 'interp':
-                value = self.generator.account.get_field(action[1])
-                if type(value) == list:
-                    lines += ["%s: %s" % (action[1], ', '.join(value))]
-                elif value:
-                    lines += ["%s: %s" % (action[1], value.rstrip())]
+                add_field(
+                    action[1], self.generator.account.get_field(action[1]))
             elif action[0] == 'unknown':
                 fields = sorted(
                     set(self.generator.account.get_data().keys()) -
                     set(ALL_FIELDS))
                 for field in fields:
-                    value = self.generator.account.get_field(field)
-                    if type(value) == list:
-                        lines += ["%s: %s" % (field, ', '.join(value))]
-                    elif value:
-                        lines += ["%s: %s" % (field, value.rstrip())]
+                    add_field(field, self.generator.account.get_field(field))
             elif action[0] == 'password':
                 lines += [self.generator.generate_password()]
             elif action[0] == 'question':
@@ -352,39 +398,11 @@ class ClipboardWriter(Writer):
                     lines += [answer]
             else:
                 raise NotImplementedError
-        text = '\n'.join(lines)
+        if not lines:
+            return
         self.logger.log('Writing to clipboard.')
-
-        # Use 'xsel' to put the information on the clipboard.
-        # This represents a vulnerability, if someone were to replace xsel they
-        # could steal my passwords. This is why I use an absolute path. I tried
-        # to access the clipboard directly using GTK but I cannot get the code
-        # to work.
-        try:
-            Execute([XSEL, '-b', '-i'], stdin=text)
-        except ExecuteError as err:
-            self.logger.error(str(err))
-        try:
-            sleep(self.wait)
-        except KeyboardInterrupt:
-            pass
-        try:
-            Execute([XSEL, '-b', '-c'])
-        except ExecuteError as err:
-            self.logger.error(str(err))
-
-        # Use Gobject Introspection (GTK) to put the information on the
-        # clipboard (for some reason I cannot get this to work).
-        #try:
-        #    from gi.repository import Gtk, Gdk
-        #
-        #    clipboard = Gtk.Clipboard.get(Gdk.SELECTION_CLIPBOARD)
-        #    clipboard.set_text(text, len(text))
-        #    clipboard.store()
-        #    sleep(self.wait)
-        #    clipboard.clear()
-        #except ImportError:
-        #    error('Clipboard is not supported.')
+        self.clipboard.copy(
+            lines if self.queue else ['\n'.join(lines)], self.wait)
 
 
 class AutotypeWriter(Writer):
@@ -531,22 +549,114 @@ class StdoutWriter(Writer):
         to facilitate scripting with abraxas.
         """
 
+        for line in self.get_output():
+            print(line)
+
+        self.logger.log(
+            'Writing quietly to stdout.  Some output may be suppressed.')
+
+    def get_output(self):
+        """
+        Iterate through the lines that process_output() would write.
+        """
+
         for action in self.script:
             if action[0] == 'interp':
                 action = self.generator.account.get_field(action[1])
                 if action:
-                    print(action)
+                    yield str(action)
 
             elif action[0] == 'password':
-                print(self.generator.generate_password())
+                yield self.generator.generate_password()
 
             elif action[0] == 'answer':
-                print(self.generator.generate_answer(action[1])[1])
+                yield self.generator.generate_answer(action[1])[1]
 
             else:
                 pass
 
-        self.logger.log(
-            'Writing quietly to stdout.  Some output may be suppressed.')
+
+class JsonWriter(Writer):
+    """
+    Writes output to the standard output as a single JSON object.
+    """
+    def __init__(self, *args, **kwargs):
+        self.constructor(*args, **kwargs)
+
+    def process_output(self):
+        """
+        Process the output.
+
+        Everything that was stashed away by the various write_ methods should
+        now be sent to the user.
+
+        Writes one JSON object on a single line, which is meant to allow 
+        programs to get all they need from one run of abraxas.
+        """
+
+        print(json.dumps(self.get_object(), sort_keys=True, default=str))
+
+        self.logger.log('Writing JSON to stdout.')
+
+    def get_object(self):
+        """
+        Return the object that process_output() would write.
+
+        The object holds the account ID, an object that maps the requested 
+        account fields to their values, and the password if requested.  
+        Requested questions and answers are gathered into a list of objects, 
+        ordered by question index, each of which holds the index and question, 
+        and the answer if that was requested.
+        """
+        account = self.generator.account
+        result = {'account': account.get_id()}
+        fields = {}
+        questions = {}
+
+        def add_field(label, value):
+            if value:
+                if type(value) != list:
+                    value = value.rstrip()
+                fields[label] = value
+
+        def add_question(index, **kwargs):
+            questions.setdefault(index, {'index': index}).update(kwargs)
+
+        # Execute the script
+        for action in self.script:
+            if action[0] == 'interp':
+                add_field(action[1], account.get_field(action[1]))
+            elif action[0] == 'unknown':
+                unknown = sorted(
+                    set(account.get_data().keys()) - set(ALL_FIELDS))
+                for field in unknown:
+                    if field[0] == '_':
+                        continue
+                    add_field(field, account.get_field(field))
+            elif action[0] == 'password':
+                result['password'] = self.generator.generate_password()
+            elif action[0] == 'question':
+                available = account.get_security_questions()
+                if action[1] is None:
+                    for index, question in enumerate(available):
+                        add_question(index, question=question)
+                elif 0 <= action[1] < len(available):
+                    add_question(action[1], question=available[action[1]])
+            elif action[0] == 'answer':
+                question, answer = self.generator.generate_answer(action[1])
+                if answer:
+                    add_question(action[1], question=question, answer=answer)
+            elif action[0] in ['verb', 'sleep']:
+                # only meaningful when autotyping
+                pass
+            else:
+                raise NotImplementedError
+        if fields:
+            result['fields'] = fields
+        if questions:
+            result['questions'] = [
+                questions[index] for index in sorted(questions)
+            ]
+        return result
 
 # vim: set sw=4 sts=4 et:
@@ -0,0 +1,260 @@
+# Abraxas X11 Client
+#
+# Just enough of the X protocol to find the title of the active window
+# without running xdotool.
+#
+# Copyright (C) 2013-14 Kenneth S. Kundert and Kale Kundert
+
+# License (fold)
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see http://www.gnu.org/licenses/.
+
+# Imports (fold)
+from __future__ import print_function, division
+import os
+import socket
+import struct
+
+# Globals {{{1
+AUTH_NAME = b'MIT-MAGIC-COOKIE-1'
+FAMILY_INTERNET = 0
+FAMILY_LOCAL = 256
+FAMILY_WILD = 65535
+WM_NAME = 39
+    # predefined atom
+INTERN_ATOM = 16
+GET_PROPERTY = 20
+TIMEOUT = 2
+    # seconds to wait for the X server
+
+class X11Error(Exception):
+    """The title could not be found by talking to the X server."""
+
+def _pad(data):
+    # X pads each variable length field to a multiple of 4 bytes.
+    return data + b'\0' * (-len(data) % 4)
+
+def _parse_display(display):
+    # Returns the host, display number and screen number from a display name
+    # of the form [host]:number[.screen].  The host may be the path to the
+    # socket of the X server (as used by XQuartz).
+    if not display:
+        raise X11Error('DISPLAY is not set.')
+    host, sep, rest = display.rpartition(':')
+    number, dot, screen = rest.partition('.')
+    try:
+        return host, int(number), int(screen or 0)
+    except ValueError:
+        raise X11Error('%s: invalid display.' % display)
+
+def _read_xauthority(family, address, number):
+    # Returns the name and data of the authorization for the display from the
+    # X authority file, or empty strings if there is none.
+    path = os.environ.get(
+        'XAUTHORITY', os.path.join(os.path.expanduser('~'), '.Xauthority'))
+    try:
+        with open(path, 'rb') as f:
+            contents = f.read()
+    except IOError:
+        return b'', b''
+    number = str(number).encode('ascii')
+    offset = 0
+    try:
+        while offset < len(contents):
+            entry_family, = struct.unpack('>H', contents[offset:offset+2])
+            offset += 2
+            fields = []
+            for i in range(4):
+                length, = struct.unpack('>H', contents[offset:offset+2])
+                fields.append(contents[offset+2:offset+2+length])
+                offset += 2 + length
+            entry_address, entry_number, name, data = fields
+            if (
+                name == AUTH_NAME and
+                entry_number in [number, b''] and (
+                    entry_family == FAMILY_WILD or
+                    (entry_family == family and entry_address == address)
+                )
+            ):
+                return name, data
+    except struct.error:
+        pass
+    return b'', b''
+
+
+# Connection class {{{1
+class _Connection:
+    """
+    Connection to an X server
+
+    Uses the little-endian form of the protocol, and makes one request at a
+    time, waiting for its reply.
+    """
+
+    def __init__(self, display=None):
+        """
+        Arguments:
+        display (string)
+            The display, DISPLAY is used if not given.
+        """
+        if display is None:
+            display = os.environ.get('DISPLAY')
+        host, number, screen = _parse_display(display)
+        try:
+            if host.startswith('/'):
+                # XQuartz gives the path to the socket as the host
+                family, address = FAMILY_LOCAL, socket.gethostname()
+                self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self.socket.settimeout(TIMEOUT)
+                self.socket.connect(host)
+            elif host in ['', 'unix']:
+                family, address = FAMILY_LOCAL, socket.gethostname()
+                self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self.socket.settimeout(TIMEOUT)
+                self.socket.connect('/tmp/.X11-unix/X%d' % number)
+            else:
+                family = FAMILY_INTERNET
+                address = socket.inet_aton(socket.gethostbyname(host))
+                self.socket = socket.create_connection(
+                    (host, 6000 + number), TIMEOUT)
+        except (socket.error, socket.timeout) as err:
+            raise X11Error('%s: cannot connect to X server: %s.' % (
+                display, os.strerror(err.errno) if err.errno else err))
+        if type(address) != bytes:
+            address = address.encode('utf-8')
+        try:
+            self.root = self._setup(
+                _read_xauthority(family, address, number), screen)
+        except X11Error:
+            self.close()
+            raise
+
+    def _recv(self, length):
+        data = b''
+        try:
+            while len(data) < length:
+                chunk = self.socket.recv(length - len(data))
+                if not chunk:
+                    raise X11Error('X server closed the connection.')
+                data += chunk
+        except (socket.error, socket.timeout) as err:
+            raise X11Error('X server: %s.' % err)
+        return data
+
+    def _send(self, data):
+        try:
+            self.socket.sendall(data)
+        except (socket.error, socket.timeout) as err:
+            raise X11Error('X server: %s.' % err)
+
+    def _setup(self, auth, screen):
+        # Sends the connection setup and returns the root window of screen.
+        name, data = auth
+        self._send(
+            struct.pack(
+                '<BxHHHHxx', ord('l'), 11, 0, len(name), len(data)
+            ) + _pad(name) + _pad(data)
+        )
+        status, reason_length, major, minor, length = struct.unpack(
+            '<BBHHH', self._recv(8))
+        body = self._recv(4*length)
+        if status != 1:
+            if status != 0:
+                # authentication required, reason fills the body
+                reason_length = len(body)
+            reason = body[:reason_length].decode('latin-1').strip('\0\n ')
+            raise X11Error('X server refused the connection: %s' % reason)
+        body = bytearray(body)
+        vendor_length, = struct.unpack('<H', bytes(body[16:18]))
+        num_screens, num_formats = body[20], body[21]
+        if screen >= num_screens:
+            raise X11Error('screen %d does not exist.' % screen)
+        offset = 32 + len(_pad(b'\0' * vendor_length)) + 8*num_formats
+        for i in range(screen):
+            num_depths = body[offset+39]
+            offset += 40
+            for j in range(num_depths):
+                num_visuals, = struct.unpack(
+                    '<H', bytes(body[offset+2:offset+4]))
+                offset += 8 + 24*num_visuals
+        root, = struct.unpack('<I', bytes(body[offset:offset+4]))
+        return root
+
+    def _reply(self, request):
+        # Sends a request and returns its reply, skipping any events.
+        self._send(request)
+        while True:
+            header = self._recv(32)
+            kind = bytearray(header)[0]
+            if kind == 0:
+                raise X11Error('X server: error %d.' % bytearray(header)[1])
+            if kind == 1:
+                length, = struct.unpack('<I', header[4:8])
+                return header + self._recv(4*length)
+
+    def intern_atom(self, name):
+        """Return the atom for name, or 0 if it does not exist."""
+        name = name.encode('ascii')
+        reply = self._reply(
+            struct.pack(
+                '<BBHHxx', INTERN_ATOM, 1, 2 + len(_pad(name))//4, len(name)
+            ) + _pad(name)
+        )
+        atom, = struct.unpack('<I', reply[8:12])
+        return atom
+
+    def get_property(self, window, atom, max_length=4096):
+        """
+        Return the value of a property of a window (bytes), along with its
+        format (8, 16 or 32, or 0 if the property does not exist).
+        """
+        reply = self._reply(struct.pack(
+            '<BBHIIIII', GET_PROPERTY, 0, 6, window, atom, 0, 0,
+            max_length//4))
+        format = bytearray(reply)[1]
+        length, = struct.unpack('<I', reply[16:20])
+        return reply[32:32 + length*format//8], format
+
+    def close(self):
+        self.socket.close()
+
+
+# get_active_window_title {{{1
+def get_active_window_title(display=None):
+    """
+    Return the title of the active window, as given by the window manager
+    in _NET_ACTIVE_WINDOW.
+
+    Raises X11Error if the title cannot be found.
+    """
+    connection = _Connection(display)
+    try:
+        active = connection.intern_atom('_NET_ACTIVE_WINDOW')
+        if not active:
+            raise X11Error(
+                'window manager does not give the active window.')
+        value, format = connection.get_property(connection.root, active)
+        window = struct.unpack('<I', value[:4])[0] if format == 32 else 0
+        if not window:
+            raise X11Error('there is no active window.')
+        net_wm_name = connection.intern_atom('_NET_WM_NAME')
+        if net_wm_name:
+            value, format = connection.get_property(window, net_wm_name)
+            if format == 8 and value:
+                return value.decode('utf-8', 'replace')
+        value, format = connection.get_property(window, WM_NAME)
+        return value.decode('latin-1')
+    finally:
+        connection.close()
+
+# vim: set sw=4 sts=4 et:
@@ -0,0 +1,415 @@
+#!/usr/bin/env python
+
+# Abraxas Benchmarks
+#
+# Times startup, dictionary loading, secret derivation, account discovery,
+# account searches and the bulk operations (--archive, --changed) against
+# synthetic vaults of various sizes.  The results are written as JSON so that
+# runs made on different commits can be compared with --compare.
+#
+# The synthetic vaults are not encrypted; a stand-in for gnupg that passes the
+# plain text through is used so that the timings reflect abraxas rather than
+# gpg.
+
+# Imports (fold)
+from __future__ import print_function, division
+from abraxas import PasswordGenerator, PasswordError, Logging
+from abraxas.dictionary import Dictionary
+from abraxas.prefs import (
+    DICTIONARY_FILENAME, DICTIONARY_SHA1, SECRETS_SHA1, CHARSETS_SHA1
+)
+from fileutils import makePath as make_path, getHead as get_head, mkdir
+from textwrap import dedent
+from time import time
+import abraxas.generate
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+try:
+    from time import perf_counter as timer
+except ImportError:
+    timer = time
+
+MASTER_PASSWORD = 'cyclone bereave dipper barbarous'
+NUM_ACCOUNTS_FILES = 4
+    # the accounts are spread over the main file and this many additional files
+
+
+# Plain text stand-in for gnupg (fold)
+class PlaintextGPG:
+    """
+    Stands in for gnupg.GPG
+
+    The 'encrypted' files are plain text and are passed through unchanged.
+    """
+
+    class Result:
+        def __init__(self, data):
+            self.data = data if type(data) is bytes else data.encode('utf-8')
+            self.ok = True
+            self.stderr = ''
+
+        def __str__(self):
+            return self.data.decode('utf-8')
+
+    def __init__(self, **kwargs):
+        pass
+
+    def decrypt_file(self, f):
+        return self.Result(f.read())
+
+    def decrypt(self, data):
+        return self.Result(data)
+
+    def encrypt(self, data, *args, **kwargs):
+        return self.Result(data)
+
+
+class PlaintextGnupg:
+    GPG = PlaintextGPG
+
+
+def use_plaintext_gpg():
+    abraxas.generate.gnupg = PlaintextGnupg
+
+
+# Synthetic vault (fold)
+TEMPLATES = dedent('''\
+    "=words": {
+        'password-type': 'words',
+        'num-words': 4,
+        'autotype': "{password}{return}",
+    },
+    "=chars": {
+        'password-type': 'chars',
+        'num-chars': 12,
+        'alphabet': ALPHANUMERIC + PUNCTUATION,
+        'autotype': "{username}{tab}{password}{return}",
+    },
+    "=anum": {
+        'template': '=chars',
+        'alphabet': DISTINGUISHABLE,
+    },
+    "=pin": {
+        'password-type': 'chars',
+        'num-chars': 4,
+        'alphabet': DIGITS,
+        'autotype': "{password}{return}",
+    },
+''')
+
+def account_id(index):
+    return 'acct%05d' % index
+
+def synthetic_account(index):
+    ID = account_id(index)
+    account = {
+        'template': ['=words', '=chars', '=anum', '=pin'][index % 4],
+        'aliases': [ID.upper(), 'a%d' % index],
+        'username': 'user%d' % index,
+        'email': 'user%d@%s.com' % (index, ID),
+        'url': 'https://www.%s.com/login' % ID,
+        'window': ['*%s*' % ID],
+        'remarks': 'Remarks about %s' % ID,
+    }
+    if index % 3 == 0:
+        account['security questions'] = [
+            'What is the name of pet %d?' % each for each in range(3)
+        ]
+    if index % 7 == 0:
+        account['version'] = '2'
+    if index % 11 == 0:
+        account['separator'] = '-'
+    if index % 13 == 0:
+        account['prefix'] = 'pre:'
+        account['suffix'] = ':suf'
+    return account
+
+def accounts_file(accounts, settings_dir, additional=()):
+    lines = [
+        'from abraxas.charsets import (',
+        '    ALPHANUMERIC, PUNCTUATION, DISTINGUISHABLE, DIGITS',
+        ')',
+        "log_file = %r" % make_path(settings_dir, 'log'),
+        "archive_file = %r" % make_path(settings_dir, 'archive.gpg'),
+        "gpg_id = 'bench'",
+        'accounts = {',
+    ]
+    if additional:
+        lines += ['    ' + line for line in TEMPLATES.split('\n')]
+    for ID, account in accounts:
+        lines += ['    %r: %r,' % (ID, account)]
+    lines += ['}']
+    if additional:
+        lines += ['additional_accounts = %r' % list(additional)]
+    return '\n'.join(lines) + '\n'
+
+def create_vault(settings_dir, num_accounts):
+    """Create a synthetic settings directory with num_accounts accounts."""
+    mkdir(settings_dir)
+    accounts = [(account_id(i), synthetic_account(i)) for i in range(num_accounts)]
+    additional = [
+        'accounts%d' % each for each in range(1, NUM_ACCOUNTS_FILES + 1)
+    ]
+    shares = [accounts[i::len(additional)+1] for i in range(len(additional)+1)]
+    with open(make_path(settings_dir, 'accounts'), 'w') as f:
+        f.write(accounts_file(shares[0], settings_dir, additional))
+    for name, share in zip(additional, shares[1:]):
+        with open(make_path(settings_dir, name), 'w') as f:
+            f.write(accounts_file(share, settings_dir))
+    with open(make_path(settings_dir, 'master.gpg'), 'w') as f:
+        f.write(dedent('''\
+            dict_hash = %r
+            secrets_hash = %r
+            charsets_hash = %r
+            accounts = 'accounts'
+            passwords = {'default': %r}
+            default_password = 'default'
+            password_overrides = {}
+        ''') % (DICTIONARY_SHA1, SECRETS_SHA1, CHARSETS_SHA1, MASTER_PASSWORD))
+    return [ID for ID, account in accounts]
+
+
+# Benchmark runner (fold)
+class Benchmarks:
+    def __init__(self, repeat, only=None):
+        self.repeat = repeat
+        self.only = only
+        self.results = {}
+
+    def time(self, name, func, size=None, repeat=None, setup=None):
+        """Run func repeatedly and record how long each run takes."""
+        key = '%s@%s' % (name, size) if size else name
+        if self.only and self.only not in key:
+            return
+        runs = []
+        for i in range(repeat or self.repeat):
+            if setup:
+                setup()
+            start = timer()
+            func()
+            runs.append(timer() - start)
+        runs.sort()
+        self.results[key] = {
+            'name': name,
+            'accounts': size,
+            'runs': len(runs),
+            'min': runs[0],
+            'median': runs[len(runs)//2],
+            'mean': sum(runs)/len(runs),
+        }
+        print('%-36s %10.6f s' % (key, runs[0]), file=sys.stderr)
+
+
+def quiet_logger():
+    return Logging(
+        argv=['bench'], output_callback=lambda msg: None,
+        exception=PasswordError
+    )
+
+def title_for(ID):
+    # mimics a browser with 'Hostname in Titlebar' installed
+    return 'Sign In - https://www.%s.com - Firefox' % ID
+
+class FixedTitle:
+    # Stand-in title provider that always gives the same window title.
+    def __init__(self, title):
+        self.title = title
+
+    def get_title(self):
+        return self.title
+
+def run_cli(bench, vault_home, account):
+    here = get_head(os.path.abspath(__file__))
+    cache = tempfile.mkdtemp(prefix='abraxas-bench-pycache-')
+
+    def cli(args, fresh_cache):
+        # every cold run is given an empty bytecode cache
+        cmd = [sys.executable, __file__, '--run-main', '--'] + args
+        def run():
+            env = dict(os.environ, HOME=vault_home)
+            env['PYTHONPYCACHEPREFIX'] = (
+                tempfile.mkdtemp(dir=cache) if fresh_cache else cache
+            )
+            with open(os.devnull, 'w') as devnull:
+                subprocess.check_call(cmd, env=env, cwd=here, stdout=devnull)
+        return run
+
+    for name, args in [
+        ('cli.version', ['--version']),
+        ('cli.lookup', ['-q', account]),
+    ]:
+        bench.time(name + '.cold', cli(args, True))
+        bench.time(
+            name + '.warm', cli(args, False),
+            setup=cli(args, False)  # assures the cache is populated
+        )
+    shutil.rmtree(cache, ignore_errors=True)
+
+def run_benchmarks(sizes, repeat, only):
+    use_plaintext_gpg()
+    bench = Benchmarks(repeat, only)
+    root = tempfile.mkdtemp(prefix='abraxas-bench-')
+    try:
+        # Dictionary
+        bench.time(
+            'dictionary.load',
+            lambda: Dictionary(DICTIONARY_FILENAME, root, quiet_logger())
+        )
+
+        for size in sizes:
+            home = make_path(root, str(size))
+            settings_dir = make_path(home, '.config', 'abraxas')
+            ids = create_vault(settings_dir, size)
+            probe = ids[len(ids)//2]
+
+            def load():
+                generator = PasswordGenerator(
+                    settings_dir, logger=quiet_logger())
+                generator.read_accounts()
+                return generator
+            bench.time('load', load, size)
+            generator = load()
+
+            # Derivation
+            accounts = [generator.get_account(ID, quiet=True) for ID in ids]
+            words = [
+                a for a in accounts if a.get_password_type() == 'words'
+            ]
+            chars = [
+                a for a in accounts if a.get_password_type() == 'chars'
+            ]
+            master = generator.master_password
+            bench.time('passphrase.generate', lambda: [
+                master.passphrase.generate(
+                    MASTER_PASSWORD, account, master.dictionary
+                ) for account in words
+            ], size)
+            bench.time('password.generate', lambda: [
+                master.password.generate(MASTER_PASSWORD, account)
+                for account in chars
+            ], size)
+
+            # Account discovery
+            generator.accounts.title_provider = FixedTitle(title_for(probe))
+            bench.time(
+                'find_account_id', lambda: generator.get_account(''), size)
+
+            # Searches
+            bench.time(
+                'find_accounts', lambda: list(generator.find_accounts('a1')),
+                size)
+            bench.time(
+                'search_accounts',
+                lambda: list(generator.search_accounts('pet|remarks about')),
+                size)
+
+            # Bulk operations
+            try:
+                import yaml
+                bench.time('archive', generator.archive_secrets, size, 1)
+                bench.time('changed', generator.print_changed_secrets, size, 1)
+            except ImportError:
+                print('yaml not available, skipping archive.', file=sys.stderr)
+
+        # Command line
+        run_cli(bench, make_path(root, str(sizes[0])), account_id(0))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    return bench.results
+
+def describe():
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=get_head(os.path.abspath(__file__)),
+            stderr=subprocess.STDOUT
+        ).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time(),
+    }
+
+def compare(baseline, results, threshold):
+    """Print the ratio of each result to the baseline, flag the regressions."""
+    regressions = 0
+    for key in sorted(results):
+        if key not in baseline:
+            continue
+        old = baseline[key]['min']
+        new = results[key]['min']
+        ratio = new/old if old else float('inf')
+        flag = ''
+        if ratio > threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        print(
+            '%-36s %10.6f -> %10.6f  x%.2f%s' % (key, old, new, ratio, flag),
+            file=sys.stderr)
+    return regressions
+
+
+# Main (fold)
+def main():
+    if sys.argv[1:2] == ['--run-main']:
+        # Child process used to time the command line interface
+        import runpy
+        use_plaintext_gpg()
+        sys.argv = ['abraxas'] + sys.argv[3:]
+        runpy.run_path(
+            make_path(get_head(os.path.abspath(__file__)), 'main.py'),
+            run_name='__main__')
+        return
+
+    parser = argparse.ArgumentParser(description="Benchmark abraxas.")
+    parser.add_argument(
+        '-s', '--sizes', default='100,1000,10000', metavar='<N,...>',
+        help="Sizes of the synthetic vaults (number of accounts).")
+    parser.add_argument(
+        '-r', '--repeat', type=int, default=5, metavar='<N>',
+        help="Number of times each benchmark is run (the best is reported).")
+    parser.add_argument(
+        '-k', '--only', metavar='<str>',
+        help="Only run benchmarks whose name contains this string.")
+    parser.add_argument(
+        '-o', '--output', metavar='<file>',
+        help="Write the results to this file rather than to stdout.")
+    parser.add_argument(
+        '-c', '--compare', metavar='<file>',
+        help="Compare the results against those from an earlier run.")
+    parser.add_argument(
+        '-t', '--threshold', type=float, default=1.2, metavar='<ratio>',
+        help="Slowdown beyond which a result is reported as a regression.")
+    args = parser.parse_args()
+
+    sizes = [int(each) for each in args.sizes.split(',')]
+    results = {
+        'meta': describe(),
+        'results': run_benchmarks(sizes, args.repeat, args.only),
+    }
+    contents = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(contents + '\n')
+    else:
+        print(contents)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        if compare(baseline, results['results'], args.threshold):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
+
+# vim: set sw=4 sts=4 et:
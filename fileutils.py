@@ -1,5 +1,9 @@
 import os, errno
+import atexit
+import select
+import subprocess
 from fnmatch import fnmatch
+from time import time, sleep
 
 """Various utilities for interacting with files and directories."""
 
@@ -325,10 +329,21 @@ class ExecuteError(Exception):
         else:
             return "%s" % self.error
 
+def _wait_until(process, deadline):
+    # Wait for process to end, but not beyond deadline. Returns True if the
+    # process ended.  Polls as wait() only accepts a timeout in python3.
+    while process.poll() is None:
+        remaining = deadline - time()
+        if remaining <= 0:
+            return False
+        sleep(min(remaining, 0.01))
+    return True
+
 class Execute():
     def __init__(
         self, cmd, accept=(0,), stdin=None, stdout=True, stderr=True, wait=True, 
-        shell=False, showCmd=False
+        shell=False, showCmd=False, timeout=None, stdoutCallback=None,
+        stderrCallback=None, binary=False
     ):
         """
         Execute a command and capture its output.
@@ -345,12 +360,27 @@ class Execute():
         If stdout / stderr is true, stdout / stderr is captured and made 
         available from self.stdout / self.stderr.
 
+        If stdoutCallback / stderrCallback is given, it is called with each 
+        line of stdout / stderr (newline included) as soon as the line 
+        arrives.  The output is still captured if stdout / stderr is true.
+
+        If binary is true, stdin is expected to be bytes and self.stdout and 
+        self.stderr are bytes, otherwise they are strings encoded as UTF-8.
+
         If wait is true, the run method does not return until the process ends.  
         In this case run() returns the status. Otherwise it return None and 
         instead calling wait() waits for the process to end and returns the 
         status.  Once wait() returns, either by calling constructor with 
         wait=True, or by calling wait(), the status is also available from 
-        self.status,
+        self.status.  If wait is false, stdin is sent to the process 
+        immediately.
+
+        If timeout is given and the process has not ended that many seconds 
+        after wait() is called, the process is killed and an ExecuteError is 
+        raised.
+
+        The output is collected while the input is being sent, so a process 
+        that produces a lot of output on either stream cannot deadlock.
 
         The default is to not use a shell to execute a command (safer).
         """
@@ -360,45 +390,57 @@ class Execute():
         self.save_stderr = stderr
         self.wait_for_termination = wait
         self.showCmd = showCmd
+        self.timeout = timeout
+        self.stdout_callback = stdoutCallback
+        self.stderr_callback = stderrCallback
+        self.binary = binary
         self._run(stdin, shell)
 
     def _run(self, stdin, shell):
-        import subprocess
+        if stdin is not None and not self.binary:
+            stdin = stdin.encode('utf-8')
         streams = {}
         if stdin is not None:
             streams['stdin'] = subprocess.PIPE
-        if self.save_stdout:
+        if self.save_stdout or self.stdout_callback:
             streams['stdout'] = subprocess.PIPE
-        if self.save_stderr:
+        if self.save_stderr or self.stderr_callback:
             streams['stderr'] = subprocess.PIPE
         try:
             process = subprocess.Popen(
                 self.cmd, shell=shell, **streams
             )
         except (IOError, OSError) as err:
-            raise ExecuteError(self.cmd, err.filename, err.strerror)
-        if stdin is not None:
-            process.stdin.write(stdin.encode('utf-8'))
-            process.stdin.close()
+            raise ExecuteError(
+                self.cmd, err.strerror, err.filename, showCmd=True)
         self.pid = process.pid
         self.process = process
+        self.input = stdin
         if self.wait_for_termination:
             return self.wait()
+        if stdin is not None:
+            try:
+                process.stdin.write(stdin)
+            except (IOError, OSError):
+                pass
+            process.stdin.close()
+            # stdin has been handled, keep communicate() away from it
+            process.stdin = None
+            self.input = None
 
     def wait(self):
-        if self.save_stdout:
-            self.stdout = self.process.stdout.read().decode('utf-8')
-        else:
-             self.stderr = None
-        if self.save_stderr:
-            self.stderr = self.process.stderr.read().decode('utf-8')
+        if (
+            self.stdout_callback or self.stderr_callback or
+            self.timeout is not None
+        ):
+            # communicate() only accepts a timeout in python3
+            stdout, stderr = self._stream()
         else:
-             self.stderr = None
-        self.status = self.process.wait()
-        if self.process.stdout:
-            self.process.stdout.close()
-        if self.process.stderr:
-            self.process.stderr.close()
+            stdout, stderr = self.process.communicate(self.input)
+        self.input = None
+        self.stdout = self._decode(stdout) if self.save_stdout else None
+        self.stderr = self._decode(stderr) if self.save_stderr else None
+        self.status = self.process.returncode
         if self.accept is not True and self.status not in self.accept:
             if self.stderr:
                 raise ExecuteError(self.cmd, self.stderr, showCmd=self.showCmd)
@@ -409,11 +451,92 @@ class Execute():
                     showCmd=self.showCmd)
         return self.status
 
+    def _stream(self):
+        # Feed stdin while reading stdout and stderr as the output arrives, 
+        # handing each complete line to the corresponding callback.
+        process = self.process
+        deadline = None if self.timeout is None else time() + self.timeout
+        captured = {}
+        readers = {}
+        for name, stream, callback in [
+            ('stdout', process.stdout, self.stdout_callback),
+            ('stderr', process.stderr, self.stderr_callback),
+        ]:
+            if stream:
+                captured[name] = []
+                readers[stream.fileno()] = [callback, captured[name], b'']
+        pending = self.input or b''
+        writers = []
+        if process.stdin:
+            if pending:
+                writers = [process.stdin.fileno()]
+            else:
+                process.stdin.close()
+
+        while readers or writers:
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time()
+                if remaining <= 0:
+                    self._timed_out()
+            readable, writable, _ = select.select(
+                list(readers), writers, [], remaining)
+            for fd in writable:
+                try:
+                    written = os.write(fd, pending[:select.PIPE_BUF])
+                except (IOError, OSError) as err:
+                    if err.errno != errno.EPIPE:
+                        raise
+                    written = len(pending)
+                pending = pending[written:]
+                if not pending:
+                    process.stdin.close()
+                    writers = []
+            for fd in readable:
+                reader = readers[fd]
+                callback, chunks, partial = reader
+                data = os.read(fd, 32768)
+                chunks.append(data)
+                if callback:
+                    lines = (partial + data).split(b'\n')
+                    reader[2] = lines.pop()
+                    for line in lines:
+                        callback(self._decode(line + b'\n'))
+                    if not data and reader[2]:
+                        callback(self._decode(reader[2]))
+                if not data:
+                    del readers[fd]
+        for stream in [process.stdout, process.stderr]:
+            if stream:
+                stream.close()
+        if deadline is None:
+            process.wait()
+        elif not _wait_until(process, deadline):
+            self._timed_out()
+        return (
+            b''.join(captured['stdout']) if 'stdout' in captured else None,
+            b''.join(captured['stderr']) if 'stderr' in captured else None,
+        )
+
+    def _decode(self, data):
+        if data is None or self.binary:
+            return data
+        return data.decode('utf-8')
+
+    def _timed_out(self):
+        self.process.kill()
+        self.process.wait()
+        self.status = self.process.returncode
+        raise ExecuteError(
+            self.cmd, "timed out after %s seconds." % self.timeout,
+            showCmd=self.showCmd)
+
 
 class ShellExecute(Execute):
     def __init__(
         self, cmd, accept=(0,), stdin=None, stdout=True, stderr=True, wait=True, 
-        shell=True, showCmd=False
+        shell=True, showCmd=False, timeout=None, stdoutCallback=None,
+        stderrCallback=None, binary=False
     ):
         """
         Execute a command in a shell and capture its output
@@ -421,13 +544,10 @@ class ShellExecute(Execute):
         This class is the same as Execute, except that by default it runs the 
         given command in a shell, which is less safe but often more convenient.
         """
-        self.cmd = cmd
-        self.accept = accept
-        self.save_stdout = stdout
-        self.save_stderr = stderr
-        self.wait_for_termination = wait
-        self.showCmd = showCmd
-        self._run(stdin, True)
+        Execute.__init__(
+            self, cmd, accept, stdin, stdout, stderr, wait, True, showCmd,
+            timeout, stdoutCallback, stderrCallback, binary
+        )
 
 
 def execute(cmd, accept=(0,), stdin=None, shell=False):
@@ -440,12 +560,11 @@ def execute(cmd, accept=(0,), stdin=None, shell=False):
     If stdin is None, no connection is made to the standard input, otherwise 
     stdin is expected to be a string.
     """
-    import subprocess
     streams = {'stdin': subprocess.PIPE} if stdin is not None else {}
     try:
         process = subprocess.Popen(cmd, shell=shell, **streams)
     except (IOError, OSError) as err:
-        raise ExecuteError(cmd, err.filename, err.strerror)
+        raise ExecuteError(cmd, err.strerror, err.filename, showCmd=True)
     if stdin is not None:
         process.stdin.write(stdin.encode('utf-8'))
         process.stdin.close()
@@ -476,12 +595,11 @@ def background(cmd, stdin=None, shell=False):
     If stdin is None, no connection is made to the standard input, otherwise 
     stdin is expected to be a string.
     """
-    import subprocess
     streams = {'stdin': subprocess.PIPE} if stdin is not None else {}
     try:
         process = subprocess.Popen(cmd, shell=shell, **streams)
     except (IOError, OSError) as err:
-        raise ExecuteError(cmd, err.filename, err.strerror)
+        raise ExecuteError(cmd, err.strerror, err.filename, showCmd=True)
     if stdin is not None:
         process.stdin.write(stdin.encode('utf-8'))
         process.stdin.close()
@@ -499,6 +617,83 @@ def shellBackground(cmd, stdin=None, shell=True):
     return execute(cmd, stdin, shell=True)
 
 
+class Spawner():
+    def __init__(self, timeout=5, onFailure=None):
+        """
+        Run commands in the background without waiting for them to finish.
+
+        Children that have finished are reaped each time run() or reap() is 
+        called.  flush() waits up to timeout seconds for the children that are 
+        still running; it is called automatically when the program exits, so 
+        the commands that were started are given a chance to complete.
+
+        If onFailure is given, it is called with the command and its exit 
+        status for each child that terminates with a nonzero status.
+        """
+        self.timeout = timeout
+        self.onFailure = onFailure
+        self.children = []
+        atexit.register(self.flush)
+
+    def run(self, cmd, stdin=None, shell=False, detach=False):
+        """
+        Start a command in the background and return its process ID.
+
+        The output of the command is discarded.  If stdin is not None it is 
+        expected to be a string and is sent to the standard input.
+
+        If detach is true the command is placed in a session of its own and 
+        is neither waited for nor reported upon. Use this for programs, such as 
+        browsers, that are expected to outlive the caller.
+
+        Raise an ExecuteError if the command cannot be started.
+        """
+        self.reap()
+        devnull = open(os.devnull, 'r+b')
+        try:
+            process = subprocess.Popen(
+                cmd, shell=shell,
+                stdin=subprocess.PIPE if stdin is not None else devnull,
+                stdout=devnull, stderr=devnull,
+                preexec_fn=os.setsid if detach else None
+            )
+        except (IOError, OSError) as err:
+            raise ExecuteError(cmd, err.strerror, err.filename, showCmd=True)
+        finally:
+            devnull.close()
+        if stdin is not None:
+            try:
+                process.stdin.write(stdin.encode('utf-8'))
+            except (IOError, OSError):
+                pass
+            process.stdin.close()
+        self.children.append((cmd, process, detach))
+        return process.pid
+
+    def reap(self):
+        """Collect the children that have finished."""
+        running = []
+        for child in self.children:
+            cmd, process, detached = child
+            status = process.poll()
+            if status is None:
+                running.append(child)
+            elif status and not detached and self.onFailure:
+                self.onFailure(cmd, status)
+        self.children = running
+
+    def flush(self, timeout=None):
+        """Wait for the attached children to finish, but not beyond timeout."""
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time() + timeout
+        for cmd, process, detached in self.children:
+            if detached:
+                continue
+            if not _wait_until(process, deadline):
+                break
+        self.reap()
+
+
 def which(name, flags=os.X_OK):
     """Search PATH for executable files with the given name.
 
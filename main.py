@@ -7,17 +7,20 @@
 
 # Imports (fold)
 from abraxas import (
-    PasswordGenerator, TTY_Writer, ClipboardWriter, AutotypeWriter,
-    StdoutWriter, Logging)
+    PasswordGenerator, PasswordError, TTY_Writer, ClipboardWriter,
+    AutotypeWriter, StdoutWriter, JsonWriter, Logging)
 from abraxas.prefs import (
     SEARCH_FIELDS, DEFAULT_SETTINGS_DIR, DEFAULT_ARCHIVE_FILENAME,
     BROWSERS, DEFAULT_BROWSER)
+from abraxas.archive import get_shards_path
+from abraxas.timing import PhaseTimer, Profile
 from abraxas.version import VERSION, DATE
 from fileutils import (
     getTail as get_tail,
     makePath as make_path,
-    ShellExecute as Execute, ExecuteError)
+    Spawner, ExecuteError)
 import argparse
+import json
 import sys
 
 
@@ -70,6 +73,23 @@ class CommandLine:
                 "than stdout. In this case any command line arguments that",
                 "specify what to output are ignored and the autotype entry",
                 "scripts the output."])))
+        group.add_argument(
+            '--json', action='store_true',
+            help=(' '.join([
+                "Write everything that was requested to stdout as a single",
+                "JSON object."])))
+        group.add_argument(
+            '--batch', action='store_true',
+            help=(' '.join([
+                "Read requests from stdin, one JSON object per line, and",
+                "write the results to stdout, also one JSON object per",
+                "line. The account given on the command line is ignored."])))
+        parser.add_argument(
+            '--queue', action='store_true',
+            help=(' '.join([
+                "With --clipboard, place each item on the clipboard",
+                "separately so that successive pastes produce them in",
+                "order."])))
         parser.add_argument(
             '-f', '--find', type=str, metavar='<str>',
             help=(' '.join([
@@ -114,8 +134,8 @@ class CommandLine:
                 "(use 0 to disable)."])))
         parser.add_argument(
             '--archive', action='store_true',
-            help=("Archive all the secrets to %s." % make_path(
-                DEFAULT_SETTINGS_DIR, DEFAULT_ARCHIVE_FILENAME)))
+            help=("Archive all the secrets to %s." % get_shards_path(
+                make_path(DEFAULT_SETTINGS_DIR, DEFAULT_ARCHIVE_FILENAME))))
         parser.add_argument(
             '-e', '--export', action='store_true',
             help=("Export to Avendesora."))
@@ -123,6 +143,21 @@ class CommandLine:
             '--changed', action='store_true',
             help=(
                 "Identify all secrets that have changed since last archived."))
+        parser.add_argument(
+            '--compile', action='store_true',
+            help=(' '.join([
+                "Compile the master password and accounts files into a",
+                "single encrypted vault that is used in their place until",
+                "any of them change."])))
+        parser.add_argument(
+            '--profile', nargs='?', const='', default=None, metavar='<file>',
+            help=(' '.join([
+                "Report the time spent in each phase of the run. If <file>",
+                "ends in .folded, the phase timings are written to it as",
+                "collapsed stacks (for flame graphs), otherwise the run is",
+                "profiled with cProfile and the statistics are written to",
+                "<file>. Give the account before this option or use",
+                "--profile=<file>."])))
         parser.add_argument(
             '-I', '--init', type=str, metavar='<GPG ID>',
             help=(' '.join([
@@ -153,17 +188,133 @@ class CommandLine:
         return self.prog_name
 
 
+# Output requests (fold)
+def write_requests(writer, request):
+    """
+    Add the output requested on the command line or in a batch request to the
+    writer script.
+    """
+    if request.username or request.info or request.all:
+        writer.write_account_entry('username')
+    if request.account_number or request.info or request.all:
+        writer.write_account_entry('account')
+    if request.email or request.info or request.all:
+        writer.write_account_entry('email')
+    if request.url or request.info or request.all:
+        writer.write_account_entry('url')
+    if request.remarks or request.info or request.all:
+        writer.write_account_entry('remarks')
+    if request.info or request.all:
+        writer.write_question()
+        writer.write_unknown_entries()
+    if request.question is not None:
+        writer.write_answer(request.question)
+    if request.password or request.all or writer.is_empty():
+        writer.write_password()
+
+
+# Batch mode (fold)
+class BatchRequest:
+    """
+    A request read from stdin in batch mode.
+
+    Each request is a JSON object on a line of its own, for example:
+
+        {"account": "gmail", "fields": ["username", "password"], "question": 0}
+
+    The fields are named after the command line options that request the same
+    output and become attributes in the same way, so a request is processed
+    just as the command line is.
+    """
+    FIELDS = [
+        'password', 'username', 'account-number', 'email', 'url', 'remarks',
+        'info', 'all'
+    ]
+
+    def __init__(self, line):
+        request = json.loads(line)
+        if type(request) != dict:
+            raise ValueError('expected a JSON object.')
+        self.account = request.get('account')
+        self.fields = request.get('fields', [])
+        self.question = request.get('question')
+
+    def check(self):
+        """Raise ValueError if the request is not valid."""
+        if not self.account:
+            raise ValueError("'account' is missing.")
+        if type(self.account) not in [str, type(u'')]:
+            raise ValueError("'account' must be a string.")
+        if type(self.fields) != list:
+            raise ValueError("'fields' must be a list.")
+        unknown = sorted(set(map(str, self.fields)) - set(self.FIELDS))
+        if unknown:
+            raise ValueError('unknown field: %s.' % ', '.join(unknown))
+        for field in self.FIELDS:
+            setattr(self, field.replace('-', '_'), field in self.fields)
+        if self.question is not None and type(self.question) != int:
+            raise ValueError("'question' must be an integer.")
+
+
+def process_batch(generator, logger, wait):
+    """
+    Process the requests given on stdin.
+
+    The output for each request is that which would be produced by --quiet,
+    and is written as a JSON object on a line of its own as soon as it is
+    available: {"account": <ID>, "output": [<line>, ...]}.  If the request
+    fails the object has an "error" entry instead of the output, and the
+    remaining requests are still processed.
+    """
+    # stdin holds the requests, so the user cannot be asked for a password
+    generator.master_password.prompt = False
+    for line in iter(sys.stdin.readline, ''):
+        line = line.strip()
+        if not line:
+            continue
+        result = {}
+        exception = logger.exception
+        logger.exception = PasswordError
+        try:
+            request = BatchRequest(line)
+            if request.account:
+                result['account'] = request.account
+            request.check()
+            if not generator.has_account(request.account):
+                logger.error('%s: account not found.' % request.account)
+            generator.get_account(request.account)
+            writer = StdoutWriter(generator, wait, logger)
+            write_requests(writer, request)
+            result['output'] = list(writer.get_output())
+        except ValueError as err:
+            result['error'] = 'invalid request: %s' % err
+        except PasswordError as err:
+            result['error'] = str(err)
+        finally:
+            logger.exception = exception
+        print(json.dumps(result, sort_keys=True))
+        sys.stdout.flush()
+
+
 # Main (fold)
 cmd_line = CommandLine(sys.argv)
+timings = PhaseTimer()
+profile = Profile(cmd_line.profile) if cmd_line.profile is not None else None
 try:
     with Logging(
             argv=sys.argv, prog_name=cmd_line.name_as_invoked(),
-            use_notifier=cmd_line.notify
+            use_notifier=cmd_line.notify,
+            # in batch and JSON modes stdout is reserved for the results
+            output_callback=(
+                (lambda msg: sys.stderr.write(msg + '\n'))
+                if cmd_line.batch or cmd_line.json else None
+            )
     ) as logger:
         generator = PasswordGenerator(
             logger=logger,
             init=cmd_line.init,
-            stateless=cmd_line.stateless)
+            stateless=cmd_line.stateless,
+            timings=timings)
         if cmd_line.init:
             logger.terminate()
 
@@ -198,6 +349,11 @@ try:
                 cmd_line.search, generator.search_accounts)
             logger.terminate()
 
+        # If requested, compile the vault
+        if cmd_line.compile:
+            generator.compile_vault()
+            logger.terminate()
+
         # If requested, update or compare against archive
         if cmd_line.changed:
             generator.print_changed_secrets()
@@ -209,6 +365,11 @@ try:
             generator.avendesora_archive()
             logger.terminate()
 
+        # If requested, process requests from stdin
+        if cmd_line.batch:
+            process_batch(generator, logger, cmd_line.wait)
+            logger.terminate()
+
         # Select the requested account
         account = generator.get_account(cmd_line.account)
 
@@ -239,7 +400,9 @@ try:
                     if '://' not in url:
                         url = 'https://' + url
                     logger.log("running '%s'" % (cmd % url))
-                    Execute(cmd % url)
+                    # the browser is started in the background so we need not
+                    # wait for it
+                    Spawner().run(cmd % url, shell=True, detach=True)
                     logger.terminate()
                 else:
                     logger.error('url is unknown')
@@ -248,11 +411,14 @@ try:
 
         # Create the secrets writer
         if cmd_line.clipboard:
-            writer = ClipboardWriter(generator, cmd_line.wait, logger)
+            writer = ClipboardWriter(
+                generator, cmd_line.wait, logger, queue=cmd_line.queue)
         elif cmd_line.autotype:
             writer = AutotypeWriter(generator, cmd_line.wait, logger)
         elif cmd_line.quiet:
             writer = StdoutWriter(generator, cmd_line.wait, logger)
+        elif cmd_line.json:
+            writer = JsonWriter(generator, cmd_line.wait, logger)
         else:
             writer = TTY_Writer(generator, cmd_line.wait, logger)
 
@@ -260,28 +426,16 @@ try:
         if cmd_line.autotype:
             writer.write_autotype()
         else:
-            if cmd_line.username or cmd_line.info or cmd_line.all:
-                writer.write_account_entry('username')
-            if cmd_line.account_number or cmd_line.info or cmd_line.all:
-                writer.write_account_entry('account')
-            if cmd_line.email or cmd_line.info or cmd_line.all:
-                writer.write_account_entry('email')
-            if cmd_line.url or cmd_line.info or cmd_line.all:
-                writer.write_account_entry('url')
-            if cmd_line.remarks or cmd_line.info or cmd_line.all:
-                writer.write_account_entry('remarks')
-            if cmd_line.info or cmd_line.all:
-                writer.write_question()
-                writer.write_unknown_entries()
-            if cmd_line.question is not None:
-                writer.write_answer(cmd_line.question)
-            if cmd_line.password or cmd_line.all or writer.is_empty():
-                writer.write_password()
+            write_requests(writer, cmd_line)
 
         # Output everything that the user requested.
-        writer.process_output()
+        with timings.phase('output'):
+            writer.process_output()
         logger.terminate()
 except KeyboardInterrupt:
     sys.exit('Killed by user')
+finally:
+    if profile:
+        profile.finish(timings)
 
 # vim: set filetype=python sw=4 sts=4 et ai:
@@ -72,6 +72,15 @@ PROGRAM_MANPAGE = {
                                 command line arguments that specify what to 
                                 output are ignored and the *autotype* entry 
                                 directs what is to be output.
+        --queue                 With --clipboard, place each item on the 
+                                clipboard separately so that successive pastes 
+                                produce them in order (requires xclip).
+        --json                  Write everything that was requested to stdout 
+                                as a single JSON object.
+        --batch                 Read requests from the standard input, one 
+                                JSON object per line, and write the results 
+                                to the standard output, also one JSON object 
+                                per line (see Batch Mode below).
 
         -f <str>, --find <str>  List any account that contains the given string 
                                 in its ID.
@@ -98,9 +107,22 @@ PROGRAM_MANPAGE = {
                                 0 to disable clearing).
 
         --archive               Archive all the secrets to 
-                                ~/.config/abraxas/archive.gpg.
+                                ~/.config/abraxas/archive.shards.
         --changed               Identify all the secrets that have changed since 
                                 last archived.
+        --compile               Compile the master password and accounts files 
+                                into ~/.config/abraxas/vault.gpg.
+
+        --profile <file>        Report the time spent in each phase of the 
+                                run (decryption, reading the accounts, account 
+                                discovery, derivation, output, etc.). Without 
+                                *file* a summary is written to the standard 
+                                error. If *file* ends in .folded the timings are 
+                                written to it as collapsed stacks suitable for 
+                                flame graphs, otherwise the run is profiled with 
+                                cProfile and the statistics are written to 
+                                *file*.  Use --profile=<file> or give the 
+                                account first.
 
         -I <GPG-ID>, --init <GPG-ID>
                                 Initialize the master password and accounts 
@@ -227,22 +249,74 @@ PROGRAM_MANPAGE = {
             EMAIL: derrick.ash@yahoo.com
             URL: https://accounts.google.com
 
-        The output can be produced in three different ways.
+        The output can be produced in several different ways.
 
         The first is that it is simply displayed on standard output. It tries to 
         keep the secret information (such as the password and answers to the 
         security questions) secure by displaying it for a minute and then 
         erasing it. The program continues to run while the password is 
-        displayed. To clear the password early, just kill the program by typing 
-        Ctrl-C.
+        displayed. If several secrets are requested each is displayed where it 
+        belongs and they are all erased together. To clear them early, just 
+        press any key or kill the program by typing Ctrl-C.
 
         The second way is to send it to the clipboard. For security reasons, the 
-        clipboard is cleared after a minute.
+        clipboard is cleared after a minute. Abraxas does not wait around for 
+        this; it hands the secret to a small background process that owns the 
+        clipboard and clears it, and then exits immediately. With --queue each 
+        item is placed on the clipboard separately, so the first paste gives 
+        the username, the second the password, and so on.
 
         Finally, the password generator can output the information by mimicking 
         the keyboard and 'typing' it to active window.  This is referred to as 
         'autotype'.
 
+        For use by other programs, the output can also be written to standard 
+        output without any decoration, either one item per line with --quiet 
+        or as a single JSON object with --json. The JSON object gives the 
+        account, the requested account fields, the password, and the requested 
+        security questions along with any requested answers, so everything can 
+        be retrieved with one run of Abraxas. For example, 'abraxas --json -N 
+        -Q 0 gmail' produces::
+
+            {{"account": "gmail", "fields": {{"username": "derrickAsh"}},
+             "questions": [{{"answer": "...", "index": 0,
+                            "question": "What city were you born in?"}}]}}
+
+        The object is written on a single line, it is shown here split over 
+        several lines for clarity. Messages are written to the standard error.
+
+        Batch Mode
+        ++++++++++
+        With --batch Abraxas reads requests from the standard input rather 
+        than the command line, so that other programs can look up many 
+        accounts while paying the cost of starting Abraxas and decrypting its 
+        files only once. Each request is a JSON object given on a line of its 
+        own, for example::
+
+            {{"account": "gmail", "fields": ["username", "password"]}}
+            {{"account": "bank", "question": 0}}
+
+        The fields are named after the long form of the command line options 
+        that request the same output (password, username, account-number, 
+        email, url, remarks, info and all), and question gives the index of 
+        the security question to answer. As on the command line, the password 
+        is output if nothing else is requested. The result of each request is 
+        written as soon as it is available as a JSON object on a line of its 
+        own that gives the account and a list of the lines that --quiet would 
+        output::
+
+            {{"account": "gmail", "output": ["derrickAsh", "..."]}}
+
+        If a request cannot be satisfied, for example because the account does 
+        not exist, the result contains an error message rather than the 
+        output::
+
+            {{"account": "bnak", "error": "bnak: account not found."}}
+
+        The remaining requests are still processed. Messages are written to the standard error, and the user is 
+        never asked for a master password as the standard input is reserved 
+        for the requests.
+
         Account Discovery
         +++++++++++++++++
         If no account is specified, Abraxas examines the window title and from 
@@ -262,6 +336,20 @@ PROGRAM_MANPAGE = {
         navigate to the account you want and select it with *Enter* or *Return*.  
         You can cancel using *Esc*.
 
+        The account selected for a window title, including the one you chose 
+        from the dialog box, is remembered in ~/.config/abraxas/titles.cache 
+        (kept with your accounts file) and is used directly the next time that 
+        title is seen, so you are only asked once.  The last 64 titles are 
+        remembered (*TITLE_CACHE_SIZE* in prefs.py).  The titles and account 
+        names are not recorded in the clear, and the cache is discarded 
+        whenever any of your accounts files change.
+
+        The title of the active window is normally requested directly from the 
+        X server, which requires a window manager that publishes the active 
+        window (_NET_ACTIVE_WINDOW), as most do.  If that fails, xdotool is used 
+        instead.  Set *TITLE_PROVIDER* in prefs.py to 'xdotool' to always use 
+        xdotool.
+
         The combination of autotype and account discovery is very powerful if 
         you configure your window manager to run Abraxas because it makes it 
         possible to login to websites and such with a single keystroke.
@@ -409,9 +497,16 @@ PROGRAM_MANPAGE = {
 
             abraxas --archive
 
-        The resulting archive is encrypted and saved in your settings directory 
-        (~/.config/abraxas/archive.gpg). In addition, you can check your current 
-        list of secrets against those in the archive with::
+        The resulting archive is saved in your settings directory 
+        (~/.config/abraxas/archive.shards) as a number of encrypted shards, 
+        each of which holds the secrets of some of your accounts. Each shard is 
+        a YAML file that can be read with 'gpg -d'.  When you update the 
+        archive only those shards whose accounts have changed are rewritten.  
+        An archive created by an earlier version of Abraxas as a single file 
+        (~/.config/abraxas/archive.gpg) is still used until you next update 
+        the archive, which then renames it to archive.gpg.old; you may delete 
+        it once you are satisfied with the shards. In addition, you can check 
+        your current list of secrets against those in the archive with::
 
             abraxas --changed
 
@@ -421,6 +516,13 @@ PROGRAM_MANPAGE = {
         recommended that you always confirm you only see the changes you expect 
         before updating the archive.
 
+        Along with the archive, Abraxas writes *archive.digests*, which holds 
+        a keyed hash of each archived secret.  The key is derived from your 
+        master passwords, so the digests reveal nothing to someone who does not 
+        have them.  When you run 'abraxas --changed' the current secrets are 
+        first checked against the digests, and the archive is only decrypted 
+        to report what changed if any of them differ.
+
         How it Works
         ++++++++++++
         A secret such as a password or the answer to a security question starts 
@@ -435,6 +537,25 @@ PROGRAM_MANPAGE = {
         the source code of the Abraxas program would not allow someone to 
         predict your passwords.
 
+        Compiled Vault
+        ++++++++++++++
+        Each time it runs Abraxas decrypts and runs your master password file 
+        and at least one of your accounts files.  If you have many additional 
+        accounts or master password files, you can instead compile them all 
+        into a single encrypted file, the vault, with::
+
+            abraxas --compile
+
+        The vault is kept in your settings directory 
+        (~/.config/abraxas/vault.gpg) and holds the merged master passwords and 
+        accounts along with the tables Abraxas would otherwise build from them, 
+        so once it exists only the vault is decrypted.  It also records a hash 
+        of each of the files it was compiled from and of the words file.  If 
+        any of these change the vault is ignored and recompiled automatically 
+        the next time the accounts are read.  The vault is encrypted to the 
+        *gpg_id* given in your accounts file, and it can be deleted at any 
+        time.
+
         Getting Started
         +++++++++++++++
         Before using Abraxas you must have a GPG identity (a public/private key 
@@ -877,6 +998,54 @@ API_MANPAGE = {
                 except KeyboardInterrupt:
                     exit('Killed by user')
 
+        threads
+        +++++++
+
+        The scripts above use *get_account()*, which makes the account the
+        active account of the generator, and then call *generate_password()*
+        and *generate_answer()* without an account so that they use the active
+        account. A generator that is shared between threads should instead use
+        *lookup_account()*, which returns the account without activating it,
+        and pass the account explicitly. Accounts are immutable and deriving
+        secrets does not change the generator, so the vault need only be
+        decrypted and read once::
+
+            from concurrent.futures import ThreadPoolExecutor
+            from abraxas import PasswordGenerator
+
+            pw = PasswordGenerator()
+            pw.read_accounts()
+
+            def get_password(name):
+                return pw.generate_password(pw.lookup_account(name))
+
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                passwords = list(pool.map(get_password, ['login', 'disk', 'gpg']))
+
+        asyncio
+        +++++++
+
+        Programs that use asyncio should use *AsyncPasswordGenerator*, which
+        does not block the event loop. Its methods that read files, run gpg or
+        xdotool, or derive secrets are coroutines. The additional master
+        password and accounts files are decrypted concurrently, and cancelling
+        a coroutine kills any gpg processes it started::
+
+            import asyncio
+            from abraxas import AsyncPasswordGenerator
+
+            async def main():
+                pw = AsyncPasswordGenerator()
+                await pw.open()
+                await pw.read_accounts()
+                account = await pw.get_account('login')
+                print(await pw.generate_password(account))
+
+                # derive the secrets of every account
+                secrets = await pw.generate_secrets()
+
+            asyncio.run(main())
+
         SEE ALSO
         ========
         abraxas(1), abraxas(5)
@@ -1082,6 +1251,11 @@ CONFIG_MANPAGE = {
         regenerate the pass phrase for your stealth account because it requires 
         a master password that only you know but can plausibly deny having.
 
+        A master password that you are asked for is remembered for 15 minutes 
+        (*MASTER_PASSWORD_TTL* in prefs.py) and used for any other accounts 
+        that have no master password, so that you are only asked once when 
+        archiving, checking or exporting all your secrets.
+
         password_overrides
         ~~~~~~~~~~~~~~~~~~
         A dictionary that contains passwords for specific accounts. These 
@@ -1124,6 +1298,14 @@ CONFIG_MANPAGE = {
                 "charity/master.gpg"
             ]
 
+        The additional master password files are only decrypted when they are 
+        needed, which is when an account uses a master password or has 
+        a password override that they define.  A manifest of which file 
+        defines each, with the names hashed so they are not revealed, is kept 
+        in 'master.manifest' in the settings directory.  It is rebuilt 
+        automatically whenever the master password files change, and it can 
+        be deleted at any time.
+
 
         Accounts File
         +++++++++++++
@@ -1165,15 +1347,19 @@ CONFIG_MANPAGE = {
         Specifies the location of the log file. If not given, it defaults to 
         '~/.config/abraxas/log'. An absolute path should be used to
         specify the file. If a '.gpg' or '.asc' suffix is given on this file, it 
-        will be encrypted using your public key. Without encryption, this file 
-        leaks account names.
+        will be encrypted using your public key (or with the in-process key if 
+        *CRYPTO_BACKEND* is 'aead'). Without encryption, this file leaks 
+        account names.
 
         archive_file
         ~~~~~~~~~~~~
 
         Specifies the location of the archive file. If not given, it defaults to
         '~/.config/abraxas/archive.gpg'.  An absolute path should be used to 
-        specify the file. The file should end with a .gpg extension.
+        specify the file. The file should end with a .gpg extension.  The 
+        archive itself is kept in a directory of the same name but with a 
+        .shards extension, and the digests in a file with a .digests 
+        extension.
 
         gpg_id
         ~~~~~~
@@ -1268,6 +1454,15 @@ CONFIG_MANPAGE = {
 
             additional_accounts = ["business/accounts", "charity/accounts"]
 
+        Abraxas keeps a manifest of which of these files holds each account in 
+        'accounts.manifest', next to the accounts file, so that when you ask 
+        for a particular account it only needs to read (and decrypt) the files 
+        that hold that account and its templates.  The account names in the 
+        manifest are hashed with a key derived from your master password file, 
+        so the manifest does not reveal them. It is rebuilt automatically 
+        whenever any of the accounts files change, and it can be deleted at 
+        any time.
+
         Accounts Fields
         +++++++++++++++
 
@@ -1692,6 +1887,20 @@ CONFIG_MANPAGE = {
         can be changed with little concern, but others match the implementation 
         and changing them my require changes to the underlying code.
 
+        By default gpg is run to decrypt and encrypt each of the settings files, 
+        the vault, the archive and the log file.  If *CRYPTO_BACKEND* is set to 
+        'aead', the files that are private to Abraxas, the vault and the log 
+        file, are instead encrypted and decrypted within Abraxas using 
+        ChaCha20-Poly1305 with a random key that is kept in 
+        ~/.config/abraxas/aead-key.gpg, which is itself encrypted with gpg, so 
+        gpg is run only once to unlock the key.  This requires the Python 
+        *cryptography* package.  The key is created by 'abraxas --init'; files 
+        that were encrypted by gpg are still read, and are encrypted with the 
+        key when next written.  The settings files, the archive and the 
+        Avendesora files are still encrypted with gpg so that you can read 
+        and edit them with gpg.  Keep the key file safe: it is needed to read 
+        the log file once this setting is in effect.
+
         SEE ALSO
         ========
         abraxas(1), abraxas(3)
@@ -45,6 +45,7 @@ summary files should contain a dictionary with keys: 'tests', 'failures'.
 # imports {{{2
 from __future__ import division, print_function
 import os, sys
+import subprocess
 from json import load as loadSummary, dump as dumpSummary
 from inform import Color
 import argparse
@@ -95,6 +96,9 @@ class CommandLine():
             help="do not use color to highlight test results")
         cmdline_parser.add_argument(
             '--coverage', nargs='?', default=False, help="run coverage analysis")
+        cmdline_parser.add_argument(
+            '-j', '--jobs', type=int, default=1, metavar='<N>',
+            help="run up to N tests at once (the tests must be independent)")
         cmdline_parser.add_argument(
             '-h', '--help', action='store_true', help="print usage information and exit")
         cmdline_parser.add_argument('--parent', nargs='?', default=False, help='do not use')
@@ -126,6 +130,7 @@ class CommandLine():
         self.printSummary = cmdline_args.nosummary or self.printTests
         self.colorize = cmdline_args.nocolor
         self.coverage = cmdline_args.coverage
+        self.jobs = max(cmdline_args.jobs, 1)
         self.parent = cmdline_args.parent
         self.args = cmdline_args.tests
 
@@ -232,23 +237,21 @@ def runTests(tests, pythonVers=None, source=None, pythonPath=None, testKey='test
     numTestFailures = 0
     numSuites = 0
     numSuiteFailures = 0
+    jobs = []
     for test in clp.args:
         name = '%s/%s' % (clp.parent, test) if clp.parent else test
         if os.path.isfile('%s.%s.py' % (testKey, test)):
             summaryFileName = './.%s.%s.sum' % (testKey, test)
             _deleteYamlFile(summaryFileName)
-            if clp.printSummary:
-                sys.stdout.write(status('%s: ' % name))
-                sys.stdout.flush()
+            prefix = status('%s: ' % name) if clp.printSummary else ''
             cmd = pythonPath + '%s %s.%s.py %s' % (
                 python, testKey, test, _childOpts(test)
             )
-            error = _invoke(cmd)
         elif os.path.isdir(test):
             summaryFileName = './%s/.%s.sum' % (test, testKey)
             _deleteYamlFile(summaryFileName)
+            prefix = ''
             cmd = 'cd %s; %s %s %s' % (test, python, testKey, _childOpts(test))
-            error = _invoke(cmd)
         else:
             print(exception(
                 '%s: cannot find test %s, skipping.' % (
@@ -258,6 +261,18 @@ def runTests(tests, pythonVers=None, source=None, pythonPath=None, testKey='test
             numSuites += 1
             numSuiteFailures += 1
             continue
+        jobs.append((name, prefix, cmd, summaryFileName))
+
+    if clp.jobs > 1 and len(jobs) > 1:
+        errors = _invokeAll([(prefix, cmd) for name, prefix, cmd, _ in jobs])
+    else:
+        errors = []
+        for name, prefix, cmd, summaryFileName in jobs:
+            sys.stdout.write(prefix)
+            sys.stdout.flush()
+            errors.append(_invoke(cmd))
+
+    for (name, prefix, cmd, summaryFileName), error in zip(jobs, errors):
         if error and not clp.coverage is not False:
             # return status of coverage seems broken (sigh)
             print(fail('Failures detected in %s tests.' % name))
@@ -333,6 +348,8 @@ def _childOpts(test):
         opts += ['--coverage']
         if clp.coverage:
             opts += [clp.coverage]
+    if clp.jobs > 1:
+        opts += ['--jobs', str(clp.jobs)]
     return ' '.join(opts)
 
 # _invoke {{{2
@@ -351,6 +368,40 @@ def _invoke(cmd):
             )
         )
 
+# _invokeAll {{{2
+# invoke shell commands, up to clp.jobs at once, returning their exit statuses
+# the output of each is held until it finishes and then printed after its
+# prefix, in the order the commands were given
+def _invokeAll(commands):
+    pending = list(enumerate(commands))
+    running = []
+    outputs = {}
+    statuses = {}
+    nextToPrint = 0
+    while pending or running:
+        while pending and len(running) < clp.jobs:
+            index, (prefix, cmd) = pending.pop(0)
+            try:
+                process = subprocess.Popen(
+                    cmd, shell=True,
+                    stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+                )
+            except OSError as err:
+                sys.exit(exception("%s: when running '%s': %s." % (
+                    sys.argv[0], cmd, err.strerror
+                )))
+            running.append((index, prefix, process))
+        # wait for the oldest to finish while the others continue
+        index, prefix, process = running.pop(0)
+        output = process.communicate()[0]
+        outputs[index] = prefix + output.decode('utf-8', 'replace')
+        statuses[index] = process.returncode
+        while nextToPrint in outputs:
+            sys.stdout.write(outputs.pop(nextToPrint))
+            sys.stdout.flush()
+            nextToPrint += 1
+    return [statuses[index] for index in range(len(commands))]
+
 # _deleteYamlFile {{{2
 # delete a summary file (need to do this to assure we don't pick up a
 # stale one if the test program fails to generate a new one). 
@@ -33,6 +33,11 @@ def main():
                 # the user will probably have compatibility issues.
             'docutils',
         ],
+        extras_require={
+            'aead': ['cryptography'],
+                # only needed if CRYPTO_BACKEND is 'aead'
+        },
+        tests_require=['cryptography'],
         data_files=[
             ('', ['words']),
             ('man/man1', ['abraxas.1']),
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+
+# Test the Asyncio Password Generator
+#
+# AsyncPasswordGenerator requires python3, so these tests are kept apart from
+# test.main.py, which must also run under python2, and are only run by test3.
+# They work in ./async_settings and so are independent of the main tests and
+# can be run alongside them (runtests --jobs).
+
+# Imports (fold)
+from runtests import (
+    cmdLineOpts, writeSummary, succeed, fail, info, status, warning
+)
+from abraxas import AsyncPasswordGenerator, PasswordError, Logging
+from abraxas.asyncgen import copy_to_clipboard, get_window_title, _run_command
+from abraxas.prefs import GPG_BINARY
+from fileutils import remove
+from textwrap import dedent
+import abraxas.asyncgen
+import asyncio
+import subprocess
+import sys
+import os
+
+# Initialization (fold)
+fast, printSummary, printTests, printResults, colorize, parent, coverage = cmdLineOpts()
+
+testsRun = 0
+failures = 0
+os.chmod("test_key", 0o700)
+
+def create_async_settings():
+    # Copy the test settings, encrypting the master password files with the
+    # test key, and pointing the log and archive files into the copy.
+    remove('./async_settings')
+    os.mkdir('./async_settings', 0o700)
+    # the main tests may be writing to ./test_settings, so only the source
+    # files are read
+    for name in [
+        'accounts', 'more_accounts', 'yet_more_accounts', 'master', 'master2'
+    ]:
+        with open(os.path.join('./test_settings', name)) as f:
+            contents = f.read().replace('./test_settings/', './async_settings/')
+        with open(os.path.join('./async_settings', name), 'w') as f:
+            f.write(contents)
+        if name in ['master', 'master2']:
+            subprocess.check_call([
+                GPG_BINARY, '--homedir', 'test_key', '-r', '4DC3AD14', '-e',
+                os.path.join('./async_settings', name)
+            ])
+create_async_settings()
+
+def run_async(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+def cancel_open(settings_dir, logger, gpg_home):
+    # Cancel opening the generator part way through, and check that it can
+    # then be opened.
+    pw = AsyncPasswordGenerator(settings_dir, logger=logger, gpg_home=gpg_home)
+
+    async def cancel():
+        task = asyncio.ensure_future(pw.open())
+        await asyncio.sleep(0)
+        task.cancel()
+        try:
+            await task
+            return False
+        except asyncio.CancelledError:
+            pass
+        await pw.open()
+        return pw.generator is not None
+
+    return run_async(cancel())
+
+def create_fake_xsel():
+    # Create a stand-in for xsel that records its arguments and input in
+    # ./async_settings/xsel.log, and return its path.
+    path = os.path.abspath('./async_settings/xsel')
+    with open(path, 'w') as f:
+        f.write(dedent('''\
+            #!%s
+            import sys
+            with open(%r, 'a') as f:
+                f.write('%%s: %%s\\n' %% (' '.join(sys.argv[1:]), sys.stdin.read()))
+        ''' % (sys.executable, path + '.log')))
+    os.chmod(path, 0o700)
+    return path
+
+class FixedTitle:
+    # Stand-in title provider that always gives the same window title.
+    def __init__(self, title):
+        self.title = title
+
+    def get_title(self):
+        return self.title
+
+class RecordingLogger:
+    # Logger whose error() records the message and returns.
+    def __init__(self):
+        self.errors = []
+
+    def error(self, msg):
+        self.errors.append(msg)
+
+def run_command_failure(cmd):
+    # Run a command that cannot be started with a logger whose error()
+    # returns, and return the errors reported and the exception raised.
+    logger = RecordingLogger()
+    try:
+        run_async(_run_command(cmd, logger))
+    except Exception as err:
+        return logger.errors, err.__class__.__name__
+    return logger.errors, None
+
+class Case():
+    CONTEXT = {}
+    OUTPUT = []
+    NAMES = set()
+
+    def __init__(self, name, stimulus, result=None, output=None, error=None):
+        self.stimulus = stimulus       # python code to evaluate
+        self.name = name               # name of test case, arbitrary but should be unique
+        assert name not in Case.NAMES
+        Case.NAMES.add(name)
+        self.expected_result = result  # expected result from evaluating the stimulus
+        self.expected_output = output.strip().split('\n') if output else []
+                                       # expected output messages
+        self.expected_error = error    # expected error message
+        self.context = Case.CONTEXT
+        self.context['logger'] = Logging(
+            output_callback=lambda msg: self.set_output(msg),
+            exception=PasswordError)
+
+    def run(self):
+        del Case.OUTPUT[:]
+        self.error = None
+        self.result = None
+        try:
+            if self.expected_result is not None:
+                self.result = eval(self.stimulus, globals(), self.context)
+            else:
+                exec(self.stimulus, globals(), self.context)
+        except PasswordError as err:
+            self.error = str(err)
+        except (SyntaxError, NameError, KeyError, AttributeError) as err:
+            print("Error found with stimulus: <%s>" % self.stimulus)
+            raise
+        except:
+            return (self.name, self.stimulus, None, None, 'exception')
+
+        self.output = Case.OUTPUT[:]
+        if self.error != self.expected_error:
+            return (self.name, self.stimulus, self.error, self.expected_error, 'error')
+        if self.result != self.expected_result:
+            return (self.name, self.stimulus, self.result, self.expected_result, 'result')
+        if self.output != self.expected_output:
+            return (self.name, self.stimulus, self.output, self.expected_output, 'output')
+        return None
+
+    def set_output(self, message):
+        Case.OUTPUT += message.split('\n')
+
+# Test cases {{{1
+testCases = [
+    Case(
+        name='cobweb',
+        stimulus="apw = AsyncPasswordGenerator('./async_settings', logger=logger, gpg_home='test_key')"
+    ),
+    Case(
+        name='parsnip',
+        stimulus="run_async(apw.open()); run_async(apw.read_accounts())"
+    ),
+    Case(
+        name='gazebo',
+        stimulus="run_async(apw.generate_password(run_async(apw.get_account('crest'))))",
+        result='crewman ledge cranny prelate'
+    ),
+    Case(
+        name='hubcap',
+        stimulus="run_async(apw.generate_secrets(chunk_size=2))['toms']['password']",
+        result='tP,)olY+lA~Qt>4/APS4{C+drq$]Edg.Gs"d2]YEGnL>cP-5IYKEs_WXso*L{U z'
+    ),
+    Case(
+        name='rafter',
+        stimulus="run_async(apw.generate_secrets())['crest']['questions'][1][1]",
+        result='animal siege bootee entertain'
+    ),
+    Case(
+        name='skylight',
+        stimulus="cancel_open('./async_settings', logger, 'test_key')",
+        result=True
+    ),
+    Case(
+        name='clothesline',
+        stimulus=dedent('''
+            abraxas.asyncgen.XSEL = create_fake_xsel()
+            run_async(copy_to_clipboard('hush', 0, logger))
+            with open('./async_settings/xsel.log') as f:
+                xsel = f.read().splitlines()
+        ''')
+    ),
+    Case(
+        name='clothespin',
+        stimulus="xsel",
+        result=['-b -i: hush', '-b -c: ']
+    ),
+    Case(
+        name='dustpan',
+        stimulus="run_command_failure(['./async_settings/missing'])",
+        result=(
+            ['./async_settings/missing: No such file or directory'],
+            'FileNotFoundError'
+        )
+    ),
+    Case(
+        name='weathervane',
+        stimulus="run_async(get_window_title(logger, FixedTitle('Shared sign on')))",
+        result='Shared sign on'
+    ),
+    Case(
+        name='windsock',
+        stimulus=dedent('''
+            apw = AsyncPasswordGenerator(
+                './async_settings', logger=logger, gpg_home='test_key',
+                title_provider=FixedTitle('crest.com - Mozilla Firefox'))
+            run_async(apw.open())
+            run_async(apw.read_accounts())
+        ''')
+    ),
+    Case(
+        name='weathercock',
+        stimulus="run_async(apw.get_account()).get_id()",
+        result='crest'
+    ),
+]
+
+# Run tests {{{1
+for case in testCases:
+
+    testsRun += 1
+    if printTests:
+        print(status('Trying %d (%s):' % (testsRun, case.name)), case.stimulus)
+
+    failure = case.run()
+
+    if failure:
+        failures += 1
+        name, stimulus, result, expected, kind = failure
+        print(fail('Unexpected %s (%s):' % (kind, failures)))
+        print(info('    Case    :'), name)
+        print(info('    Given   :'), stimulus)
+        print(info('    Result  :'), result)
+        print(info('    Expected:'), expected)
+
+# Print test summary {{{1
+numTests = 12
+assert testsRun == numTests, "Incorrect number of tests run (%s of %s)." % (testsRun, numTests)
+if printSummary:
+    print('%s: %s tests run, %s failures detected.' % (
+        fail('FAIL') if failures else succeed('PASS'), testsRun, failures
+    ))
+
+writeSummary(testsRun, failures)
+sys.exit(int(bool(failures)))
+
+# vim: set sw=4 sts=4 et:
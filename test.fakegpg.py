@@ -0,0 +1,433 @@
+#!/usr/bin/env python
+
+# Test the Password Generator using a Fake GPG
+#
+# FakeGpg runs in-process, so these tests run no gpg processes.  They work in
+# ./fake_settings and so are independent of the main tests and can be run
+# alongside them (runtests --jobs).
+
+# Imports (fold)
+from __future__ import print_function, division
+from runtests import (
+    cmdLineOpts, writeSummary, succeed, fail, info, status, warning
+)
+from abraxas import PasswordGenerator, PasswordError, Logging
+from abraxas.crypto import AeadBackend, FakeGpg
+from abraxas.prefs import (
+    VAULT_FILENAME, SECRETS_SHA1, EQUIVALENT_SECRETS_SHA1S
+)
+from fileutils import remove
+from textwrap import dedent
+import re
+import shutil
+import sys
+import os
+
+# Initialization (fold)
+fast, printSummary, printTests, printResults, colorize, parent, coverage = cmdLineOpts()
+
+testsRun = 0
+failures = 0
+gpg = FakeGpg()
+
+def create_fake_settings():
+    # Copy the test settings, encrypting the master password files with the
+    # fake gpg, and pointing the log and archive files into the copy.
+    remove('./fake_settings')
+    os.mkdir('./fake_settings', 0o700)
+    # the main tests may be writing to ./test_settings, so only the source
+    # files are read
+    for name in [
+        'accounts', 'more_accounts', 'yet_more_accounts', 'master', 'master2'
+    ]:
+        with open(os.path.join('./test_settings', name)) as f:
+            contents = f.read().replace('./test_settings/', './fake_settings/')
+        if name in ['master', 'master2']:
+            name += '.gpg'
+            contents = str(gpg.encrypt(contents, '4DC3AD14'))
+        with open(os.path.join('./fake_settings', name), 'w') as f:
+            f.write(contents)
+create_fake_settings()
+
+def count_secrets_warnings(secrets_hash):
+    # Return the number of warnings that secrets.py has changed given by a
+    # master password file that records secrets_hash.
+    settings_dir = './fake_settings/heirloom'
+    remove(settings_dir)
+    os.mkdir(settings_dir, 0o700)
+    with open('./test_settings/master') as f:
+        contents = f.read()
+    contents = re.sub(
+        r'secrets_hash = "\w*"', 'secrets_hash = "%s"' % secrets_hash,
+        contents)
+    contents = contents.replace(
+        'additional_master_password_files = "master2.gpg"', '')
+    with open(os.path.join(settings_dir, 'master.gpg'), 'w') as f:
+        f.write(str(gpg.encrypt(contents, '4DC3AD14')))
+    del Case.OUTPUT[:]
+    PasswordGenerator(settings_dir, logger=Case.CONTEXT['logger'], gpg=gpg)
+    warnings = [
+        line for line in Case.OUTPUT if "secrets.py' has changed" in line
+    ]
+    del Case.OUTPUT[:]
+    return len(warnings)
+
+class Case():
+    CONTEXT = {'gpg': gpg}
+    OUTPUT = []
+    NAMES = set()
+
+    def __init__(self, name, stimulus, result=None, output=None, error=None):
+        self.stimulus = stimulus       # python code to evaluate
+        self.name = name               # name of test case, arbitrary but should be unique
+        assert name not in Case.NAMES
+        Case.NAMES.add(name)
+        self.expected_result = result  # expected result from evaluating the stimulus
+        self.expected_output = output.strip().split('\n') if output else []
+                                       # expected output messages
+        self.expected_error = error    # expected error message
+        self.context = Case.CONTEXT
+        self.context['logger'] = Logging(
+            output_callback=lambda msg: self.set_output(msg),
+            exception=PasswordError)
+
+    def run(self):
+        del Case.OUTPUT[:]
+        self.error = None
+        self.result = None
+        try:
+            if self.expected_result is not None:
+                self.result = eval(self.stimulus, globals(), self.context)
+            else:
+                exec(self.stimulus, globals(), self.context)
+        except PasswordError as err:
+            self.error = str(err)
+        except (SyntaxError, NameError, KeyError, AttributeError) as err:
+            print("Error found with stimulus: <%s>" % self.stimulus)
+            raise
+        except:
+            return (self.name, self.stimulus, None, None, 'exception')
+
+        self.output = Case.OUTPUT[:]
+        if self.error != self.expected_error:
+            return (self.name, self.stimulus, self.error, self.expected_error, 'error')
+        if self.result != self.expected_result:
+            return (self.name, self.stimulus, self.result, self.expected_result, 'result')
+        if self.output != self.expected_output:
+            return (self.name, self.stimulus, self.output, self.expected_output, 'output')
+        return None
+
+    def set_output(self, message):
+        Case.OUTPUT += message.split('\n')
+
+# Test cases {{{1
+testCases = [
+    Case(
+        name='bluff',
+        stimulus="str(gpg.decrypt(str(gpg.encrypt('hush', '4DC3AD14'))))",
+        result='hush'
+    ),
+    Case(
+        name='charade',
+        stimulus="gpg.encrypt('hush', '4DC3AD14').data == gpg.encrypt('hush', '4DC3AD14').data",
+        result=True
+    ),
+    Case(
+        name='feint',
+        stimulus="(gpg.decrypt('hush').ok, gpg.encrypt('hush', None).ok)",
+        result=(False, False)
+    ),
+    Case(
+        name='masquerade',
+        stimulus="pw = PasswordGenerator('./fake_settings', logger=logger, gpg=gpg)"
+    ),
+    Case(
+        name='pretense',
+        stimulus="pw.read_accounts()"
+    ),
+    Case(
+        name='decoy',
+        stimulus="pw.generate_password(pw.get_account('toms'))",
+        result='tP,)olY+lA~Qt>4/APS4{C+drq$]Edg.Gs"d2]YEGnL>cP-5IYKEs_WXso*L{U z'
+    ),
+    Case(
+        name='sham',
+        stimulus="pw.generate_password(pw.get_account('colgate'))",
+        result='white teeth'
+    ),
+    Case(
+        name='ruse',
+        stimulus="pw.archive_secrets()"
+    ),
+    Case(
+        name='guise',
+        stimulus="os.listdir('fake_settings/archive.shards') != []",
+        result=True
+    ),
+    Case(
+        name='subterfuge',
+        stimulus=dedent('''
+            encryptions = gpg.encryptions
+            pw.archive_secrets()
+            pw.print_changed_secrets()
+        ''')
+    ),
+    Case(
+        name='dodge',
+        stimulus="gpg.encryptions - encryptions",
+        result=0
+    ),
+    Case(
+        name='emigre',
+        stimulus="pw.avendesora_archive()",
+        output='''
+fake_settings/avendesora/accounts.gpg: writing.
+fake_settings/avendesora/more_accounts.gpg: writing.
+fake_settings/avendesora/yet_more_accounts.gpg: writing.
+3 files written, 0 unchanged files skipped.
+'''
+    ),
+    Case(
+        name='expatriate',
+        stimulus=dedent('''
+            encryptions = gpg.encryptions
+            pw.avendesora_archive()
+        '''),
+        output='''
+0 files written, 3 unchanged files skipped.
+'''
+    ),
+    Case(
+        name='exile',
+        stimulus="gpg.encryptions - encryptions",
+        result=0
+    ),
+    Case(
+        name='castaway',
+        stimulus=dedent('''
+            with open('./fake_settings/do-not-export', 'w') as f:
+                f.write('toms\\n')
+            pw.avendesora_archive()
+        '''),
+        output='''
+toms: not exported.
+fake_settings/avendesora/accounts.gpg: writing.
+fake_settings/avendesora/more_accounts.gpg: writing.
+2 files written, 0 unchanged files skipped.
+'''
+    ),
+    Case(
+        name='mummer',
+        stimulus=dedent('''
+            PasswordGenerator(
+                './fake_settings/generated', init='4DC3AD14',
+                logger=logger, gpg=gpg)
+        '''),
+        output='''
+fake_settings/generated/master.gpg: created.
+fake_settings/generated/accounts: created.
+'''
+    ),
+    Case(
+        name='impostor',
+        stimulus=dedent('''
+            pw = PasswordGenerator(
+                './fake_settings/generated', logger=logger, gpg=gpg)
+            pw.read_accounts()
+        ''')
+    ),
+    Case(
+        name='pretender',
+        stimulus="sorted(pw.all_accounts())",
+        result=[]
+    ),
+    Case(
+        name='doppelganger',
+        stimulus=dedent('''
+            os.mkdir('./fake_settings/twins')
+            for name in ['master.gpg', 'master2.gpg']:
+                shutil.copy(os.path.join('./fake_settings', name), './fake_settings/twins')
+            for name, contents in [
+                ('accounts', """
+                    log_file = './fake_settings/twins/log'
+                    gpg_id = '4DC3AD14'
+                    accounts = {
+                        '=words': {'password-type': 'words'},
+                        'castor': {'aliases': ['twin']},
+                        'pollux': {'aliases': ['twin']},
+                    }
+                    additional_accounts = ['gemini', 'dioscuri']
+                """),
+                ('gemini', "accounts = {'leda': {'num-words': 'many'}}"),
+                ('dioscuri', "accounts = {'tyndareus': {}}"),
+            ]:
+                with open(os.path.join('./fake_settings/twins', name), 'w') as f:
+                    f.write(dedent(contents))
+            pw = PasswordGenerator('./fake_settings/twins', logger=logger, gpg=gpg)
+            pw.read_accounts()
+        '''),
+        output='''
+Invalid value for 'num-words' in leda account (many). Expected integer, ignoring.
+Alias twin from account pollux duplicates an account name or previous entry, ignoring.
+'''
+    ),
+    Case(
+        name='lookalike',
+        stimulus=dedent('''
+            pw = PasswordGenerator('./fake_settings/twins', logger=logger, gpg=gpg)
+            pw.read_accounts()
+            pw.get_account('leda')
+            pw.get_account('tyndareus')
+        '''),
+        output='''
+Alias twin from account pollux duplicates an account name or previous entry, ignoring.
+Invalid value for 'num-words' in leda account (many). Expected integer, ignoring.
+'''
+    ),
+    Case(
+        name='understudy',
+        stimulus="sorted(os.path.basename(path) for path in pw.accounts.loaded)",
+        result=['accounts', 'dioscuri', 'gemini']
+    ),
+    Case(
+        name='heirloom',
+        stimulus="count_secrets_warnings(SECRETS_SHA1)",
+        result=0
+    ),
+    Case(
+        name='hand-me-down',
+        stimulus="count_secrets_warnings(EQUIVALENT_SECRETS_SHA1S[0])",
+        result=0
+    ),
+    Case(
+        name='forgery',
+        stimulus="count_secrets_warnings('0'*40)",
+        result=1
+    ),
+]
+
+# The in-process encryption backend requires the cryptography package
+aeadCases = [
+    Case(
+        name='cipher',
+        stimulus=dedent('''
+            pw = PasswordGenerator(
+                './fake_settings/sealed', init='4DC3AD14',
+                logger=logger, gpg=gpg, crypto_backend='aead')
+        '''),
+        output='''
+fake_settings/sealed/aead-key.gpg: created.
+fake_settings/sealed/master.gpg: created.
+fake_settings/sealed/accounts: created.
+'''
+    ),
+    Case(
+        name='signet',
+        stimulus="str(pw.cipher.decrypt(str(pw.cipher.encrypt('hush'))))",
+        result='hush'
+    ),
+    Case(
+        name='tamper',
+        stimulus="pw.cipher.decrypt(pw.cipher.encrypt('hush', armor=False).data[:-1] + b'x').ok",
+        result=False
+    ),
+    Case(
+        name='stranger',
+        stimulus="AeadBackend(b'0'*32).decrypt(str(pw.cipher.encrypt('hush'))).ok",
+        result=False
+    ),
+    Case(
+        name='passthrough',
+        stimulus="str(pw.cipher.decrypt(str(gpg.encrypt('hush', '4DC3AD14'))))",
+        result='hush'
+    ),
+    Case(
+        name='wax',
+        stimulus=dedent('''
+            pw = PasswordGenerator(
+                './fake_settings/sealed', logger=logger, gpg=gpg,
+                crypto_backend='aead')
+            pw.read_accounts()
+            pw.compile_vault()
+            with open('./fake_settings/sealed/master.gpg', 'rb') as f:
+                master = f.read()
+            with open('./fake_settings/sealed/' + VAULT_FILENAME, 'rb') as f:
+                vault = f.read()
+        ''')
+    ),
+    Case(
+        name='envelope',
+        stimulus="(gpg.is_encrypted(master), pw.cipher.is_encrypted(master))",
+        result=(True, False)
+    ),
+    Case(
+        name='reliquary',
+        stimulus="(gpg.is_encrypted(vault), pw.cipher.is_encrypted(vault))",
+        result=(False, True)
+    ),
+    Case(
+        name='unsealed',
+        stimulus=dedent('''
+            PasswordGenerator(
+                './fake_settings/sealed', logger=logger, gpg=gpg,
+                crypto_backend='aead'
+            ).compiled is not None
+        '''),
+        result=True
+    ),
+    Case(
+        name='lockout',
+        stimulus=dedent('''
+            PasswordGenerator(
+                './fake_settings/twins', logger=logger, gpg=gpg,
+                crypto_backend='aead')
+        '''),
+        error="fake_settings/twins/aead-key.gpg: No such file or directory.  Use 'abraxas --init <GPG ID>' to create it."
+    ),
+]
+try:
+    import cryptography
+    testCases += aeadCases
+    unavailable = []
+except ImportError:
+    # these tests are not skipped, each is reported as a failure so that a
+    # missing package cannot pass for a working backend
+    unavailable = aeadCases
+
+# Run tests {{{1
+for case in testCases:
+
+    testsRun += 1
+    if printTests:
+        print(status('Trying %d (%s):' % (testsRun, case.name)), case.stimulus)
+
+    failure = case.run()
+
+    if failure:
+        failures += 1
+        name, stimulus, result, expected, kind = failure
+        print(fail('Unexpected %s (%s):' % (kind, failures)))
+        print(info('    Case    :'), name)
+        print(info('    Given   :'), stimulus)
+        print(info('    Result  :'), result)
+        print(info('    Expected:'), expected)
+
+for case in unavailable:
+    testsRun += 1
+    failures += 1
+    print(fail('Unable to run (%s):' % failures))
+    print(info('    Case    :'), case.name)
+    print(info('    Reason  :'), 'the cryptography package is not installed.')
+
+# Print test summary {{{1
+numTests = 34
+assert testsRun == numTests, "Incorrect number of tests run (%s of %s)." % (testsRun, numTests)
+if printSummary:
+    print('%s: %s tests run, %s failures detected.' % (
+        fail('FAIL') if failures else succeed('PASS'), testsRun, failures
+    ))
+
+writeSummary(testsRun, failures)
+sys.exit(int(bool(failures)))
+
+# vim: set sw=4 sts=4 et:
@@ -8,12 +8,34 @@ from runtests import (
     cmdLineOpts, writeSummary, succeed, fail, info, status, warning,
     pythonCmd, coverageCmd
 )
-from abraxas import PasswordGenerator, PasswordError, Logging
+from abraxas import (
+    PasswordGenerator, PasswordError, Logging, ClipboardWriter, StdoutWriter,
+    JsonWriter, TTY_Writer)
+from abraxas.clipboard import LocalClipboard
+from abraxas.archive import _ShardedArchive
+from abraxas.crypto import AeadBackend, FakeGpg
+from abraxas.dictionary import Dictionary
+from abraxas.prefs import DICTIONARY_FILENAME
 from abraxas.prefs import GPG_BINARY
-from fileutils import remove
+from abraxas.secrets import Password, Passphrase
+from abraxas.timing import PhaseTimer
+from abraxas.titles import X11TitleProvider, FallbackTitleProvider
+from abraxas.vault import _Vault
+from fileutils import remove, Execute, ExecuteError, Spawner
+from glob import glob
 from textwrap import dedent
+import abraxas.charsets as charsets
+import abraxas.timing as timing
+import json
+import re
+import socket
+import struct
+import subprocess
 import sys
 import os
+import shutil
+import threading
+import time
 
 # Initialization (fold)
 fast, printSummary, printTests, printResults, colorize, parent, coverage = cmdLineOpts()
@@ -24,9 +46,21 @@ else:
 
 testsRun = 0
 failures = 0
+gpg = FakeGpg()
+    # most tests use the fake gpg, which runs no processes; those that check
+    # the use of gpg itself give gpg_home='test_key' instead
 remove('./generated_settings')
 os.chmod("test_key", 0o700)
 
+# Remove the state left in the test settings by earlier runs
+for path in [
+    './test_settings/archive.shards', './test_settings/archive.digests',
+    './test_settings/archive.gpg', './test_settings/archive.gpg.old',
+    './test_settings/vault.gpg', './test_settings/titles.cache',
+    './batch_home',
+] + glob('./test_settings/*.manifest'):
+    remove(path)
+
 class Case():
     CONTEXT = {}
     OUTPUT = []
@@ -103,10 +137,255 @@ class Exit(Case):
         sys.exit('TERMINATING TESTS UPON DEVELOPER REQUEST')
 
 # Utilities {{{1
+class Golden:
+    """
+    Stand-in for an account, used to check the secrets produced by
+    abraxas/secrets.py against those it produced before it was optimized.
+    """
+    def __init__(self, ID, **params):
+        self.ID = ID
+        self.params = params
+
+    def get_id(self):
+        return self.ID
+
+    def get_version(self):
+        return self.params.get('version', '')
+
+    def get_num_chars(self, default):
+        return self.params.get('num', default)
+
+    def get_num_words(self, default):
+        return self.params.get('num', default)
+
+    def get_alphabet(self, default):
+        return self.params.get('alphabet', default)
+
+    def get_separator(self, default):
+        return self.params.get('separator', default)
+
+    def get_prefix(self):
+        return self.params.get('prefix', '')
+
+    def get_suffix(self):
+        return self.params.get('suffix', '')
+
+def execute_error(*args, **kwargs):
+    # Return the message of the ExecuteError raised by Execute, if any.
+    try:
+        Execute(*args, **kwargs)
+    except ExecuteError as err:
+        return str(err)
+
+class CapturedStdout:
+    # Collects what is written to stdout while in the with statement.
+    def __enter__(self):
+        self.saved = sys.stdout
+        self.written = []
+        sys.stdout = self
+        return self
+
+    def __exit__(self, *args):
+        sys.stdout = self.saved
+
+    def write(self, text):
+        self.written.append(text)
+
+    def flush(self):
+        pass
+
+    def get_lines(self):
+        # the lines written with the color codes removed
+        text = ''.join(self.written)
+        return re.sub('\033\\[[0-9;]*m', '', text).split('\n')
+
+class FailedStatuses:
+    # Records the exit status of the children that a Spawner reports failed.
+    def __init__(self):
+        self.statuses = []
+
+    def __call__(self, cmd, status):
+        self.statuses.append(status)
+
+def python_cmd(code):
+    # Return the command that runs code with this python.
+    return [sys.executable, '-c', code]
+
+def encrypt_file(path):
+    # Create path.gpg, path encrypted with the fake gpg.
+    with open(path) as f:
+        encrypted = gpg.encrypt(f.read(), '4DC3AD14')
+    with open(path + '.gpg', 'w') as f:
+        f.write(str(encrypted))
+
 def create_bogus_file(filename):
     with open(filename, 'w') as f:
         f.write("bogus = 0")
 
+class StubXServer(threading.Thread):
+    # Answers the requests made by abraxas.x11 as an X server would, with the
+    # given titles for the active window, on a socket at path.
+    ROOT = 0x100
+    ACTIVE = 0x200
+    ATOMS = {b'_NET_ACTIVE_WINDOW': 300, b'_NET_WM_NAME': 301}
+
+    def __init__(self, path, net_wm_name=None, wm_name=None):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.display = path + ':0'
+        self.properties = {
+            (self.ROOT, 300): (32, struct.pack('<I', self.ACTIVE)),
+        }
+        if net_wm_name is not None:
+            self.properties[(self.ACTIVE, 301)] = (
+                8, net_wm_name.encode('utf-8'))
+        if wm_name is not None:
+            self.properties[(self.ACTIVE, 39)] = (8, wm_name.encode('latin-1'))
+        if os.path.exists(path):
+            os.remove(path)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(path)
+        self.listener.listen(1)
+        self.start()
+
+    @staticmethod
+    def recv(connection, length):
+        data = b''
+        while len(data) < length:
+            chunk = connection.recv(length - len(data))
+            if not chunk:
+                raise EOFError
+            data += chunk
+        return data
+
+    @staticmethod
+    def pad(data):
+        return data + b'\0' * (-len(data) % 4)
+
+    def run(self):
+        while True:
+            connection = self.listener.accept()[0]
+            try:
+                self.serve(connection)
+            except EOFError:
+                pass
+            connection.close()
+
+    def serve(self, connection):
+        name, data = struct.unpack('<6xHH2x', self.recv(connection, 12))
+        self.recv(connection, len(self.pad(b'x'*name)) + len(self.pad(b'x'*data)))
+        vendor = b'stub'
+        body = struct.pack(
+            '<IIIIHHBBBBBBBB4x', 0, 0, 0, 0, len(vendor), 65535, 1, 0,
+            0, 0, 32, 32, 8, 255
+        ) + vendor + struct.pack(
+            '<IIIIIHHHHHHIBBBB', self.ROOT, 0, 0, 0, 0, 1024, 768, 0, 0,
+            1, 1, 0, 0, 0, 24, 0)
+        connection.sendall(struct.pack('<BxHHH', 1, 11, 0, len(body)//4) + body)
+        sequence = 0
+        while True:
+            opcode, length = struct.unpack('<BxH', self.recv(connection, 4))
+            request = self.recv(connection, 4*length - 4)
+            sequence += 1
+            if opcode == 16:
+                length, = struct.unpack('<H', request[:2])
+                atom = self.ATOMS.get(request[4:4+length], 0)
+                reply = struct.pack('<BxHII20x', 1, sequence, 0, atom)
+            else:
+                window, atom = struct.unpack('<II', request[:8])
+                format, value = self.properties.get((window, atom), (0, b''))
+                reply = struct.pack(
+                    '<BBHIIII12x', 1, format, sequence,
+                    len(self.pad(value))//4, 31 if format else 0, 0,
+                    len(value)*8//format if format else 0
+                ) + self.pad(value)
+            connection.sendall(reply)
+
+def is_immutable(account):
+    try:
+        account.ID = 'changed'
+    except AttributeError:
+        return account.get_id() != 'changed'
+    return False
+
+class Ticker:
+    # Stand-in for the clock used by PhaseTimer that advances by step
+    # nanoseconds each time it is read.
+    def __init__(self, step):
+        self.step = step
+        self.time = 0
+
+    def __call__(self):
+        self.time += self.step
+        return self.time
+
+def run_batch(requests, options=()):
+    # Run 'abraxas --batch' with any further options on the requests
+    # (strings) and return its results.
+    # The settings are a fresh copy of the test settings placed where abraxas
+    # looks for them in the home directory ./batch_home.
+    settings_dir = './batch_home/.config/abraxas'
+    remove('./batch_home')
+    os.makedirs(settings_dir, 0o700)
+    for name in [
+        'accounts', 'more_accounts', 'yet_more_accounts', 'master', 'master2'
+    ]:
+        with open(os.path.join('./test_settings', name)) as f:
+            contents = f.read().replace('./test_settings/', settings_dir + '/')
+        with open(os.path.join(settings_dir, name), 'w') as f:
+            f.write(contents)
+        if name in ['master', 'master2']:
+            subprocess.check_call([
+                GPG_BINARY, '--homedir', 'test_key', '-r', '4DC3AD14',
+                '-e', os.path.join(settings_dir, name)
+            ])
+    env = dict(
+        os.environ, HOME=os.path.abspath('./batch_home'),
+        GNUPGHOME=os.path.abspath('./test_key'))
+    process = subprocess.Popen(
+        [sys.executable, 'main.py', '--batch'] + list(options), env=env,
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout, stderr = process.communicate(
+        '\n'.join(requests).encode('utf-8'))
+    return [json.loads(line) for line in stdout.decode('utf-8').splitlines()]
+
+def derive_concurrently(pw, account_ids, num_threads=8, repeats=10):
+    # Derive the secrets of the accounts from many threads at once using a
+    # single generator while another thread keeps changing the active account.
+    # Returns true if every thread gets the same secrets as a serial run.
+    from threading import Thread
+
+    def derive():
+        secrets = []
+        for account_id in account_ids:
+            account = pw.lookup_account(account_id, quiet=True)
+            secrets.append(pw.generate_password(account))
+            for index in range(len(account.get_security_questions())):
+                secrets.append(pw.generate_answer(index, account))
+        return secrets
+
+    def worker():
+        for i in range(repeats):
+            results.append(derive())
+
+    def meddler():
+        for i in range(repeats):
+            for account_id in account_ids:
+                pw.get_account(account_id, quiet=True)
+
+    expected = derive()
+    results = []
+    threads = [Thread(target=worker) for i in range(num_threads)]
+    threads.append(Thread(target=meddler))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return (
+        len(results) == num_threads*repeats and
+        all(result == expected for result in results)
+    )
+
 # Test cases {{{1
 testCases = [
     # Run Password with a bogus settings directory
@@ -184,7 +463,7 @@ testCases = [
     ),
     Case(
         name='crone',
-        stimulus="pw = PasswordGenerator('./generated_settings', '4DC3AD14', logger, 'test_key')",
+        stimulus="pw = PasswordGenerator('./generated_settings', '4DC3AD14', logger, gpg=gpg)",
         output=dedent("""
             generated_settings/master.gpg: created.
             generated_settings/accounts: created.
@@ -273,15 +552,30 @@ testCases = [
         name='cattleman',
         stimulus="pw.print_changed_secrets()"
     ),
-
-    # Run PasswordGenerator with the test settings directory
+    Case(
+        name='ledgerman',
+        stimulus="os.path.exists('generated_settings/archive.digests')",
+        result=True
+    ),
+    Case(
+        name='strongbox',
+        stimulus=dedent('''
+            os.rename(
+                'generated_settings/archive.shards',
+                'generated_settings/archive.hidden')
+            pw.print_changed_secrets()
+            os.rename(
+                'generated_settings/archive.hidden',
+                'generated_settings/archive.shards')
+        ''')
+    ),
     Case(
         name='marsh',
         stimulus="os.system('rm -f test_settings/master.gpg')"
     ),
     Case(
         name='peasant',
-        stimulus="os.system('%s --homedir test_key -r 4DC3AD14 -e test_settings/master')" % GPG_BINARY
+        stimulus="encrypt_file('test_settings/master')"
     ),
     Case(
         name='digestion',
@@ -289,16 +583,295 @@ testCases = [
     ),
     Case(
         name='holocaust',
-        stimulus="os.system('%s --homedir test_key -r 4DC3AD14 -e test_settings/master2')" % GPG_BINARY
+        stimulus="encrypt_file('test_settings/master2')"
     ),
     Case(
         name='torch',
-        stimulus="pw = PasswordGenerator('./test_settings', logger=logger, gpg_home='test_key')"
+        stimulus="pw = PasswordGenerator('./test_settings', logger=logger, gpg=gpg)"
     ),
     Case(
         name='crosswind',
         stimulus="pw.read_accounts()"
     ),
+    Case(
+        name='manifold',
+        stimulus="os.path.exists('test_settings/accounts.manifest')",
+        result=True
+    ),
+    Case(
+        name='lodestar',
+        stimulus=dedent('''
+            lazy = PasswordGenerator(
+                './test_settings', logger=logger, gpg=gpg)
+            lazy.read_accounts()
+            account = lazy.get_account('toms')
+        ''')
+    ),
+    Case(
+        name='sextant',
+        stimulus="sorted(os.path.basename(path) for path in lazy.accounts.loaded)",
+        result=['accounts', 'yet_more_accounts']
+    ),
+    Case(
+        name='sundial',
+        stimulus="lazy.generate_password(account)",
+        result='tP,)olY+lA~Qt>4/APS4{C+drq$]Edg.Gs"d2]YEGnL>cP-5IYKEs_WXso*L{U z'
+    ),
+    Case(
+        name='quadrant',
+        stimulus="sorted(os.path.basename(path) for path in lazy.master_password.loaded)",
+        result=['master.gpg']
+    ),
+    Case(
+        name='gnomon',
+        stimulus="lazy.generate_password(lazy.get_account('colgate'))",
+        result='white teeth'
+    ),
+    Case(
+        name='armillary',
+        stimulus="sorted(os.path.basename(path) for path in lazy.master_password.loaded)",
+        result=['master.gpg', 'master2.gpg']
+    ),
+    Case(
+        name='astrolabe',
+        stimulus="' '.join(sorted(lazy.all_accounts()))",
+        result='aquafresh colgate crest sensodyne toms'
+    ),
+    Case(
+        name='beacon',
+        stimulus="lazy.lookup_account(None, title='crest.com - Mozilla Firefox').get_id()",
+        result='crest'
+    ),
+    Case(
+        name='lighthouse',
+        stimulus=dedent('''
+            lazy = PasswordGenerator(
+                './test_settings', logger=logger, gpg=gpg)
+            lazy.read_accounts()
+            list(lazy.all_accounts())
+            lazy.accounts.titles.add('Shared sign on', 'colgate')
+        ''')
+    ),
+    Case(
+        name='foghorn',
+        stimulus="(lazy.lookup_account(None, title='crest.com - Mozilla Firefox').get_id(), lazy.lookup_account(None, title='Shared sign on').get_id())",
+        result=('crest', 'colgate')
+    ),
+    Case(
+        name='buoy',
+        stimulus=dedent('''
+            os.utime('test_settings/more_accounts', None)
+            lazy = PasswordGenerator(
+                './test_settings', logger=logger, gpg=gpg)
+            lazy.read_accounts()
+            list(lazy.all_accounts())
+            lazy.lookup_account(None, title='Shared sign on')
+        '''),
+        error="Cannot determine desired account ID.\nExamine './test_settings/log' for the details."
+    ),
+    Case(
+        name='phosphor',
+        stimulus=dedent('''
+            xserver = StubXServer(
+                os.path.abspath('.stub-x11'),
+                net_wm_name=u'crest.com - Mozilla Firefox \u2014 Private',
+                wm_name='crest.com - Mozilla Firefox')
+        ''')
+    ),
+    Case(
+        name='raster',
+        stimulus="X11TitleProvider(xserver.display).get_title()",
+        result=u'crest.com - Mozilla Firefox \u2014 Private'
+    ),
+    Case(
+        name='scanline',
+        stimulus=dedent('''
+            xserver = StubXServer(
+                os.path.abspath('.stub-x11'),
+                wm_name='crest.com - Mozilla Firefox')
+        ''')
+    ),
+    Case(
+        name='flyback',
+        stimulus=dedent('''
+            lazy = PasswordGenerator(
+                './test_settings', logger=logger, gpg=gpg,
+                title_provider=FallbackTitleProvider([
+                    X11TitleProvider(':99'),
+                    X11TitleProvider(xserver.display),
+                ], logger))
+            lazy.read_accounts()
+        ''')
+    ),
+    Case(
+        name='retrace',
+        stimulus="lazy.lookup_account(None).get_id()",
+        result='crest'
+    ),
+    Case(
+        name='blanking',
+        stimulus="FallbackTitleProvider([X11TitleProvider('bogus')], logger).get_title()",
+        error='bogus: invalid display.'
+    ),
+    Case(
+        name='cellarer',
+        stimulus=dedent('''
+            pw.archive_secrets()
+            shards = sorted(os.listdir('test_settings/archive.shards'))
+            stamps = [
+                os.stat('test_settings/archive.shards/' + each).st_mtime
+                for each in shards
+            ]
+            pw.archive_secrets()
+        ''')
+    ),
+    Case(
+        name='bursar',
+        stimulus="len(shards) > 1 and stamps == [os.stat('test_settings/archive.shards/' + each).st_mtime for each in shards]",
+        result=True
+    ),
+    Case(
+        name='tailings',
+        stimulus=dedent('''
+            shards = sorted(os.listdir('test_settings/archive.shards'))
+            stale = sorted(
+                set(name + '.gpg' for name in _ShardedArchive.NAMES) -
+                set(shards))[0]
+            shutil.copy(
+                'test_settings/archive.shards/' + shards[0],
+                'test_settings/archive.shards/' + stale)
+            create_bogus_file('test_settings/archive.shards/notes.gpg')
+            pw.archive_secrets()
+        ''')
+    ),
+    Case(
+        name='spoilheap',
+        stimulus="sorted(os.listdir('test_settings/archive.shards')) == sorted(shards + ['notes.gpg'])",
+        result=True
+    ),
+    Case(
+        name='oldvault',
+        stimulus=dedent('''
+            remove('test_settings/archive.shards/notes.gpg')
+            shutil.copy(
+                'test_settings/archive.shards/' + shards[0],
+                'test_settings/archive.gpg')
+            pw.archive_secrets()
+        '''),
+        output="test_settings/archive.gpg: superseded by test_settings/archive.shards, renamed to test_settings/archive.gpg.old."
+    ),
+    Case(
+        name='reliquary',
+        stimulus="os.path.exists('test_settings/archive.gpg.old') and not os.path.exists('test_settings/archive.gpg')",
+        result=True
+    ),
+    Case(
+        name='exchequer',
+        stimulus="pw.print_changed_secrets()"
+    ),
+    Case(
+        name='crucible',
+        stimulus="pw.compile_vault()"
+    ),
+    Case(
+        name='alembic',
+        stimulus="os.path.exists('test_settings/vault.gpg')",
+        result=True
+    ),
+    Case(
+        name='retort',
+        stimulus=dedent('''
+            compiled = PasswordGenerator(
+                './test_settings', logger=logger, gpg=gpg)
+            compiled.read_accounts()
+        ''')
+    ),
+    Case(
+        name='athanor',
+        stimulus="(compiled.compiled is not None, compiled.master_password.loaded, compiled.accounts.loaded)",
+        result=(True, {}, {})
+    ),
+    Case(
+        name='cucurbit',
+        stimulus="compiled.generate_password(compiled.get_account('Cg'))",
+        result='white teeth'
+    ),
+    Case(
+        name='pelican',
+        stimulus="compiled.generate_password(compiled.get_account('toms'))",
+        result='tP,)olY+lA~Qt>4/APS4{C+drq$]Edg.Gs"d2]YEGnL>cP-5IYKEs_WXso*L{U z'
+    ),
+    Case(
+        name='aludel',
+        stimulus="' '.join(sorted(compiled.all_accounts()))",
+        result='aquafresh colgate crest sensodyne toms'
+    ),
+    Case(
+        name='mercury',
+        stimulus=dedent('''
+            remove('test_settings/titles.cache')
+            compiled.accounts.titles.add('Vault sign on', 'toms')
+        ''')
+    ),
+    Case(
+        name='sulphur',
+        stimulus="os.path.exists('test_settings/titles.cache')",
+        result=True
+    ),
+    Case(
+        name='azoth',
+        stimulus=dedent('''
+            reread = PasswordGenerator(
+                './test_settings', logger=logger, gpg=gpg)
+            reread.read_accounts()
+        ''')
+    ),
+    Case(
+        name='quintessence',
+        stimulus="(reread.compiled is not None, reread.accounts.titles.lookup('Vault sign on', ['colgate', 'toms']))",
+        result=(True, 'toms')
+    ),
+    Case(
+        name='slag',
+        stimulus=dedent('''
+            create_bogus_file('test_settings/vault.gpg')
+            corrupted = PasswordGenerator(
+                './test_settings', logger=logger, gpg=gpg)
+            corrupted.read_accounts()
+        ''')
+    ),
+    Case(
+        name='dross',
+        stimulus="(corrupted.compiled, corrupted.generate_password(corrupted.get_account('Cg')))",
+        result=(None, 'white teeth')
+    ),
+    Case(
+        name='cupel',
+        stimulus="PasswordGenerator('./test_settings', logger=logger, gpg=gpg).compiled is not None",
+        result=True
+    ),
+    Case(
+        name='tincture',
+        stimulus=dedent('''
+            loop = {}
+            loop['loop'] = loop
+            vault = _Vault('test_settings/vault.new.gpg', compiled.gpg, logger)
+        ''')
+    ),
+    Case(
+        name='distillate',
+        stimulus="not (vault.save(loop, [], 'hash', '4DC3AD14', required=False) or os.path.exists('test_settings/vault.new.gpg'))",
+        result=True
+    ),
+    Case(
+        name='elixir',
+        stimulus="vault.save(loop, [], 'hash', '4DC3AD14')",
+        error="cannot compile vault: Circular reference detected"
+    ),
+    Case(
+        name='calcinator',
+        stimulus="os.system('rm -f test_settings/vault.gpg')"
+    ),
     Case(
         name='tablet',
         stimulus="';'.join(['%s(%s)' % (each[0], ','.join(each[1])) for each in sorted(pw.find_accounts('col'), key=lambda x: x[0])])",
@@ -368,6 +941,145 @@ testCases = [
         stimulus="' '.join(pw.generate_answer(1))",
         result='How many teeth are missing? animal siege bootee entertain'
     ),
+    Case(
+        name='clipper',
+        stimulus=dedent('''
+            clipboard = LocalClipboard()
+            writer = ClipboardWriter(
+                pw, 60, logger, clipboard=clipboard, queue=True)
+            writer.write_account_entry('username')
+            writer.write_password()
+            writer.process_output()
+        ''')
+    ),
+    Case(
+        name='staple',
+        stimulus="clipboard.paste()",
+        result='smiler'
+    ),
+    Case(
+        name='paperweight',
+        stimulus="clipboard.paste()",
+        result='crewman ledge cranny prelate'
+    ),
+    Case(
+        name='inkwell',
+        stimulus="clipboard.paste()",
+        result='crewman ledge cranny prelate'
+    ),
+    Case(
+        name='blotter',
+        stimulus=dedent('''
+            writer = ClipboardWriter(pw, 60, logger, clipboard=clipboard)
+            writer.write_account_entry('username')
+            writer.write_password()
+            writer.process_output()
+        ''')
+    ),
+    Case(
+        name='quill',
+        stimulus="clipboard.paste()",
+        result='username: smiler\ncrewman ledge cranny prelate'
+    ),
+    Case(
+        name='eraser',
+        stimulus=dedent('''
+            writer = ClipboardWriter(pw, 0, logger, clipboard=clipboard)
+            writer.write_password()
+            writer.process_output()
+        ''')
+    ),
+    Case(
+        name='blank',
+        stimulus="clipboard.paste() == ''",
+        result=True
+    ),
+    Case(
+        name='ledger',
+        stimulus=dedent('''
+            writer = StdoutWriter(pw, 60, logger)
+            writer.write_account_entry('username')
+            writer.write_answer(1)
+            writer.write_password()
+        ''')
+    ),
+    Case(
+        name='tally',
+        stimulus="list(writer.get_output())",
+        result=[
+            'smiler', 'animal siege bootee entertain',
+            'crewman ledge cranny prelate'
+        ]
+    ),
+    Case(
+        name='teletype',
+        stimulus=dedent('''
+            writer = TTY_Writer(pw, 0.01, logger)
+            writer.write_account_entry('username')
+            writer.write_password()
+            writer.write_account_entry('username')
+            writer.write_answer(1)
+            with CapturedStdout() as captured:
+                writer.process_output()
+        ''')
+    ),
+    Case(
+        name='ticker',
+        stimulus="captured.get_lines()",
+        result=[
+            'USERNAME: smiler',
+            'PASSWORD: crewman ledge cranny prelate',
+            'USERNAME: smiler',
+            'HOW MANY TEETH ARE MISSING?: animal siege bootee entertain',
+            '\033[3A\033[2K\r\033[3B\033[1A\033[2K\r\033[1B'
+        ]
+    ),
+    Case(
+        name='typebar',
+        stimulus=dedent('''
+            writer = TTY_Writer(pw, 0.01, logger)
+            writer.write_account_entry('username')
+            writer.write_password()
+            with CapturedStdout() as captured:
+                writer.process_output()
+        ''')
+    ),
+    Case(
+        name='platen',
+        stimulus="captured.get_lines()",
+        result=[
+            'USERNAME: smiler',
+            'PASSWORD: crewman ledge cranny prelate',
+            '\033[1A\033[2K\r\033[1B'
+        ]
+    ),
+    Case(
+        name='almanac',
+        stimulus=dedent('''
+            writer = JsonWriter(pw, 60, logger)
+            writer.write_account_entry('username')
+            writer.write_question(0)
+            writer.write_answer(1)
+            writer.write_password()
+        ''')
+    ),
+    Case(
+        name='gazetteer',
+        stimulus="writer.get_object()",
+        result={
+            'account': 'crest',
+            'fields': {'username': 'smiler'},
+            'password': 'crewman ledge cranny prelate',
+            'questions': [{
+                'index': 0,
+                'question': 'How many teeth do you have?',
+            }, {
+                'index': 1,
+                'question': 'How many teeth are missing?',
+                'answer': 'animal siege bootee entertain',
+            }],
+        }
+    ),
     Case(
         name='footplate',
         stimulus="account = pw.get_account('colgate')"
@@ -424,6 +1136,142 @@ testCases = [
         stimulus="pw.generate_password()",
         result='toothpaste'
     ),
+    Case(
+        name='lozenge',
+        stimulus="account.get_password_type()",
+        result='words'
+    ),
+    Case(
+        name='harbour',
+        stimulus="account = pw.get_account('crest')"
+    ),
+    Case(
+        name='drumstick',
+        stimulus="pw.lookup_account('toms').get_id() + ' ' + pw.account.get_id()",
+        result='toms crest'
+    ),
+    Case(
+        name='mantle',
+        stimulus="is_immutable(account)",
+        result=True
+    ),
+    Case(
+        name='stockpot',
+        stimulus=dedent('''
+            pooled = {
+                'one': {'alphabet': charsets.ALPHANUMERIC + charsets.PUNCTUATION},
+                'two': {
+                    'alphabet': charsets.ALPHANUMERIC + charsets.PUNCTUATION,
+                    'aliases': [charsets.DIGITS + 'x'],
+                },
+                'three': {'aliases': [charsets.DIGITS + 'x']},
+            }
+            pw.accounts._intern_values(pooled)
+        ''')
+    ),
+    Case(
+        name='bouillon',
+        stimulus="(pooled['one']['alphabet'] is pooled['two']['alphabet'], pooled['two']['aliases'][0] is pooled['three']['aliases'][0])",
+        result=(True, True)
+    ),
+    Case(
+        name='carapace',
+        stimulus="not hasattr(pw.lookup_account('toms', quiet=True), '__dict__')",
+        result=True
+    ),
+    Case(
+        name='gristle',
+        stimulus="derive_concurrently(pw, ['crest', 'sensodyne', 'toms', 'aquafresh', 'colgate'])",
+        result=True
+    ),
+    Case(
+        name='dispatch',
+        stimulus=dedent('''
+            batch = run_batch([
+                '{"account": "crest", "fields": ["username", "password"]}',
+                '{"account": "nonesuch"}',
+                '{"account": "crest", "fields": ["bogus"]}',
+                'not json',
+                '{"account": "Crest", "question": 1}',
+            ])
+        ''')
+    ),
+    Case(
+        name='courier',
+        stimulus="batch[0]",
+        result={'account': 'crest', 'output': ['smiler', 'crewman ledge cranny prelate']}
+    ),
+    Case(
+        name='deadletter',
+        stimulus="batch[1]",
+        result={'account': 'nonesuch', 'error': 'nonesuch: account not found.'}
+    ),
+    Case(
+        name='parcel',
+        stimulus="batch[2]",
+        result={'account': 'crest', 'error': 'invalid request: unknown field: bogus.'}
+    ),
+    Case(
+        name='envelope',
+        stimulus="batch[3]['error'].startswith('invalid request: ')",
+        result=True
+    ),
+    Case(
+        name='telegram',
+        stimulus="(len(batch), batch[4])",
+        result=(5, {'account': 'Crest', 'output': ['animal siege bootee entertain']})
+    ),
+    Case(
+        name='hourglass',
+        stimulus=dedent('''
+            clock = timing.now
+            timing.now = Ticker(1000000)
+            timer = PhaseTimer()
+            with timer.phase('outer'):
+                with timer.phase('inner'):
+                    pass
+                with timer.phase('inner'):
+                    pass
+            with timer.phase('other'):
+                pass
+            timing.now = clock
+        ''')
+    ),
+    Case(
+        name='meridian',
+        stimulus="(timer.total('outer'), timer.total('outer', 'inner'), timer.total('inner'))",
+        result=(5000000, 2000000, 0)
+    ),
+    Case(
+        name='clepsydra',
+        stimulus="timer.summary()",
+        result=dedent('''
+            Timings:
+                outer: 5.000 ms
+                    inner: 2.000 ms (2 times)
+                other: 1.000 ms
+        ''').strip()
+    ),
+    Case(
+        name='metronome',
+        stimulus="timer.collapsed()",
+        result='outer 3000\nouter;inner 2000\nother 1000\n'
+    ),
+    Case(
+        name='stopwatch',
+        stimulus=dedent('''
+            run_batch(
+                [json.dumps({'account': 'Crest'})],
+                ['--profile=batch_home/run.folded'])
+            with open('batch_home/run.folded') as f:
+                stacks = [line.rsplit(' ', 1) for line in f.read().splitlines()]
+        ''')
+    ),
+    Case(
+        name='chronograph',
+        stimulus="set(['dictionary', 'read accounts']) <= set(path.split(';')[0] for path, time in stacks) and all(time.isdigit() for path, time in stacks)",
+        result=True
+    ),
     Case(
         name='puree',
         stimulus="account = pw.get_account('none')",
@@ -434,6 +1282,11 @@ testCases = [
         stimulus="account.get_id()",
         result='none'
     ),
+    Case(
+        name='tinsel',
+        stimulus="account.get_password_type()",
+        result='words'
+    ),
     Case(
         name='frizzy',
         stimulus="pw.generate_password()",
@@ -445,6 +1298,66 @@ testCases = [
         error="There is no security question #5."
     ),
 
+    # Check the secrets against golden outputs
+    Case(
+        name='nugget',
+        stimulus=dedent('''
+            password = Password(logger.display)
+            passphrase = Passphrase(logger.display)
+            dictionary = Dictionary(DICTIONARY_FILENAME, '.', logger)
+        ''')
+    ),
+    Case(
+        name='ingot',
+        stimulus="password.generate('fairy tale', Golden('bank'))",
+        result='OBXcj4YYpZ0E'
+    ),
+    Case(
+        name='bullion',
+        stimulus="password.generate('fairy tale', Golden('bank', version='2', num=20, alphabet=charsets.DISTINGUISHABLE))",
+        result='a5XYrH4FCMiWErHQDfkz'
+    ),
+    Case(
+        name='doubloon',
+        stimulus="password.generate('fairy tale', Golden('pin', num=6, alphabet=charsets.DIGITS, prefix='<', suffix='>'))",
+        result='<969986>'
+    ),
+    Case(
+        name='sovereign',
+        stimulus="password.generate('fairy tale', Golden('long', num=70, alphabet=charsets.PRINTABLE))",
+        result='ZJg9_O5SoN-zrkIk=BrMhV/r!g ~>0%k0Y4e|V]t1s%GqxuMh/Ne}DOgByzrSilY'
+    ),
+    Case(
+        name='farthing',
+        stimulus="password.generate('fairy tale', Golden('none', num=-1)) == ''",
+        result=True
+    ),
+    Case(
+        name='drachma',
+        stimulus="password.generate('fairy tale', Golden('greek', num=10, alphabet=u'\\u03b1\\u03b2\\u03b3\\u03b4\\u03b5\\u4e2d'))",
+        result=u'\u03b4\u03b2\u4e2d\u4e2d\u03b5\u03b4\u03b1\u03b3\u03b1\u03b1'
+    ),
+    Case(
+        name='shekel',
+        stimulus="passphrase.generate('fairy tale', Golden('mail'), dictionary)",
+        result='appertain cramp moron manifesto'
+    ),
+    Case(
+        name='guinea',
+        stimulus="passphrase.generate('fairy tale', Golden('mail', version='1', num=6, separator='-'), dictionary)",
+        result='ferryboat-ravish-blockade-provision-marking-tress'
+    ),
+    Case(
+        name='ducat',
+        stimulus="passphrase.generate('fairy tale', Golden('max', num=40, separator=''), dictionary)",
+        result='spireavowalgrangevindicatebraggartobsessiondairymaidfreakphobiccretinprivytonicmenialpostbagexpendoverreachproductplebeianencouragecondoneshreddershellliningbeakerlumbercadgereadjustwheatmossylifetimeclimbgutter'
+    ),
+    Case(
+        name='florin',
+        stimulus="passphrase.generate('fairy tale', Golden('mail', num=3), dictionary, 'Where were you born?')",
+        result='contort bonfire impurity'
+    ),
+
     # Run PasswordGenerator in stateless mode
     Case(
         name='vacillate',
@@ -463,6 +1376,39 @@ testCases = [
         stimulus="pw.generate_password(master_password='bottom')",
         result='charlatan routine stagy printout'
     ),
+    Case(
+        name='pantry',
+        stimulus="pw.master_password.cache.add(None, 'bottom')"
+    ),
+    Case(
+        name='larceny',
+        stimulus="pw.generate_password()",
+        result='charlatan routine stagy printout'
+    ),
+    Case(
+        name='scullery',
+        stimulus=dedent('''
+            secret = pw.master_password.cache.entries[None][0]
+            pw.forget_master_passwords()
+        ''')
+    ),
+    Case(
+        name='scour',
+        stimulus="(pw.master_password.cache.get(None), set(secret))",
+        result=(None, set([0]))
+    ),
+    Case(
+        name='stale',
+        stimulus=dedent('''
+            pw.master_password.cache.ttl = -1
+            pw.master_password.cache.add(None, 'bottom')
+        ''')
+    ),
+    Case(
+        name='spoilage',
+        stimulus="pw.master_password.cache.get(None) is None",
+        result=True
+    ),
     Case(
         name='stiff',
         stimulus="pw = PasswordGenerator(stateless=True, logger=logger)"
@@ -475,11 +1421,191 @@ testCases = [
         name='nibble',
         stimulus="account = pw.get_account('fuzzy')"
     ),
+    Case(
+        name='doily',
+        stimulus="account.get_data().maps[0] is pw.accounts.template",
+        result=True
+    ),
     Case(
         name='racialist',
         stimulus="pw.generate_password(master_password='bottom')",
         result='BwHWJgh3MPDh'
     ),
+    Case(
+        name='chaperone',
+        stimulus=dedent('''
+            with open('test_settings/master.gpg', 'rb') as f:
+                decrypted = AeadBackend(b'0'*32, lazy.gpg).decrypt(f.read())
+        ''')
+    ),
+    Case(
+        name='duenna',
+        stimulus="decrypted.ok and b'secrets_hash' in decrypted.data",
+        result=True
+    ),
+    Case(
+        name='yardstick',
+        stimulus=dedent('''
+            with open(os.devnull, 'w') as quiet:
+                status = subprocess.call([
+                    sys.executable, 'bench.py', '--sizes', '5',
+                    '--repeat', '1', '--output', './bench.json'
+                ], stderr=quiet)
+                comparison = subprocess.call([
+                    sys.executable, 'bench.py', '--sizes', '5',
+                    '--repeat', '1', '--only', 'generate',
+                    '--compare', './bench.json', '--threshold', '1000'
+                ], stdout=quiet, stderr=quiet)
+            with open('./bench.json') as f:
+                benchmarks = json.load(f)
+            remove('./bench.json')
+        ''')
+    ),
+    Case(
+        name='benchmark',
+        stimulus="(status, comparison, sorted(benchmarks), set(['load@5', 'password.generate@5', 'passphrase.generate@5', 'find_account_id@5', 'cli.lookup.cold']) <= set(benchmarks['results']))",
+        result=(0, 0, ['meta', 'results'], True)
+    ),
+    Case(
+        name='conduit',
+        stimulus=dedent('''
+            process = Execute(python_cmd(
+                'import sys; sys.stdout.write("out"); sys.stderr.write("err")'))
+        ''')
+    ),
+    Case(
+        name='culvert',
+        stimulus="(process.stdout, process.stderr, process.status)",
+        result=('out', 'err', 0)
+    ),
+    Case(
+        name='spillway',
+        stimulus=dedent('''
+            execute_error(python_cmd(
+                'import sys; sys.stderr.write("broken"); sys.exit(3)'))
+        ''').strip(),
+        result='broken'
+    ),
+    Case(
+        name='weir',
+        stimulus="(execute_error(python_cmd('import sys; sys.exit(3)')), Execute(python_cmd('import sys; sys.exit(3)'), accept=(0, 3)).status)",
+        result=('unexpected exit status (3).', 3)
+    ),
+    Case(
+        name='floodgate',
+        stimulus=dedent('''
+            start = time.time()
+            message = execute_error(
+                python_cmd('import time; time.sleep(10)'), timeout=0.2)
+            elapsed = time.time() - start
+        ''')
+    ),
+    Case(
+        name='lock',
+        stimulus="(message, elapsed < 5)",
+        result=('timed out after 0.2 seconds.', True)
+    ),
+    Case(
+        name='sluice',
+        stimulus="Execute(python_cmd('import sys; sys.stdout.write(sys.stdin.read().upper())'), stdin='hush').stdout",
+        result='HUSH'
+    ),
+    Case(
+        name='aqueduct',
+        stimulus="len(Execute(python_cmd('import sys; sys.stdout.write(sys.stdin.read())'), stdin='x'*1000000, timeout=30).stdout)",
+        result=1000000
+    ),
+    Case(
+        name='millrace',
+        stimulus=dedent('''
+            lines = []
+            process = Execute(
+                python_cmd('import sys; sys.stdout.write("a\\\\nb\\\\nc")'),
+                stdoutCallback=lines.append)
+        ''')
+    ),
+    Case(
+        name='headrace',
+        stimulus="(lines, process.stdout)",
+        result=(['a\n', 'b\n', 'c'], 'a\nb\nc')
+    ),
+    Case(
+        name='tailrace',
+        stimulus=dedent('''
+            process = Execute(
+                python_cmd('import sys; sys.stdout.write(sys.stdin.read())'),
+                stdin='later', wait=False)
+            status = process.wait()
+        ''')
+    ),
+    Case(
+        name='penstock',
+        stimulus="(status, process.stdout)",
+        result=(0, 'later')
+    ),
+    Case(
+        name='outrider',
+        stimulus=dedent('''
+            failed = FailedStatuses()
+            spawner = Spawner(onFailure=failed)
+            remove('./spawned')
+            pid = spawner.run(python_cmd(dedent("""
+                import sys, time
+                time.sleep(0.3)
+                with open('./spawned', 'w') as f:
+                    f.write(sys.stdin.read())
+                sys.exit(2)
+            """)), stdin='hush')
+            running = len(spawner.children)
+            spawner.flush()
+            with open('./spawned') as f:
+                spawned = f.read()
+            remove('./spawned')
+        ''')
+    ),
+    Case(
+        name='courser',
+        stimulus="(type(pid) is int, running, spawned, spawner.children, failed.statuses)",
+        result=(True, 1, 'hush', [], [2])
+    ),
+    Case(
+        name='laggard',
+        stimulus=dedent('''
+            spawner = Spawner(timeout=0.2)
+            spawner.run(python_cmd('import time; time.sleep(10)'))
+            spawner.run(python_cmd('import time; time.sleep(10)'), detach=True)
+            start = time.time()
+            spawner.flush()
+            elapsed = time.time() - start
+            lingering = len(spawner.children)
+            for cmd, process, detached in spawner.children:
+                process.kill()
+                process.wait()
+        ''')
+    ),
+    Case(
+        name='straggler',
+        stimulus="(elapsed < 5, lingering)",
+        result=(True, 2)
+    ),
+    Case(
+        name='herald',
+        stimulus=dedent('''
+            sent = []
+            notifying = Logging(argv=['abraxas'], use_notifier=True)
+            notifying.spawner.run = sent.append
+            notifying.display('first')
+            notifying.display('second')
+            queued = len(sent)
+            notifying.notify()
+            notifying.notify()
+        ''')
+    ),
+    Case(
+        name='crier',
+        stimulus="(queued, [each[-1] for each in sent])",
+        result=(0, ['first\nsecond'])
+    ),
 ]
 
 # Run tests {{{1
@@ -501,7 +1627,7 @@ for case in testCases:
         print(info('    Expected:'), expected)
 
 # Print test summary {{{1
-numTests = 76
+numTests = 198
 assert testsRun == numTests, "Incorrect number of tests run (%s of %s)." % (testsRun, numTests)
 if printSummary:
     print('%s: %s tests run, %s failures detected.' % (
@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Check the Secrets Against the Test Vectors
+#
+# test_vectors.json.gz holds tens of thousands of test vectors, each the
+# master password, account parameters and salt given to the code that
+# generates secrets along with the secret it produced.  Regenerating them all
+# confirms that a change to abraxas/secrets.py, abraxas/charsets.py or the
+# dictionary has not changed any password, pass phrase or answer.  Unlike the
+# SHA1 stamps in prefs.py, which change with any edit to these files, the
+# vectors allow the code to be rewritten, for speed say, as long as it still
+# produces the same secrets.
+#
+# Each vector is a test.  Use --generate to replace the vectors with ones
+# produced by the current code, but only do so if the secrets are known to be
+# right, as the vectors are the record of what the secrets must be.
+
+# Imports (fold)
+from __future__ import print_function, division
+from runtests import (
+    clp, cmdLineOpts, writeSummary, succeed, fail, info, status, warning
+)
+from abraxas import Logging, PasswordError
+from abraxas.dictionary import Dictionary
+from abraxas.prefs import DICTIONARY_FILENAME
+from abraxas.secrets import Passphrase, Password
+import abraxas.charsets
+import gzip
+import json
+import random
+import sys
+
+# Initialization (fold)
+clp.add_arg(
+    '--generate', action='store_true',
+    help="replace the test vectors with those produced by the current code")
+fast, printSummary, printTests, printResults, colorize, parent, coverage = cmdLineOpts()
+VECTORS_FILENAME = 'test_vectors.json.gz'
+NUM_VECTORS = {'chars': 10000, 'words': 8000, 'answer': 4000}
+CHARSETS = [
+    'LOWERCASE', 'UPPERCASE', 'LETTERS', 'DIGITS', 'ALPHANUMERIC',
+    'HEXDIGITS', 'PUNCTUATION', 'WHITESPACE', 'PRINTABLE', 'DISTINGUISHABLE'
+]
+
+logger = Logging(exception=PasswordError)
+dictionary = Dictionary(DICTIONARY_FILENAME, '.', logger)
+passphrase = Passphrase(logger.display)
+password = Password(logger.display)
+
+# Account stand-in (fold)
+class Vector:
+    """
+    Test vector
+
+    Provides the methods of an account used when generating secrets.  A
+    parameter that is not given in the vector gives the default, as it would
+    for an account.
+    """
+
+    def __init__(self, fields, alphabets):
+        self.fields = fields
+        self.alphabets = alphabets
+
+    def _get(self, name, default):
+        return self.fields.get(name, default)
+
+    def get_id(self):
+        return self.fields['id']
+
+    def get_version(self):
+        return self._get('version', '')
+
+    def get_num_chars(self, default):
+        return self._get('num', default)
+
+    def get_num_words(self, default):
+        return self._get('num', default)
+
+    def get_alphabet(self, default):
+        # the alphabets are shared by many vectors and so are given by index
+        if 'alphabet' in self.fields:
+            return self.alphabets[self.fields['alphabet']]
+        return default
+
+    def get_separator(self, default):
+        return self._get('separator', default)
+
+    def get_prefix(self):
+        return self._get('prefix', '')
+
+    def get_suffix(self):
+        return self._get('suffix', '')
+
+def generate_secret(vector):
+    fields = vector.fields
+    if fields['type'] == 'chars':
+        return password.generate(fields['master'], vector)
+    return passphrase.generate(
+        fields['master'], vector, dictionary, fields.get('salt', ''))
+
+# Generate the vectors (fold)
+def choose_text(rand, pools, max_length):
+    pool = rand.choice(pools)
+    return ''.join(
+        rand.choice(pool) for i in range(rand.randint(0, max_length)))
+
+def generate_vectors():
+    # The parameters are chosen at random, but every charset, length, number
+    # of words and separator is covered, along with alphabets that have
+    # characters beyond latin-1 (which take a different path through
+    # Password.generate) and text that is not ASCII.
+    rand = random.Random(2014)
+    text_pools = [
+        abraxas.charsets.LOWERCASE,
+        abraxas.charsets.PRINTABLE,
+        abraxas.charsets.ALPHANUMERIC + u'\xe9\xfc\xdfλ中\U0001f511',
+    ]
+    alphabets = [getattr(abraxas.charsets, name) for name in CHARSETS] + [
+        abraxas.charsets.exclude(abraxas.charsets.PRINTABLE, '\t'),
+        abraxas.charsets.ALPHANUMERIC + abraxas.charsets.PUNCTUATION + ' ',
+        'x', '01', u'\xe0\xe9\xee\xf5\xfc\xc7\xdf',
+        u''.join(chr(i) if str is not bytes else unichr(i) for i in range(256)),
+        u'αβγδεабвг中文',
+        abraxas.charsets.DIGITS + u'•‣',
+    ]
+    separators = [' ', '', '-', '_', '.', ',', '\t', '  ', u'\xb7', u' — ']
+    versions = ['', '1', '2', '10', 'v3', '2014-01', u'\xe9']
+    questions = [
+        "What is your mother's maiden name?",
+        "Where were you born?",
+        "Name of your first pet?",
+        u'\xbfD\xf3nde naciste?',
+    ]
+
+    def common(kind, index):
+        fields = {
+            'type': kind,
+            'master': choose_text(rand, text_pools, 24),
+            'id': choose_text(rand, text_pools, 12),
+        }
+        if index % 3:
+            fields['version'] = versions[index % len(versions)]
+        if rand.random() < 0.2:
+            fields['prefix'] = choose_text(rand, text_pools, 6)
+        if rand.random() < 0.2:
+            fields['suffix'] = choose_text(rand, text_pools, 6)
+        return fields
+
+    vectors = []
+    for index in range(NUM_VECTORS['chars']):
+        fields = common('chars', index)
+        # every length from 0 to beyond the size of the digest, or the default
+        num = index % 72
+        if num < 70:
+            fields['num'] = num
+        alphabet = index % (len(alphabets) + 1)
+        if alphabet < len(alphabets):
+            fields['alphabet'] = alphabet
+        vectors.append(fields)
+    for index in range(NUM_VECTORS['words']):
+        fields = common('words', index)
+        # every number of words from 0 to beyond what the digest supports
+        num = index % 37
+        if num < 36:
+            fields['num'] = num
+        separator = index % (len(separators) + 1)
+        if separator < len(separators):
+            fields['separator'] = separators[separator]
+        vectors.append(fields)
+    for index in range(NUM_VECTORS['answer']):
+        fields = common('answer', index)
+        fields['salt'] = rand.choice(questions + [
+            choose_text(rand, text_pools, 30)])
+        if index % 2:
+            fields['num'] = index % 9
+        vectors.append(fields)
+
+    for fields in vectors:
+        fields['secret'] = generate_secret(Vector(fields, alphabets))
+    corpus = {
+        'dictionary': dictionary.hash,
+        'alphabets': alphabets,
+        'charsets': dict(
+            (name, getattr(abraxas.charsets, name)) for name in CHARSETS),
+        'vectors': vectors,
+    }
+    with gzip.open(VECTORS_FILENAME, 'wb') as f:
+        f.write(json.dumps(
+            corpus, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+    print('%s: %d vectors written.' % (VECTORS_FILENAME, len(vectors)))
+
+if clp.get_arg('generate'):
+    generate_vectors()
+
+# Run tests {{{1
+with gzip.open(VECTORS_FILENAME, 'rb') as f:
+    corpus = json.loads(f.read().decode('utf-8'))
+
+testsRun = 0
+failures = 0
+skipped = 0
+
+def report(name, result, expected):
+    global failures
+    failures += 1
+    print(fail('Unexpected result (%s):' % failures))
+    print(info('    Case    :'), name)
+    print(info('    Result  :'), result)
+    print(info('    Expected:'), expected)
+
+def is_ascii(text):
+    return all(ord(char) < 128 for char in text)
+
+alphabets = corpus['alphabets']
+if str is bytes:
+    # under python2 secrets are built from str, so only the vectors that are
+    # entirely ASCII are checked
+    alphabets = [
+        str(alphabet) if is_ascii(alphabet) else None
+        for alphabet in alphabets]
+
+testsRun += 1
+if corpus['dictionary'] != dictionary.hash:
+    report('dictionary', dictionary.hash, corpus['dictionary'])
+for name, chars in sorted(corpus['charsets'].items()):
+    testsRun += 1
+    if getattr(abraxas.charsets, name, None) != chars:
+        report('charset %s' % name, getattr(abraxas.charsets, name, None), chars)
+
+for index, fields in enumerate(corpus['vectors']):
+    if str is bytes:
+        texts = [value for value in fields.values() if type(value) != int]
+        if (
+            not all(is_ascii(text) for text in texts) or
+            alphabets[fields.get('alphabet', 0)] is None
+        ):
+            skipped += 1
+            continue
+        fields = dict(
+            (str(key), value if type(value) == int else str(value))
+            for key, value in fields.items())
+    testsRun += 1
+    expected = fields.pop('secret')
+    if printTests:
+        print(status('Trying %d (%s):' % (testsRun, index)), fields)
+    try:
+        result = generate_secret(Vector(fields, alphabets))
+    except Exception as err:
+        result = '%s: %s' % (err.__class__.__name__, err)
+    if result != expected:
+        report('vector %d: %s' % (index, json.dumps(fields)), result, expected)
+
+# Print test summary {{{1
+if printSummary:
+    print('%s: %s tests run, %s failures detected%s.' % (
+        fail('FAIL') if failures else succeed('PASS'), testsRun, failures,
+        ', %s skipped' % skipped if skipped else ''
+    ))
+
+writeSummary(testsRun, failures)
+sys.exit(int(bool(failures)))
+
+# vim: set sw=4 sts=4 et: